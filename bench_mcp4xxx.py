@@ -0,0 +1,239 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * Benchmarks the driver's hot paths against simulated devices.
+ *
+ * Usage: python bench_mcp4xxx.py [iterations] [--baseline results.json] [--tolerance 0.2] [--output results.json]
+ *
+ * Results are written as JSON, one record per device configuration and operation:
+ *
+ *   ops_per_sec        - operations per second, CPU cost of the driver and simulator
+ *   bytes_per_op       - bytes clocked on the bus per operation
+ *   selects_per_op     - chip selects per operation
+ *   transfers_per_op   - write_readinto() calls per operation
+ *   bus_us_per_op      - simulated bus time per operation at the simulated baud rate
+ *   alloc_bytes        - bytes allocated by the driver per operation on MicroPython, peak bytes
+ *                        allocated by the operation on CPython. Measured on a bus that does
+ *                        nothing, so the simulator's own allocations are excluded. 0 means the
+ *                        operation does not allocate.
+ *
+ * With a baseline, the results are compared against it and any regression is reported, with
+ * a non-zero exit status. ops_per_sec regresses if it drops by more than the tolerance, the
+ * other measures if they increase at all.
+"""
+import gc
+import json
+import sys
+
+from mcp4xxx import COMMAND_WRITE
+from mcp4xxx import MCP42XX
+from mcp4xxx import MCP4XXX
+from mcp4xxx import Resolution
+from mcp4xxx import ticks_diff
+from mcp4xxx import ticks_us
+from mcp4xxx import WiperConfiguration
+from mcp4xxx_sim import SimulatedDevice
+from mcp4xxx_sim import SimulatedSPI
+
+BAUDRATE = 250_000
+
+CONFIGS = (
+    ("7bit-rheostat", Resolution.RES_7BIT, WiperConfiguration.RHEOSTAT),
+    ("7bit-potentiometer", Resolution.RES_7BIT, WiperConfiguration.POTENTIOMETER),
+    ("8bit-rheostat", Resolution.RES_8BIT, WiperConfiguration.RHEOSTAT),
+    ("8bit-potentiometer", Resolution.RES_8BIT, WiperConfiguration.POTENTIOMETER),
+)
+
+
+class NullSPI:
+    """
+    SPI bus that clocks nothing, reading back what was written with bit 0 LOW, so every command
+    is accepted and reads stay in range, for measuring the driver on its own.
+    """
+
+    def write_readinto(self, write_buf, read_buf):
+        i = 0
+        n = len(write_buf)
+        while i < n:
+            read_buf[i] = write_buf[i] & 0xFE
+            i += 1
+
+
+class NullPin:
+    """
+    Chip-select pin that drives nothing.
+    """
+
+    def __call__(self, value: int = None):
+        return 1
+
+
+def operations(pot: MCP4XXX, device: MCP42XX) -> list:
+    """
+    The benchmarked operations, as (name, callable) pairs.
+    """
+    buf = bytearray(2)
+    batch = device.batch()
+    batch.set(10)
+    batch.set(20, pot=1)
+    batch.get()
+    batch.get(pot=1)
+    return [
+        ("set", lambda: pot.set(100)),
+        ("get", lambda: pot.get()),
+        ("increment", lambda: pot.increment()),
+        ("decrement", lambda: pot.decrement()),
+        ("set_terminal_a_status", lambda: pot.set_terminal_a_status(True)),
+        ("get_terminal_a_status", lambda: pot.get_terminal_a_status()),
+        ("set_terminal_b_status", lambda: pot.set_terminal_b_status(True)),
+        ("get_terminal_b_status", lambda: pot.get_terminal_b_status()),
+        ("set_wiper_status", lambda: pot.set_wiper_status(True)),
+        ("get_wiper_status", lambda: pot.get_wiper_status()),
+        ("set_shutdown_status", lambda: pot.set_shutdown_status(False)),
+        ("get_shutdown_status", lambda: pot.get_shutdown_status()),
+        ("get_hardware_shutdown_status", lambda: pot.get_hardware_shutdown_status()),
+        ("build_command", lambda: pot._build_command(buf, 0, 0, COMMAND_WRITE, 100)),
+        ("step_10", lambda: pot.step(10 if pot.get() < 100 else -10)),
+        ("set_both", lambda: device.set_both(10, 20)),
+        ("get_both", lambda: device.get_both()),
+        ("batch_4", lambda: batch.execute()),
+    ]
+
+
+def _peak_allocation(fn, count: int) -> int:
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        for _ in range(count):
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - start
+
+
+def allocation(fn, count: int) -> float:
+    """
+    Measure the heap allocated by fn, see alloc_bytes.
+    """
+    fn()
+    if hasattr(gc, "mem_alloc"):
+        gc.collect()
+        gc.disable()
+        try:
+            before = gc.mem_alloc()
+            for _ in range(count):
+                fn()
+            return (gc.mem_alloc() - before) / count
+        finally:
+            gc.enable()
+    return _peak_allocation(fn, count) - _peak_allocation(lambda: None, count)
+
+
+def measure(spi: SimulatedSPI, fn, null_fn, iterations: int) -> dict:
+    """
+    Measure an operation.
+    :param spi: simulated bus the operation runs on
+    :param fn: operation on the simulated bus
+    :param null_fn: the same operation on a NullSPI, for measuring allocation
+    :param iterations: number of times to run the operation
+    """
+    fn()
+    spi.reset_stats()
+    start = ticks_us()
+    for _ in range(iterations):
+        fn()
+    elapsed = ticks_diff(ticks_us(), start)
+    return {
+        "ops_per_sec": round(iterations * 1_000_000 / elapsed, 1) if elapsed > 0 else 0.0,
+        "bytes_per_op": spi.bytes / iterations,
+        "selects_per_op": spi.selects / iterations,
+        "transfers_per_op": spi.transfers / iterations,
+        "bus_us_per_op": round(spi.bus_time_us / iterations, 3),
+        "alloc_bytes": allocation(null_fn, min(iterations, 100)),
+    }
+
+
+def run(iterations: int = 1000) -> list:
+    """
+    Benchmark every operation in every device configuration.
+    :param iterations: number of times each operation is run
+    :return: one result record per configuration and operation
+    """
+    results = []
+    for name, resolution, config in CONFIGS:
+        spi = SimulatedSPI(baudrate=BAUDRATE)
+        pot = MCP4XXX(spi=spi, select_pin=spi.attach(SimulatedDevice(1, resolution, config)),
+                      resolution=resolution, config=config)
+        device = MCP42XX(spi=spi, select_pin=spi.attach(SimulatedDevice(2, resolution, config)),
+                         resolution=resolution, config=config, tcon_cache=None)
+        null_spi = NullSPI()
+        null_ops = operations(MCP4XXX(null_spi, NullPin(), resolution=resolution, config=config),
+                              MCP42XX(null_spi, NullPin(), resolution, config, tcon_cache=None))
+        for (op, fn), (_, null_fn) in zip(operations(pot, device), null_ops):
+            record = {"config": name, "op": op}
+            record.update(measure(spi, fn, null_fn, iterations))
+            results.append(record)
+    return results
+
+
+def compare(baseline: list, results: list, tolerance: float = 0.2) -> list:
+    """
+    Compare results against a baseline.
+    :param baseline: results of an earlier run
+    :param results: results of this run
+    :param tolerance: fraction ops_per_sec may drop by before it is a regression
+    :return: description of each regression
+    """
+    previous = {(record["config"], record["op"]): record for record in baseline}
+    regressions = []
+    for record in results:
+        before = previous.get((record["config"], record["op"]))
+        if before is None:
+            continue
+        name = f"{record['config']} {record['op']}"
+        if record["ops_per_sec"] < before["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: ops_per_sec {before['ops_per_sec']} -> {record['ops_per_sec']}")
+        for key in ("bytes_per_op", "selects_per_op", "transfers_per_op", "bus_us_per_op", "alloc_bytes"):
+            if record[key] > before[key]:
+                regressions.append(f"{name}: {key} {before[key]} -> {record[key]}")
+    return regressions
+
+
+def main(argv: list) -> int:
+    iterations = 1000
+    baseline = None
+    tolerance = 0.2
+    output = None
+    args = iter(argv)
+    for arg in args:
+        if arg == "--baseline":
+            baseline = next(args)
+        elif arg == "--tolerance":
+            tolerance = float(next(args))
+        elif arg == "--output":
+            output = next(args)
+        else:
+            iterations = int(arg)
+
+    results = run(iterations)
+    text = json.dumps(results)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(json.load(f), results, tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -10,92 +10,547 @@
  *
  * Please see README.md for more information.
 """
-from machine import Pin
-from machine import SPI
+try:
+    from micropython import const
+except ImportError:
+    def const(value: int) -> int:
+        return value
 
+try:
+    import _thread
+except ImportError:
+    _thread = None
 
-def tobinarystr(b: bytearray) -> str:
-    """ Pretty print a byte array as binary bytes separated by a space"""
-    print(b)
-    s = ""
-    for i in range(len(b)):
-        if len(s) > 0:
-            s = s + " "
-        s = s + f"{b[i]:08b}"
-    return s
+try:
+    from collections import namedtuple
+except ImportError:
+    from ucollections import namedtuple
 
+try:
+    from time import sleep_us
+    from time import ticks_diff
+    from time import ticks_us
+except ImportError:
+    import time
 
-def enum(**enums):
-    return type('Enum', (), enums)
+    def ticks_us() -> int:
+        return int(time.perf_counter() * 1_000_000)
 
+    def ticks_diff(ticks1: int, ticks2: int) -> int:
+        return ticks1 - ticks2
 
-# Which pot to use for dual devices (MCP42XX).
-Pot = enum(POT_0=0b00, POT_1=0b01)
+    def sleep_us(us: int):
+        time.sleep(us / 1_000_000)
 
-# The resolution of the device's resistor ladder.
-Resolution = enum(RES_7BIT=127, RES_8BIT=255)
 
-# Whether the device is a rheostat (MCP4XX2), or potentiometer (MCP4XX1).
-WiperConfiguration = enum(RHEOSTAT=0, POTENTIOMETER=1)
+class Pot:
+    """ Which pot to use for dual (MCP42XX) and quad (MCP43XX) devices. """
+    POT_0 = const(0b00)
+    POT_1 = const(0b01)
+    POT_2 = const(0b10)
+    POT_3 = const(0b11)
 
-ADDRESS_MASK = 0b11110000
-COMMAND_MASK = 0b00001100
-CMDERR_MASK = 0b00000010
-DATA_MASK = 0b00000001
-DATA_MASK_WORD = 0x01FF
 
-TCON_SHUTDOWN_MASK = 0b1000
-TCON_TERM_A_MASK = 0b0100
-TCON_TERM_B_MASK = 0b0001
-TCON_WIPER_MASK = 0b0010
+class Resolution:
+    """ The resolution of the device's resistor ladder. """
+    RES_7BIT = const(127)
+    RES_8BIT = const(255)
 
-STATUS_SHUTDOWN_MASK = 0b10
 
-ADDRESS_POT0_WIPER = 0b0000
-ADDRESS_POT1_WIPER = 0b0001
-ADDRESS_TCON = 0b0100
-ADDRESS_STATUS = 0b0101
+class WiperConfiguration:
+    """ Whether the device is a rheostat (MCP4XX2), or potentiometer (MCP4XX1). """
+    RHEOSTAT = const(0)
+    POTENTIOMETER = const(1)
 
-COMMAND_WRITE = 0b00
-COMMAND_READ = 0b11
-COMMAND_INCREMENT = 0b01
-COMMAND_DECREMENT = 0b10
+
+class ErrorPolicy:
+    """ What the driver does when the device rejects a command, see CommandError. """
+    RAISE = const(0)
+    RETRY = const(1)
+    COUNT = const(2)
+    IGNORE = const(3)
+
+
+ADDRESS_MASK = const(0b11110000)
+COMMAND_MASK = const(0b00001100)
+CMDERR_MASK = const(0b00000010)
+DATA_MASK = const(0b00000001)
+DATA_MASK_WORD = const(0x01FF)
+
+TCON_SHUTDOWN_MASK = const(0b1000)
+TCON_TERM_A_MASK = const(0b0100)
+TCON_TERM_B_MASK = const(0b0001)
+TCON_WIPER_MASK = const(0b0010)
+
+STATUS_SHUTDOWN_MASK = const(0b10)
+# EEWA, set while an EEPROM write cycle is in progress (MCP4X4X and MCP4X6X).
+STATUS_EEPROM_WRITE_MASK = const(0b10000)
+
+ADDRESS_POT0_WIPER = const(0b0000)
+ADDRESS_POT1_WIPER = const(0b0001)
+ADDRESS_TCON = const(0b0100)
+ADDRESS_STATUS = const(0b0101)
+
+# Registers of pots 2 and 3 of the quad devices (MCP43XX and MCP44XX).
+ADDRESS_POT2_WIPER = const(0b0110)
+ADDRESS_POT3_WIPER = const(0b0111)
+ADDRESS_TCON1 = const(0b1010)
+
+# Non-volatile memory of the EEPROM devices (MCP4X4X and MCP4X6X).
+ADDRESS_POT0_NV_WIPER = const(0b0010)
+ADDRESS_POT1_NV_WIPER = const(0b0011)
+ADDRESS_POT2_NV_WIPER = const(0b1000)
+ADDRESS_POT3_NV_WIPER = const(0b1001)
+# First of the EEPROM_SIZE general purpose EEPROM locations.
+ADDRESS_EEPROM = const(0b0110)
+EEPROM_SIZE = const(10)
+# The quad devices have fewer, after TCON1.
+ADDRESS_QUAD_EEPROM = const(0b1011)
+QUAD_EEPROM_SIZE = const(5)
+
+# Maximum duration of an EEPROM write cycle.
+EEPROM_WRITE_US = const(10_000)
+
+COMMAND_WRITE = const(0b00)
+COMMAND_READ = const(0b11)
+COMMAND_INCREMENT = const(0b01)
+COMMAND_DECREMENT = const(0b10)
+
+# Register addresses of each pot, indexed by Pot. Pots 0 and 1 share TCON, pots 2 and 3 share
+# TCON1, with the odd pot in the high nibble.
+WIPER_ADDRESSES = (ADDRESS_POT0_WIPER, ADDRESS_POT1_WIPER, ADDRESS_POT2_WIPER, ADDRESS_POT3_WIPER)
+NV_WIPER_ADDRESSES = (ADDRESS_POT0_NV_WIPER, ADDRESS_POT1_NV_WIPER, ADDRESS_POT2_NV_WIPER, ADDRESS_POT3_NV_WIPER)
+TCON_ADDRESSES = (ADDRESS_TCON, ADDRESS_TCON, ADDRESS_TCON1, ADDRESS_TCON1)
+
+# Volatile state of a device, see MCP4XXX.snapshot(). wipers holds the wiper position of each pot,
+# tcons the value of each TCON register (TCON, then TCON1 for quad devices) and status the STATUS register.
+DeviceState = namedtuple("DeviceState", ("wipers", "tcons", "status"))
+
+
+# Wiper write frame tables built by wiper_frames(), keyed by address and maximum value.
+_frame_tables = {}
+
+
+def wiper_frames(address: int, max_value: int) -> bytearray:
+    """
+    Get the encoded 16-bit write commands for every wiper position of a wiper address.
+
+    The frame for position n is at offset 2 * n. Tables are built on first use and shared
+    by all devices with the same address and maximum value.
+
+    :param address: wiper address, one of WIPER_ADDRESSES
+    :param max_value: maximum wiper position
+    :return: table of 2 * (max_value + 1) bytes
+    """
+    key = (address << 9) | max_value
+    table = _frame_tables.get(key)
+    if table is None:
+        table = bytearray(2 * (max_value + 1))
+        cmd = ((address << 4) & ADDRESS_MASK) | ((COMMAND_WRITE << 2) & COMMAND_MASK) | CMDERR_MASK
+        for value in range(max_value + 1):
+            table[2 * value] = cmd | (value >> 8)
+            table[2 * value + 1] = value & 0xFF
+        _frame_tables[key] = table
+    return table
+
+
+class BusLock:
+    """
+    Re-entrant lock serialising threads using an SPI bus, shared by all devices on the bus.
+
+    A device given a lock holds it for every frame, and across the read-modify-write of TCON.
+    Contention statistics show how long threads wait for the bus and hold it:
+
+    acquisitions    - number of times the lock was taken, not counting re-entry
+    contended       - number of acquisitions that had to wait for another thread
+    wait_us         - total time spent waiting for the lock
+    max_wait_us     - longest wait for the lock
+    hold_us         - total time the lock was held
+    max_hold_us     - longest time the lock was held
+    """
+
+    __slots__ = ("_lock", "_owner", "_count", "_acquired", "acquisitions", "contended", "wait_us", "max_wait_us",
+                 "hold_us", "max_hold_us")
+
+    def __init__(self):
+        if _thread is None:
+            raise RuntimeError("BusLock requires _thread")
+        self._lock = _thread.allocate_lock()
+        self._owner = None
+        self._count: int = 0
+        self._acquired: int = 0
+        self.reset_stats()
+
+    def __repr__(self):
+        return f"BusLock(acquisitions={self.acquisitions}, contended={self.contended}, " + \
+               f"wait_us={self.wait_us}, max_wait_us={self.max_wait_us}, " + \
+               f"hold_us={self.hold_us}, max_hold_us={self.max_hold_us})"
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def reset_stats(self):
+        """
+        Zero the contention statistics.
+        """
+        self.acquisitions: int = 0
+        self.contended: int = 0
+        self.wait_us: int = 0
+        self.max_wait_us: int = 0
+        self.hold_us: int = 0
+        self.max_hold_us: int = 0
+
+    def acquire(self):
+        """
+        Take the lock, waiting for any other thread holding it.
+        """
+        me = _thread.get_ident()
+        if self._owner == me:
+            self._count += 1
+            return
+        if not self._lock.acquire(0):
+            start = ticks_us()
+            self._lock.acquire()
+            wait = ticks_diff(ticks_us(), start)
+            self.contended += 1
+            self.wait_us += wait
+            if wait > self.max_wait_us:
+                self.max_wait_us = wait
+        self._owner = me
+        self._count = 1
+        self._acquired = ticks_us()
+        self.acquisitions += 1
+
+    def release(self):
+        """
+        Release the lock, once released as many times as it was taken.
+        """
+        self._count -= 1
+        if self._count == 0:
+            hold = ticks_diff(ticks_us(), self._acquired)
+            self.hold_us += hold
+            if hold > self.max_hold_us:
+                self.max_hold_us = hold
+            self._owner = None
+            self._lock.release()
+
+
+# BusLocks by SPI bus, see bus_lock().
+_bus_locks = {}
+
+
+def bus_lock(spi) -> BusLock:
+    """
+    Get the lock that serialises threads using an SPI bus, shared by all devices on the bus.
+    :param spi: SPI interface
+    :return: lock for the bus
+    """
+    entry = _bus_locks.get(id(spi))
+    if entry is None or entry[0] is not spi:
+        entry = (spi, BusLock())
+        _bus_locks[id(spi)] = entry
+    return entry[1]
+
+
+# The hardware SPI bus of devices created without one, see _default_spi().
+_spi = None
+
+
+def _default_spi():
+    """
+    Get the hardware SPI bus shared by devices created without one, initialised on first use.
+    """
+    global _spi
+    if _spi is None:
+        from machine import SPI
+        _spi = SPI(0)
+        _spi.init(baudrate=250_000)
+    return _spi
+
+
+class Transaction:
+    """
+    Context manager holding a device's bus lock, if any, and chip select for the whole block.
+    See MCP4XXX.transaction().
+    """
+
+    __slots__ = ("device",)
+
+    def __init__(self, device):
+        self.device = device
+
+    def __enter__(self):
+        self.device._select()
+        return self.device
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.device._deselect()
+
+
+class ChipSelect:
+    """
+    The chip-select line of a device, shared by all pots of the device.
+
+    Selection nests, the line is only driven LOW by the outermost select() and HIGH again by
+    the matching deselect(), so several commands can be sent in one chip-select frame.
+    """
+
+    __slots__ = ("pin", "nesting")
+
+    def __init__(self, pin):
+        """
+        :param pin: pin number, or an output Pin-like callable, None for a bus without chip select, e.g. I2C
+        """
+        if isinstance(pin, int):
+            # Configured at once rather than on first use, as an unconfigured line may float LOW
+            # and select the device during the frames of other devices on the bus.
+            from machine import Pin
+            pin = Pin(pin, mode=Pin.OUT, value=1)
+        self.pin = pin
+        self.nesting: int = 0
+
+    def __repr__(self):
+        return f"ChipSelect(pin={self.pin}, nesting={self.nesting})"
+
+    def select(self):
+        """
+        Drive the chip-select line LOW, unless already selected.
+        """
+        self.nesting += 1
+        if self.nesting == 1 and self.pin is not None:
+            self.pin(0)
+
+    def deselect(self):
+        """
+        Drive the chip-select line HIGH, if this ends the outermost selection.
+        """
+        self.nesting -= 1
+        if self.nesting == 0 and self.pin is not None:
+            self.pin(1)
+
+
+class RegisterCache:
+    """
+    Shadow copy of a device register, kept up to date by the driver.
+
+    By default the shadow copy is only used where the driver would otherwise read the register
+    before writing it. Getters still read the device and refresh the shadow copy.
+
+    A trusted cache assumes the register only ever changes through this driver. Getters are then
+    served from the shadow copy and writes that would not change the register are skipped.
+
+    The shadow copy is invalid until it is first read or written.
+    """
+
+    __slots__ = ("trusted", "value", "saved")
+
+    def __init__(self, trusted: bool = False):
+        """
+        :param trusted: True to serve reads from the cache and skip redundant writes
+        """
+        self.trusted = trusted
+        self.value = None
+        # Number of bus transactions avoided by the cache.
+        self.saved: int = 0
+
+    def __repr__(self):
+        return f"RegisterCache(value={self.value}, trusted={self.trusted}, saved={self.saved})"
+
+    def invalidate(self):
+        """
+        Discard the shadow copy, the next access reads the device.
+        """
+        self.value = None
+
+
+class CommandError(Exception):
+    """
+    A command was rejected by the device, which clocked its CMDERR bit out LOW.
+
+    The device rejects commands to invalid addresses and invalid commands for an address, e.g.
+    incrementing TCON. The rejected command and any commands after it in the same chip-select
+    frame are not executed.
+
+    address     - 4 bit address code of the rejected command
+    command     - 2 bit command code of the rejected command
+    position    - offset of the rejected command in the frame
+    index       - for a Batch, index of the rejected command in the batch, otherwise None
+    """
+
+    def __init__(self, address: int, command: int, position: int = 0):
+        super().__init__(f"command {command} to address {address:#x} rejected by device")
+        self.address = address
+        self.command = command
+        self.position = position
+        self.index = None
+
+
+def _first_rejected(tx, rx) -> int:
+    """
+    Find the first command of a frame that the device rejected.
+    :param tx: encoded commands
+    :param rx: response
+    :return: offset of the rejected command in the frame, -1 if all were accepted
+    """
+    n = len(tx)
+    pos = 0
+    while pos < n:
+        if not rx[pos] & CMDERR_MASK:
+            return pos
+        command = tx[pos] >> 2 & 0b11
+        pos += 1 if command == COMMAND_INCREMENT or command == COMMAND_DECREMENT else 2
+    return -1
+
+
+def _pack_wiper(tx, pos: int, pot, value: int) -> int:
+    """
+    Encode a wiper write into a frame, unless a trusted wiper cache shows the wiper is already there.
+    Used by the writers of several wipers in one frame, which then call _record_wiper() for each.
+    :param tx: frame being built
+    :param pos: offset of the write in the frame
+    :param pot: MCP4XXX whose wiper is written
+    :param value: The new wiper position, limited to between 0 and max_value().
+    :return: number of bytes encoded, 0 if the write is skipped
+    """
+    value = max(0, min(value, pot.max_value()))
+    cache = pot.wiper_cache
+    if cache is not None and cache.trusted and cache.value == value:
+        cache.saved += 1
+        return 0
+    frames = pot._frames
+    tx[pos] = frames[2 * value]
+    tx[pos + 1] = frames[2 * value + 1]
+    return 2
+
+
+def _record_wiper(pot, value: int, ok: bool):
+    """
+    Update the wiper cache of a pot after sending a frame built with _pack_wiper().
+    :param pot: MCP4XXX whose wiper was written
+    :param value: the position written, limited as by _pack_wiper()
+    :param ok: True if the device accepted the frame, else the cache is invalidated
+    """
+    cache = pot.wiper_cache
+    if cache is not None:
+        cache.value = max(0, min(value, pot.max_value())) if ok else None
 
 
 class MCP4XXX:
 
     SS = 17
 
+    # Bus cost of a chip-select frame, in byte times, over and above the bytes it carries.
+    # Used by step() to choose between streaming 8-bit steps and a 16-bit write.
+    FRAME_COST = 4
+
+    __slots__ = ("_spi", "m_pot", "resolution", "config", "m_select", "tcon_cache", "wiper_cache", "_wiper_address",
+                 "_tcon_address", "_tcon_shift", "_eeprom_address", "_eeprom_size", "_tx", "_rx", "_tx_byte",
+                 "_rx_byte", "_frames", "_step_tx", "_step_rx", "_lock", "error_policy", "retries", "command_errors",
+                 "monitor")
+
     """
-    pot         - For the 2-pot variants (MCP42XX), the potentiometer to control. Must be pot_0 for MCP41XX chips.
+    pot         - For the 2-pot (MCP42XX) and 4-pot (MCP43XX) variants, the potentiometer to control.
+                  Must be pot_0 for MCP41XX chips.
     resolution  - res_7bit for MCP4X3X and MCP4X4X, res_8bit for MCP4X5X and MCP4X6X.
+    error_policy    - what to do when the device rejects a command, see ErrorPolicy:
+                      RAISE raises CommandError, RETRY resends the rejected and following commands of
+                      the frame up to retries times before raising, COUNT returns False (or None for
+                      reads) and IGNORE does not check the response, e.g. if SDO is not connected.
+    retries         - number of times a rejected command is resent with the RETRY policy
+    command_errors  - number of commands rejected by the device
+    monitor     - instrumentation called around every chip-select frame, None by default. Any object with
+                  selected(device), called when the chip-select line is driven LOW, and before(device, tx)
+                  and after(device, tx, rx, elapsed_us, error) methods, called around each transfer,
+                  e.g. a mcp4xxx_metrics.TransferMetrics.
     """
 
     def __init__(self, spi=None, select_pin=SS, pot=Pot.POT_0, resolution=Resolution.RES_8BIT,
-                 config=WiperConfiguration.POTENTIOMETER):
+                 config=WiperConfiguration.POTENTIOMETER, tcon_cache=None, wiper_cache=None, lock=None,
+                 error_policy=ErrorPolicy.RAISE):
         """
-        :param spi: SPI interface, machine.SPI hardware spi by default
-        :param pot: For the 2-pot variants (MCP42XX), the potentiometer to control. Must be pot_0 for MCP41XX chips.
+        :param spi: SPI interface, by default the machine.SPI hardware spi shared by all devices created
+                    without one, initialised on first use. Any transport with the write_readinto() method
+                    of machine.SPI can be used, e.g. mcp4xxx_i2c.I2CTransport.
+        :param select_pin: chip-select pin number, or a ChipSelect shared with the device's other pots
+        :param pot: For the 2-pot (MCP42XX) and 4-pot (MCP43XX) variants, the potentiometer to control.
+                    Must be pot_0 for MCP41XX chips.
         :param resolution: res_7bit for MCP4X3X and MCP4X4X, res_8bit for MCP4X5X and MCP4X6X.
         :param config: POTENTIOMETER or REOSTAT
+        :param tcon_cache: RegisterCache shadowing the pot's TCON register, True to create one, None for no cache.
+                           Both pots of an MCP42XX share the TCON register, so must share the cache.
+        :param wiper_cache: RegisterCache shadowing the wiper position, True to create a trusted one,
+                            None for no cache.
+        :param lock: BusLock held while using the bus, True for the bus_lock() shared by all devices
+                     on the spi bus, None to not lock for use by a single thread.
+        :param error_policy: what to do when the device rejects a command, see ErrorPolicy
         """
-        self.spi = spi
+        self._spi = spi
         self.m_pot = pot
         self.resolution = resolution
         self.config = config
-        self.m_select_pin = Pin(select_pin, mode=Pin.OUT, value=1)
-        self.m_select_nesting: int = 0
+        self.m_select = select_pin if isinstance(select_pin, ChipSelect) else ChipSelect(select_pin)
+        self.tcon_cache = RegisterCache() if tcon_cache is True else tcon_cache
+        self.wiper_cache = RegisterCache(trusted=True) if wiper_cache is True else wiper_cache
+        self._wiper_address = WIPER_ADDRESSES[pot]
+        self._tcon_address = TCON_ADDRESSES[pot]
+        # The values of pots 1 and 3 are 4 bits higher in their TCON register.
+        self._tcon_shift = 4 if pot & 1 else 0
+        # General purpose EEPROM, moved by MCP43XX for the quad devices.
+        self._eeprom_address = ADDRESS_EEPROM
+        self._eeprom_size = EEPROM_SIZE
 
-        bits = 7 if self.resolution == Resolution.RES_7BIT else 8
-
-        # If spi not already initialised then use default hardware SPI
-        if not self.spi:
-            self.spi = SPI(0)
-            self.spi.init(baudrate=250_000)
+        # Command and response buffers are allocated once and reused by every transfer so that
+        # steady state set()/get() loops do not churn the heap. The one byte views are used for
+        # the 8-bit increment and decrement commands.
+        self._tx = bytearray(2)
+        self._rx = bytearray(2)
+        self._tx_byte = memoryview(self._tx)[:1]
+        self._rx_byte = memoryview(self._rx)[:1]
+        # Encoded write commands for every wiper position, shared with other devices.
+        self._frames = wiper_frames(WIPER_ADDRESSES[pot], self.max_value())
+        # Views of a frame of repeated increment or decrement commands and its response, used by
+        # step() and ramp_to(), allocated on first use and refilled when the direction changes.
+        self._step_tx = None
+        self._step_rx = None
+        self._lock = lock
+        self.error_policy = error_policy
+        self.retries: int = 2
+        self.command_errors: int = 0
+        self.monitor = None
 
     def __repr__(self):
         return f"MCP4XXX(pot={self.m_pot}, resolution={self.resolution}, " + \
-               f"wiper={'POTENTIOMETER' if self.config else 'RHEOSTAT'}, spi={self.spi}"
+               f"wiper={'POTENTIOMETER' if self.config else 'RHEOSTAT'}, spi={self._spi}"
+
+    @property
+    def spi(self):
+        """
+        The SPI interface, the default hardware spi is initialised on first use.
+        """
+        if self._spi is None:
+            self._spi = _default_spi()
+        return self._spi
+
+    @spi.setter
+    def spi(self, spi):
+        self._spi = spi
+
+    @property
+    def lock(self):
+        """
+        The BusLock held while using the bus, the bus_lock() of the spi bus is looked up on first use.
+        """
+        if self._lock is True:
+            self._lock = bus_lock(self.spi)
+        return self._lock
+
+    @lock.setter
+    def lock(self, lock):
+        self._lock = lock
 
     def max_value(self):
         """
@@ -116,37 +571,125 @@ def max_value(self):
     def increment(self):
         """
         Increase the wiper position by 1.
+        With a trusted wiper cache nothing is sent if the wiper is already at max_value().
         :return: True on success; otherwise, False.
         """
-        address = ADDRESS_POT0_WIPER if self.m_pot == Pot.POT_0 else ADDRESS_POT1_WIPER
-        self._transfer(address, COMMAND_INCREMENT)
+        cache = self.wiper_cache
+        if cache is not None and cache.trusted and cache.value is not None and cache.value >= self.max_value():
+            cache.saved += 1
+            return True
+        if not self._send(self._wiper_address, COMMAND_INCREMENT):
+            return False
+        if cache is not None and cache.value is not None:
+            cache.value = min(cache.value + 1, self.max_value())
+        return True
 
     def decrement(self):
         """
         Decrease the wiper position by 1.
+        With a trusted wiper cache nothing is sent if the wiper is already at 0.
         :return: True on success; otherwise, False.
         """
-        address = ADDRESS_POT0_WIPER if self.m_pot == Pot.POT_0 else ADDRESS_POT1_WIPER
-        self._transfer(address, COMMAND_DECREMENT)
+        cache = self.wiper_cache
+        if cache is not None and cache.trusted and cache.value == 0:
+            cache.saved += 1
+            return True
+        if not self._send(self._wiper_address, COMMAND_DECREMENT):
+            return False
+        if cache is not None and cache.value is not None:
+            cache.value = max(cache.value - 1, 0)
+        return True
 
     def set(self, value: int):
         """
         Set the wiper position.
+        With a trusted wiper cache nothing is sent if the wiper is already at the position.
         :param value: The new wiper position (must be between 0 and max_value()).
-        :exception: exception on failure to set wiper position
+        :return: True on success; otherwise, False.
+        :exception: CommandError on failure to set wiper position, see ErrorPolicy
         """
-        address = ADDRESS_POT0_WIPER if self.m_pot == Pot.POT_0 else ADDRESS_POT1_WIPER
-        self._transfer(address, COMMAND_WRITE, min(value, self.max_value()))
+        value = max(0, min(value, self.max_value()))
+        cache = self.wiper_cache
+        if cache is not None and cache.trusted and cache.value == value:
+            cache.saved += 1
+            return True
+        frames = self._frames
+        self._tx[0] = frames[2 * value]
+        self._tx[1] = frames[2 * value + 1]
+        if not self._transfer_frame(self._tx, self._rx):
+            return False
+        if cache is not None:
+            cache.value = value
+        return True
 
     def get(self) -> int:
         """
-        Get the wiper position.
-        :returns: current wiper position
-        :exception: exception on failure to get wiper position
+        Get the wiper position, from the wiper cache if it is trusted.
+        :returns: current wiper position, None if the read was rejected
+        :exception: CommandError on failure to get wiper position, see ErrorPolicy
         """
-        address = ADDRESS_POT0_WIPER if self.m_pot == Pot.POT_0 else ADDRESS_POT1_WIPER
-        resp = self._transfer(address, COMMAND_READ, DATA_MASK_WORD)
-        return resp[1] | (resp[0] & 0b00000001) << 8
+        cache = self.wiper_cache
+        if cache is not None and cache.trusted and cache.value is not None:
+            cache.saved += 1
+            return cache.value
+        resp = self._transfer(self._wiper_address, COMMAND_READ, DATA_MASK_WORD)
+        if resp is None:
+            return None
+        value = resp[1] | (resp[0] & 0b00000001) << 8
+        if cache is not None:
+            cache.value = value
+        return value
+
+    def step(self, n: int, steps_per_frame: int = None):
+        """
+        Move the wiper by n steps, up if n is positive, down if negative.
+
+        The wiper is moved with a stream of 8-bit increment or decrement commands, steps_per_frame
+        commands per chip-select frame. If the wiper position is cached and a single 16-bit write
+        costs less bus time, the wiper is written directly instead, see FRAME_COST.
+
+        :param n: number of steps to move the wiper
+        :param steps_per_frame: maximum number of steps per frame, all steps in one frame by default
+        :return: True on success; otherwise, False.
+        """
+        cache = self.wiper_cache
+        if cache is not None and cache.value is not None:
+            target = max(0, min(cache.value + n, self.max_value()))
+            n = target - cache.value
+            if n == 0:
+                return True
+            if self._step_cost(abs(n), steps_per_frame) > 2 + self.FRAME_COST:
+                return self.set(target)
+        if n > 0:
+            return self._stream_steps(COMMAND_INCREMENT, n, steps_per_frame)
+        if n < 0:
+            return self._stream_steps(COMMAND_DECREMENT, -n, steps_per_frame)
+        return True
+
+    def ramp_to(self, target: int, steps_per_frame: int = None):
+        """
+        Ramp the wiper to a position, passing through every position in between.
+
+        Unlike set() the transition is monotonic and glitch free. The ramp is sent as a stream of
+        8-bit increment or decrement commands, steps_per_frame commands per chip-select frame.
+
+        :param target: The new wiper position (must be between 0 and max_value()).
+        :param steps_per_frame: maximum number of steps per frame, all steps in one frame by default
+        :return: True on success; otherwise, False.
+        """
+        target = max(0, min(target, self.max_value()))
+        cache = self.wiper_cache
+        if cache is not None and cache.value is not None:
+            position = cache.value
+        else:
+            position = self.get()
+            if position is None:
+                return False
+        if target > position:
+            return self._stream_steps(COMMAND_INCREMENT, target - position, steps_per_frame)
+        if target < position:
+            return self._stream_steps(COMMAND_DECREMENT, position - target, steps_per_frame)
+        return True
 
     def set_terminal_a_status(self, connected: bool):
         """
@@ -157,7 +700,7 @@ def set_terminal_a_status(self, connected: bool):
         :param connected: True to connect, False to disconnect
         :return: True on success, otherwise False
         """
-        self._set_tcon_bit(TCON_TERM_A_MASK, connected)
+        return self._set_tcon_bit(TCON_TERM_A_MASK, connected)
 
     def get_terminal_a_status(self) -> bool:
         """
@@ -176,7 +719,7 @@ def set_terminal_b_status(self, connected: bool):
         :param connected: True to connect, False to disconnect
         :return: True on success, otherwise False
         """
-        self._set_tcon_bit(TCON_TERM_B_MASK, connected)
+        return self._set_tcon_bit(TCON_TERM_B_MASK, connected)
 
     def get_terminal_b_status(self) -> bool:
         """
@@ -191,9 +734,10 @@ def set_wiper_status(self, connected: bool):
         Set the status of the wiper.
 
         :param connected: True to connect, False to disconnect
-        :exception: exception on failure
+        :return: True on success, otherwise False
+        :exception: CommandError on failure, see ErrorPolicy
         """
-        self._set_tcon_bit(TCON_WIPER_MASK, connected)
+        return self._set_tcon_bit(TCON_WIPER_MASK, connected)
 
     def get_wiper_status(self) -> bool:
         """
@@ -208,9 +752,10 @@ def set_shutdown_status(self, shutdown: bool):
         """
         Set the software shutdown status.
         :param shutdown: True to shutdown, False to enable
-        :exception: failed to perform command
+        :return: True on success, otherwise False
+        :exception: CommandError on failure, see ErrorPolicy
         """
-        self._set_tcon_bit(TCON_SHUTDOWN_MASK, not shutdown)
+        return self._set_tcon_bit(TCON_SHUTDOWN_MASK, not shutdown)
 
     def get_shutdown_status(self) -> bool:
         """
@@ -219,125 +764,1188 @@ def get_shutdown_status(self) -> bool:
         this method will still return the software setting. To get the hardware status use
         get_hardware_shutdown_status().
 
-        :return: device software shutdown state
-        :exception: command not successful
+        :return: device software shutdown state, False if the read was rejected
+        :exception: CommandError if command not successful, see ErrorPolicy
         """
-        return not bool(self._get_tcon_bit(TCON_SHUTDOWN_MASK))
+        enabled = self._get_tcon_bit(TCON_SHUTDOWN_MASK)
+        return enabled is not None and not enabled
 
     def get_hardware_shutdown_status(self) -> bool:
         """
         Get the status of the hardware shutdown bin, if present.
 
-        :return: True if shutdown, False if enabled
-        :exception: command not successful
+        :return: True if shutdown, False if enabled or the read was rejected
+        :exception: CommandError if command not successful, see ErrorPolicy
         """
-        return bool(self._transfer(ADDRESS_STATUS,
-                                   COMMAND_READ, DATA_MASK_WORD)[1] & STATUS_SHUTDOWN_MASK)
+        resp = self._transfer(ADDRESS_STATUS, COMMAND_READ, DATA_MASK_WORD)
+        return resp is not None and bool(resp[1] & STATUS_SHUTDOWN_MASK)
+
+    def set_nv(self, value: int) -> bool:
+        """
+        Set the non-volatile wiper position, loaded into the wiper at power on (EEPROM devices only).
+
+        The wiper itself is not moved. The write starts an EEPROM write cycle and returns without
+        waiting for it to complete, see eeprom_busy() and wait_eeprom(). The device rejects
+        non-volatile commands until the write cycle completes.
+
+        :param value: The new non-volatile wiper position (must be between 0 and max_value()).
+        :return: True on success; otherwise, False.
+        """
+        value = max(0, min(value, self.max_value()))
+        return self._send(NV_WIPER_ADDRESSES[self.m_pot], COMMAND_WRITE, value)
+
+    def get_nv(self) -> int:
+        """
+        Get the non-volatile wiper position (EEPROM devices only).
+        :return: non-volatile wiper position, None if the read was rejected
+        """
+        resp = self._transfer(NV_WIPER_ADDRESSES[self.m_pot], COMMAND_READ, DATA_MASK_WORD)
+        return resp[1] | (resp[0] & 0b00000001) << 8 if resp is not None else None
+
+    def write_eeprom(self, index: int, value: int) -> bool:
+        """
+        Write a general purpose EEPROM location (EEPROM devices only).
+
+        Like set_nv() this starts an EEPROM write cycle and returns without waiting for it.
+
+        :param index: location, 0 to EEPROM_SIZE - 1, or QUAD_EEPROM_SIZE - 1 for the quad devices
+        :param value: 9-bit value to store
+        :return: True on success; otherwise, False.
+        """
+        if not 0 <= index < self._eeprom_size:
+            raise ValueError(f"EEPROM index {index} out of range")
+        return self._send(self._eeprom_address + index, COMMAND_WRITE, value & DATA_MASK_WORD)
+
+    def read_eeprom(self, index: int) -> int:
+        """
+        Read a general purpose EEPROM location (EEPROM devices only).
+        :param index: location, 0 to EEPROM_SIZE - 1, or QUAD_EEPROM_SIZE - 1 for the quad devices
+        :return: 9-bit value stored, None if the read was rejected
+        """
+        if not 0 <= index < self._eeprom_size:
+            raise ValueError(f"EEPROM index {index} out of range")
+        resp = self._transfer(self._eeprom_address + index, COMMAND_READ, DATA_MASK_WORD)
+        return resp[1] | (resp[0] & 0b00000001) << 8 if resp is not None else None
+
+    def eeprom_busy(self) -> bool:
+        """
+        Whether an EEPROM write cycle is in progress, from the EEWA bit of the STATUS register.
+        :return: True if writing, or if the STATUS read was rejected
+        """
+        resp = self._transfer(ADDRESS_STATUS, COMMAND_READ, DATA_MASK_WORD)
+        return resp is None or bool(resp[1] & STATUS_EEPROM_WRITE_MASK)
+
+    def wait_eeprom(self, timeout_us: int = EEPROM_WRITE_US, poll_us: int = 500) -> bool:
+        """
+        Wait for an EEPROM write cycle to complete, polling the STATUS register.
+
+        This blocks the caller, see mcp4xxx_eeprom.EEPROMScheduler to write without blocking.
+
+        :param timeout_us: maximum time to wait
+        :param poll_us: time between polls
+        :return: True if complete, False if still writing after timeout_us
+        """
+        start = ticks_us()
+        while self.eeprom_busy():
+            if ticks_diff(ticks_us(), start) >= timeout_us:
+                return False
+            sleep_us(poll_us)
+        return True
+
+    def snapshot(self) -> DeviceState:
+        """
+        Read the volatile state of the pot, its wiper, TCON register and STATUS, in one chip-select frame.
+        The caches are updated from the values read.
+        :return: immutable state, see DeviceState, None if a read was rejected
+        """
+        return _snapshot(self, (self,))
+
+    def restore(self, state: DeviceState, current: DeviceState = None) -> bool:
+        """
+        Write back a state taken by snapshot() in one chip-select frame, see _restore().
+        :param state: state to restore
+        :param current: state of the device, registers already holding their value are not written
+        :return: True on success; otherwise, False.
+        """
+        return _restore(self, (self,), state, current)
+
+    def refresh_cache(self):
+        """
+        Read the cached registers from the device into their caches.
+        """
+        if self.tcon_cache is not None:
+            resp = self._transfer(self._tcon_address, COMMAND_READ, DATA_MASK_WORD)
+            self.tcon_cache.value = resp[1] if resp is not None else None
+        if self.wiper_cache is not None:
+            resp = self._transfer(self._wiper_address, COMMAND_READ, DATA_MASK_WORD)
+            self.wiper_cache.value = resp[1] | (resp[0] & 0b00000001) << 8 if resp is not None else None
+
+    def invalidate_cache(self):
+        """
+        Discard the cached registers, so they are read from the device on next use.
+        Use after the device may have changed outside of this driver, e.g. after a power cycle.
+        """
+        if self.tcon_cache is not None:
+            self.tcon_cache.invalidate()
+        if self.wiper_cache is not None:
+            self.wiper_cache.invalidate()
+
+    def batch(self, size: int = 16) -> "Batch":
+        """
+        Create a batch of commands that are sent to this device in a single chip-select frame.
+        :param size: initial size of the command buffer in bytes, the buffer grows as required
+        :return: empty batch
+        """
+        return Batch(self, size)
+
+    def transaction(self) -> Transaction:
+        """
+        Hold the bus lock, if any, and chip select for a block of commands, so that no other thread
+        can use the bus and the commands are sent in one chip-select frame:
+
+            with pot.transaction():
+                if pot.get() < 100:
+                    pot.set(100)
+
+        :return: context manager
+        """
+        return Transaction(self)
 
     def _select(self):
         """
         Select this device for SPI communication
-        Configures SPI for communication with MCP devices, and sends slave-select pin LOW.
+        Takes the bus lock, if any, and sends slave-select pin LOW.
         """
-        self.m_select_nesting += 1
-        if self.m_select_nesting == 1:
-            self.m_select_pin(0)
+        lock = self.lock
+        if lock is not None:
+            lock.acquire()
+        if self.monitor is not None and self.m_select.nesting == 0:
+            self.monitor.selected(self)
+        self.m_select.select()
 
     def _deselect(self):
         """
         Cease SPI communications with this device.
-        Sends the slave-select pin HIGH.
-        """
-        self.m_select_nesting -= 1
-        if self.m_select_nesting == 0:
-            self.m_select_pin(1)
-
-    def _build_command(self, address, command, data: int = None) -> bytearray:
-        """
-        Build an 8-bit command
-        :param address:
-        :param command:
-        :return:
-        """
-        cmd = bytearray(1)
-        cmd[0] = (((address << 4) & ADDRESS_MASK) | ((command << 2) & COMMAND_MASK) | CMDERR_MASK)
-        if data is not None:
-            cmd.append((data & DATA_MASK_WORD) & 0xFF)
-            # Handle the case where the data is 256 (full scale) or 0x1FF (DATA_MASK_WORD) - 9th bit is set
-            if data == 0x0100 or data == 0x01FF:
-                cmd[0] = cmd[0] | 0b00000001
-        return cmd
-
-    def _transfer(self, address, command, data: int = None) -> bytes:
-        f"""
-        Transfer a command, and read the response.
+        Sends the slave-select pin HIGH, and releases the bus lock, if any.
+        """
+        self.m_select.deselect()
+        lock = self.lock
+        if lock is not None:
+            lock.release()
 
-        :param address: 4 bit address code from ADDRESS_TCON, ADDRESS_MASK, ADDRESS_STATUS,
-                        ADDRESS_POT0_WIPER, ADDRESS_POT1_WIPER
+    def _build_command(self, buf, pos: int, address, command, data: int = None) -> int:
+        """
+        Encode a command into a buffer.
+        :param buf: buffer to encode the command into
+        :param pos: offset into buf of the first command byte
+        :param address: 4 bit address code
+        :param command: 2 bit command code
+        :param data: data for 16-bit commands, None for 8-bit commands
+        :return: number of bytes written
+        """
+        cmd = (((address << 4) & ADDRESS_MASK) | ((command << 2) & COMMAND_MASK) | CMDERR_MASK)
+        if data is None:
+            buf[pos] = cmd
+            return 1
+        # The 9th bit of the data is carried in the command byte.
+        buf[pos] = cmd | ((data >> 8) & DATA_MASK)
+        buf[pos + 1] = data & 0xFF
+        return 2
+
+    def _send(self, address, command, data: int = None) -> bool:
+        """
+        Send a command in its own frame.
+
+        The command is encoded into a preallocated buffer, so no memory is allocated.
+
+        :param address: 4 bit address code, e.g. ADDRESS_TCON, ADDRESS_STATUS or ADDRESS_POT0_WIPER
         :param command: 2 bit command code from COMMAND_WRITE, COMMAND_READ,
                         COMMAND_INCREMENT, COMMAND_DECREMENT
         :param data: data for command
-        :return: bytearray response
+        :return: True if the device accepted the command, see _transfer_frame()
         """
-        cmd = self._build_command(address, command, data)
-        rx_data = bytearray(len(cmd))
+        if self._build_command(self._tx, 0, address, command, data) == 1:
+            return self._transfer_frame(self._tx_byte, self._rx_byte)
+        return self._transfer_frame(self._tx, self._rx)
+
+    def _transfer(self, address, command, data: int = None) -> bytearray:
+        """
+        Transfer a command, and read the response.
+
+        The returned response buffer is reused by the next transfer, so callers must
+        decode it before issuing another command.
+
+        :param address: 4 bit address code, see _send()
+        :param command: 2 bit command code, see _send()
+        :param data: data for command
+        :return: bytearray response, None if the device rejected the command
+        """
+        return self._rx if self._send(address, command, data) else None
+
+    def _transfer_frame(self, tx, rx) -> bool:
+        """
+        Clock a frame of one or more encoded commands out to the device under a single chip select,
+        and check the CMDERR bit of each command in the response, see error_policy.
+
+        :param tx: encoded commands
+        :param rx: buffer of the same length as tx that receives the response
+        :return: True if the device accepted every command, False if it rejected one with the
+                 COUNT policy
+        :exception: CommandError if the device rejected a command with the RAISE or RETRY policy
+        """
+        self._send_frame(tx, rx)
+        if self.error_policy == ErrorPolicy.IGNORE:
+            return True
+        pos = _first_rejected(tx, rx)
+        return pos < 0 or self._rejected(tx, rx, pos)
+
+    def _rejected(self, tx, rx, pos: int) -> bool:
+        """
+        Handle a command rejected by the device according to the error policy.
+        :param tx: encoded commands
+        :param rx: response
+        :param pos: offset of the rejected command in the frame
+        :return: True if the command was accepted on a retry, False with the COUNT policy
+        """
+        self.command_errors += 1
+        if self.error_policy == ErrorPolicy.RETRY:
+            tx = memoryview(tx)
+            rx = memoryview(rx)
+            for _ in range(self.retries):
+                if self.m_select.nesting and self.m_select.pin is not None:
+                    # The device ignores commands after an error until deselected, so end its frame
+                    # within the enclosing selection.
+                    self.m_select.pin(1)
+                    self.m_select.pin(0)
+                self._send_frame(tx[pos:], rx[pos:])
+                retry = _first_rejected(tx[pos:], rx[pos:])
+                if retry < 0:
+                    return True
+                pos += retry
+                self.command_errors += 1
+        elif self.error_policy == ErrorPolicy.COUNT:
+            return False
+        raise CommandError(tx[pos] >> 4, tx[pos] >> 2 & 0b11, pos)
+
+    def _send_frame(self, tx, rx):
+        """
+        Clock a frame out to the device without checking the response.
+        """
+        if self.monitor is not None:
+            self._monitored_transfer_frame(tx, rx)
+            return
+        spi = self._spi if self._spi is not None else self.spi
         try:
             self._select()
-            self.spi.write_readinto(cmd, rx_data)
+            spi.write_readinto(tx, rx)
         finally:
             self._deselect()
-        return rx_data
+
+    def _monitored_transfer_frame(self, tx, rx):
+        """
+        Transfer a frame, calling the monitor before and after. The elapsed time includes
+        waiting for the bus lock.
+        """
+        monitor = self.monitor
+        monitor.before(self, tx)
+        spi = self._spi if self._spi is not None else self.spi
+        start = ticks_us()
+        error = None
+        try:
+            self._select()
+            spi.write_readinto(tx, rx)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._deselect()
+            monitor.after(self, tx, rx, ticks_diff(ticks_us(), start), error)
+
+    def _step_cost(self, count: int, steps_per_frame: int = None) -> int:
+        """
+        Bus cost, in byte times, of streaming count 8-bit steps.
+        """
+        frames = 1 if not steps_per_frame else (count + steps_per_frame - 1) // steps_per_frame
+        return count + frames * self.FRAME_COST
+
+    def _stream_steps(self, command, count: int, steps_per_frame: int = None):
+        """
+        Send count increment or decrement commands, steps_per_frame commands per frame.
+        :param command: COMMAND_INCREMENT or COMMAND_DECREMENT
+        :param count: number of commands to send
+        :param steps_per_frame: maximum number of commands per frame, all in one frame if None
+        :return: True on success, False if a step was rejected with the COUNT policy
+        """
+        size = min(count, steps_per_frame) if steps_per_frame else count
+        self._build_command(self._tx, 0, self._wiper_address, command)
+        step = self._tx[0]
+        tx = self._step_tx
+        if tx is None or len(tx) < size:
+            tx = self._step_tx = memoryview(bytearray(size))
+            self._step_rx = memoryview(bytearray(size))
+        rx = self._step_rx
+        # A new frame is zeroed, never a command as those have the CMDERR bit set, so it is filled
+        # here too. The frame is refilled in place when the direction changes, not reallocated.
+        if tx[0] != step:
+            i = 0
+            while i < len(tx):
+                tx[i] = step
+                i += 1
+        remaining = count
+        while remaining > 0:
+            n = min(remaining, size)
+            if n < len(tx):
+                ok = self._transfer_frame(tx[:n], rx[:n])
+            else:
+                ok = self._transfer_frame(tx, rx)
+            if not ok:
+                if self.wiper_cache is not None:
+                    self.wiper_cache.invalidate()
+                return False
+            remaining -= n
+
+        cache = self.wiper_cache
+        if cache is not None and cache.value is not None:
+            if command == COMMAND_INCREMENT:
+                cache.value = min(cache.value + count, self.max_value())
+            else:
+                cache.value = max(cache.value - count, 0)
+        return True
 
     def _set_tcon(self, value: int):
         """
-        Set the value of the TCON register.
+        Set the value of the TCON register of this pot, TCON1 for pots 2 and 3.
         :param value: single byte value of TCON register
+        :return: True on success, otherwise False
         """
         # Note that the 9th (reserved) bit is always set to 1.
-        self._transfer(ADDRESS_TCON, COMMAND_WRITE, 0x100 | value)
+        if not self._send(self._tcon_address, COMMAND_WRITE, 0x100 | value):
+            return False
+        if self.tcon_cache is not None:
+            self.tcon_cache.value = value & 0xFF
+        return True
 
     def _set_tcon_bit(self, mask: int, value: bool):
         """
         Set the value of a bit within the TCON register.
 
+        With a valid TCON cache only the write is sent, otherwise the register is read first.
+
         :param mask: One of the TCON bit masks.
         :param value: The value of the TCON bit for the given mask.
-        :exception: if failed
+        :return: True on success, otherwise False
+        :exception: CommandError if failed, see ErrorPolicy
         """
         try:
             self._select()
-
-            # The values for pot #1 are 4 bits higher in the TCON register.
-            if self.m_pot == Pot.POT_1:
-                mask <<= 4
-
-            tcon = self._get_tcon()
-            if value:
-                self._set_tcon(tcon | mask)
+            mask <<= self._tcon_shift
+            cache = self.tcon_cache
+            if cache is not None and cache.value is not None:
+                cache.saved += 1
+                tcon = cache.value
             else:
-                self._set_tcon(tcon & (~mask & 0xFF))
+                tcon = self._get_tcon()
+                if tcon is None:
+                    return False
+            updated = tcon | mask if value else tcon & (~mask & 0xFF)
+            if cache is not None and cache.trusted and updated == tcon:
+                cache.saved += 1
+                return True
+            return self._set_tcon(updated)
         finally:
             self._deselect()
 
     def _get_tcon(self) -> int:
         """
-        Get the value of the TCON register
-        :return: value of the TCON register
-        :exception: on failure
+        Get the value of the TCON register of this pot, from the cache if it is trusted.
+        :return: value of the TCON register, None if the read was rejected
+        :exception: CommandError on failure, see ErrorPolicy
         """
-        return self._transfer(ADDRESS_TCON, COMMAND_READ, DATA_MASK_WORD)[1]
+        cache = self.tcon_cache
+        if cache is not None and cache.trusted and cache.value is not None:
+            cache.saved += 1
+            return cache.value
+        resp = self._transfer(self._tcon_address, COMMAND_READ, DATA_MASK_WORD)
+        if resp is None:
+            return None
+        if cache is not None:
+            cache.value = resp[1]
+        return resp[1]
 
     def _get_tcon_bit(self, mask: int) -> bool:
         """
         Get the value of the TCON register bit
 
         :param mask: One of the TCON bit masks.
-        :return: Assigned the value of the TCON bit for the given mask.
-        :exception: on failure
+        :return: Assigned the value of the TCON bit for the given mask, None if the read was rejected.
+        :exception: CommandError on failure, see ErrorPolicy
         """
         tcon = self._get_tcon()
-        # The values for pot #1 are 4 bits higher in the TCON register.
-        if self.m_pot == Pot.POT_1:
-            mask <<= 4
+        if tcon is None:
+            return None
+        return tcon & mask << self._tcon_shift
+
+
+class MCP42XX:
+    """
+    A dual pot device (MCP42XX), owning the chip-select line and bus shared by both pots.
+
+    pot0 and pot1 are MCP4XXX instances for the two pots. They share the chip-select line, so
+    their commands can be combined in one frame, and a TCON cache, so TCON is read and written
+    once for both pots. set_both() and get_both() update or read both wipers in a single frame.
+    """
+
+    def __init__(self, spi=None, select_pin=MCP4XXX.SS, resolution=Resolution.RES_8BIT,
+                 config=WiperConfiguration.POTENTIOMETER, tcon_cache=True, wiper_cache=None, lock=None,
+                 error_policy=ErrorPolicy.RAISE):
+        """
+        :param spi: SPI interface, the shared machine.SPI hardware spi by default, see MCP4XXX
+        :param select_pin: chip-select pin number
+        :param resolution: res_7bit for MCP4X3X and MCP4X4X, res_8bit for MCP4X5X and MCP4X6X.
+        :param config: POTENTIOMETER or REOSTAT
+        :param tcon_cache: RegisterCache shadowing the TCON register, True to create one, None for no cache.
+        :param wiper_cache: True to give each pot a trusted wiper cache, None for no cache.
+        :param lock: BusLock held while using the bus, True for the bus_lock() shared by all devices
+                     on the spi bus, None to not lock for use by a single thread.
+        :param error_policy: what to do when the device rejects a command, see ErrorPolicy.
+                             Rejections by set_both() and get_both() are counted by pot0.
+        """
+        self.select = ChipSelect(select_pin)
+        self.tcon_cache = RegisterCache() if tcon_cache is True else tcon_cache
+        self.pot0 = MCP4XXX(spi, self.select, Pot.POT_0, resolution, config, self.tcon_cache, wiper_cache, lock,
+                            error_policy)
+        self.pot1 = MCP4XXX(spi, self.select, Pot.POT_1, resolution, config, self.tcon_cache,
+                            wiper_cache, self.pot0._lock, error_policy)
+        self.pots = (self.pot0, self.pot1)
+        self._tx = bytearray(4)
+        self._rx = bytearray(4)
+        self._tx_both = memoryview(self._tx)
+        self._rx_both = memoryview(self._rx)
+
+    def __repr__(self):
+        return f"MCP42XX(resolution={self.pot0.resolution}, " + \
+               f"wiper={'POTENTIOMETER' if self.pot0.config else 'RHEOSTAT'}, spi={self.pot0._spi}"
+
+    @property
+    def spi(self):
+        return self.pot0.spi
+
+    @property
+    def monitor(self):
+        """
+        Instrumentation called around every chip-select frame sent to either pot, see MCP4XXX.
+        """
+        return self.pot0.monitor
+
+    @monitor.setter
+    def monitor(self, monitor):
+        self.pot0.monitor = monitor
+        self.pot1.monitor = monitor
+
+    def max_value(self):
+        """
+        Retrieve the maximum value allowed for the wiper positions, see MCP4XXX.max_value().
+        """
+        return self.pot0.max_value()
+
+    def set_both(self, value0: int, value1: int):
+        """
+        Set both wiper positions in a single chip-select frame, so the outputs change together.
+        With trusted wiper caches a wiper already at its position is not written.
+        :param value0: The new pot 0 wiper position (must be between 0 and max_value()).
+        :param value1: The new pot 1 wiper position (must be between 0 and max_value()).
+        :return: True on success; otherwise, False.
+        """
+        n = _pack_wiper(self._tx, 0, self.pot0, value0)
+        n += _pack_wiper(self._tx, n, self.pot1, value1)
+        ok = True
+        if n == 4:
+            ok = self.pot0._transfer_frame(self._tx_both, self._rx_both)
+        elif n == 2:
+            ok = self.pot0._transfer_frame(self._tx_both[:2], self._rx_both[:2])
+        _record_wiper(self.pot0, value0, ok)
+        _record_wiper(self.pot1, value1, ok)
+        return ok
+
+    def get_both(self) -> tuple:
+        """
+        Get both wiper positions, read in a single chip-select frame.
+        Wipers with trusted caches are served from the cache.
+        :return: pot 0 and pot 1 wiper positions, None if the read was rejected
+        """
+        cache0 = self.pot0.wiper_cache
+        cache1 = self.pot1.wiper_cache
+        if cache0 is None or not cache0.trusted or cache0.value is None or \
+                cache1 is None or not cache1.trusted or cache1.value is None:
+            tx = self._tx
+            self.pot0._build_command(tx, 0, ADDRESS_POT0_WIPER, COMMAND_READ, DATA_MASK_WORD)
+            self.pot0._build_command(tx, 2, ADDRESS_POT1_WIPER, COMMAND_READ, DATA_MASK_WORD)
+            if not self.pot0._transfer_frame(self._tx_both, self._rx_both):
+                return None
+            rx = self._rx
+            value0 = rx[1] | (rx[0] & 0b00000001) << 8
+            value1 = rx[3] | (rx[2] & 0b00000001) << 8
+            if cache0 is not None:
+                cache0.value = value0
+            if cache1 is not None:
+                cache1.value = value1
+            return value0, value1
+        cache0.saved += 1
+        cache1.saved += 1
+        return cache0.value, cache1.value
+
+    def get_tcon(self) -> int:
+        """
+        Get the TCON register holding the terminal, wiper and shutdown status of both pots.
+        The low nibble is for pot 0, the high nibble for pot 1, see the TCON_*_MASK constants.
+        :return: value of the TCON register
+        """
+        return self.pot0._get_tcon()
+
+    def set_tcon(self, value: int):
+        """
+        Set the terminal, wiper and shutdown status of both pots with a single TCON write.
+        :param value: single byte value of TCON register
+        :return: True on success; otherwise, False.
+        """
+        return self.pot0._set_tcon(value)
+
+    def write_eeprom(self, index: int, value: int) -> bool:
+        """
+        Write a general purpose EEPROM location, see MCP4XXX.write_eeprom().
+        """
+        return self.pot0.write_eeprom(index, value)
+
+    def read_eeprom(self, index: int) -> int:
+        """
+        Read a general purpose EEPROM location, see MCP4XXX.read_eeprom().
+        """
+        return self.pot0.read_eeprom(index)
+
+    def eeprom_busy(self) -> bool:
+        """
+        Whether an EEPROM write cycle is in progress, see MCP4XXX.eeprom_busy().
+        """
+        return self.pot0.eeprom_busy()
+
+    def wait_eeprom(self, timeout_us: int = EEPROM_WRITE_US, poll_us: int = 500) -> bool:
+        """
+        Wait for an EEPROM write cycle to complete, see MCP4XXX.wait_eeprom().
+        """
+        return self.pot0.wait_eeprom(timeout_us, poll_us)
+
+    def snapshot(self) -> DeviceState:
+        """
+        Read the volatile state of the device, the wipers of all pots, the TCON registers and STATUS,
+        in one chip-select frame, see MCP4XXX.snapshot().
+        """
+        return _snapshot(self.pot0, self.pots)
+
+    def restore(self, state: DeviceState, current: DeviceState = None) -> bool:
+        """
+        Write back a state taken by snapshot() in one chip-select frame, see MCP4XXX.restore().
+        """
+        return _restore(self.pot0, self.pots, state, current)
+
+    def refresh_cache(self):
+        """
+        Read the cached registers of both pots from the device into their caches.
+        """
+        self.pot0.refresh_cache()
+        if self.pot1.wiper_cache is not None:
+            self.pot1.wiper_cache.invalidate()
+            self.pot1.get()
+
+    def invalidate_cache(self):
+        """
+        Discard the cached registers of both pots, so they are read from the device on next use.
+        """
+        self.pot0.invalidate_cache()
+        self.pot1.invalidate_cache()
+
+    def transaction(self) -> Transaction:
+        """
+        Hold the bus lock, if any, and chip select for a block of commands to either pot,
+        see MCP4XXX.transaction().
+        """
+        return Transaction(self.pot0)
+
+    def batch(self, size: int = 16) -> "Batch":
+        """
+        Create a batch of commands for either pot, sent in a single chip-select frame.
+        Commands address pot 0 unless given a pot.
+        """
+        return Batch(self.pot0, size, self.pots)
+
+
+class MCP43XX(MCP42XX):
+    """
+    A quad pot device (MCP43XX), owning the chip-select line and bus shared by its four pots.
+
+    pot0 to pot3 are MCP4XXX instances for the four pots, also in pots. Pots 0 and 1 share the
+    TCON register, and pots 2 and 3 the TCON1 register, each with its own cache. set_all() and
+    get_all() update or read all four wipers, and optionally both TCON registers, in a single
+    frame, so a multi-channel mixer is updated with one transaction. The MCP42XX methods address
+    pots 0 and 1, and TCON.
+    """
+
+    def __init__(self, spi=None, select_pin=MCP4XXX.SS, resolution=Resolution.RES_8BIT,
+                 config=WiperConfiguration.POTENTIOMETER, tcon_cache=True, wiper_cache=None, lock=None,
+                 error_policy=ErrorPolicy.RAISE):
+        """
+        :param tcon_cache: RegisterCache shadowing the TCON register, True to create one, None for no cache.
+                           TCON1 is given a cache of its own, trusted if tcon_cache is.
+        See MCP42XX for the other parameters.
+        """
+        super().__init__(spi, select_pin, resolution, config, tcon_cache, wiper_cache, lock, error_policy)
+        self.tcon1_cache = None if self.tcon_cache is None else RegisterCache(self.tcon_cache.trusted)
+        self.pot2 = MCP4XXX(spi, self.select, Pot.POT_2, resolution, config, self.tcon1_cache,
+                            wiper_cache, self.pot0._lock, error_policy)
+        self.pot3 = MCP4XXX(spi, self.select, Pot.POT_3, resolution, config, self.tcon1_cache,
+                            wiper_cache, self.pot0._lock, error_policy)
+        self.pots = (self.pot0, self.pot1, self.pot2, self.pot3)
+        for pot in self.pots:
+            pot._eeprom_address = ADDRESS_QUAD_EEPROM
+            pot._eeprom_size = QUAD_EEPROM_SIZE
+        # Room for four wiper and two TCON commands, with a view of each even length so that
+        # frames are sent without allocating.
+        self._tx = bytearray(12)
+        self._rx = bytearray(12)
+        tx = memoryview(self._tx)
+        rx = memoryview(self._rx)
+        self._tx_both = tx[:4]
+        self._rx_both = rx[:4]
+        self._views = [(tx[:n], rx[:n]) for n in range(0, 13, 2)]
+
+    def __repr__(self):
+        return f"MCP43XX(resolution={self.pot0.resolution}, " + \
+               f"wiper={'POTENTIOMETER' if self.pot0.config else 'RHEOSTAT'}, spi={self.pot0._spi}"
+
+    @property
+    def monitor(self):
+        """
+        Instrumentation called around every chip-select frame sent to any pot, see MCP4XXX.
+        """
+        return self.pot0.monitor
+
+    @monitor.setter
+    def monitor(self, monitor):
+        for pot in self.pots:
+            pot.monitor = monitor
+
+    def set_all(self, values, tcons=None) -> bool:
+        """
+        Set all four wiper positions in a single chip-select frame, so the outputs change together,
+        optionally writing both TCON registers in the same frame.
+        With trusted caches registers already holding their new value are not written.
+        :param values: the four new wiper positions, pot 0 first (each between 0 and max_value()).
+        :param tcons: the new values of TCON and TCON1, None to leave them unchanged.
+        :return: True on success; otherwise, False.
+        """
+        tx = self._tx
+        n = 0
+        for i in range(4):
+            n += _pack_wiper(tx, n, self.pots[i], values[i])
+        if tcons is not None:
+            for i in range(2):
+                pot = self.pots[2 * i]
+                cache = pot.tcon_cache
+                if cache is not None and cache.trusted and cache.value == tcons[i] & 0xFF:
+                    cache.saved += 1
+                    continue
+                n += pot._build_command(tx, n, pot._tcon_address, COMMAND_WRITE, 0x100 | tcons[i] & 0xFF)
+        ok = True
+        if n:
+            frame = self._views[n // 2]
+            ok = self.pot0._transfer_frame(frame[0], frame[1])
+        for i in range(4):
+            _record_wiper(self.pots[i], values[i], ok)
+        if tcons is not None:
+            for i in range(2):
+                cache = self.pots[2 * i].tcon_cache
+                if cache is not None:
+                    cache.value = tcons[i] & 0xFF if ok else None
+        return ok
+
+    def get_all(self, tcons: bool = False) -> tuple:
+        """
+        Get all four wiper positions, and optionally both TCON registers, read in a single
+        chip-select frame. Registers with trusted caches are served from the cache.
+        :param tcons: True to also read TCON and TCON1
+        :return: pot 0 to pot 3 wiper positions, followed by TCON and TCON1 if tcons,
+                 None if the read was rejected
+        """
+        count = 6 if tcons else 4
+        tx = self._tx
+        n = 0
+        for i in range(count):
+            cache = self._cache(i)
+            if cache is None or not cache.trusted or cache.value is None:
+                n += self.pot0._build_command(tx, n, self._address(i), COMMAND_READ, DATA_MASK_WORD)
+        if n:
+            frame = self._views[n // 2]
+            if not self.pot0._transfer_frame(frame[0], frame[1]):
+                return None
+        rx = self._rx
+        values = []
+        pos = 0
+        for i in range(count):
+            cache = self._cache(i)
+            if cache is None or not cache.trusted or cache.value is None:
+                value = rx[pos + 1] | (rx[pos] & 0b00000001) << 8 if i < 4 else rx[pos + 1]
+                pos += 2
+                if cache is not None:
+                    cache.value = value
+            else:
+                cache.saved += 1
+                value = cache.value
+            values.append(value)
+        return tuple(values)
+
+    def get_tcons(self) -> tuple:
+        """
+        Get the TCON and TCON1 registers, read in a single chip-select frame.
+        The low nibble of TCON is for pot 0 and the high nibble for pot 1, TCON1 likewise holds
+        pots 2 and 3, see the TCON_*_MASK constants.
+        :return: values of TCON and TCON1, None if the read was rejected
+        """
+        values = self.get_all(True)
+        return None if values is None else values[4:]
+
+    def set_tcons(self, tcon0: int, tcon1: int) -> bool:
+        """
+        Set the terminal, wiper and shutdown status of all four pots with TCON and TCON1 written
+        in a single chip-select frame.
+        :param tcon0: single byte value of the TCON register
+        :param tcon1: single byte value of the TCON1 register
+        :return: True on success; otherwise, False.
+        """
+        tx = self._tx
+        n = self.pot0._build_command(tx, 0, ADDRESS_TCON, COMMAND_WRITE, 0x100 | tcon0)
+        n += self.pot0._build_command(tx, n, ADDRESS_TCON1, COMMAND_WRITE, 0x100 | tcon1)
+        ok = self.pot0._transfer_frame(self._views[2][0], self._views[2][1])
+        if self.tcon_cache is not None:
+            self.tcon_cache.value = tcon0 & 0xFF if ok else None
+        if self.tcon1_cache is not None:
+            self.tcon1_cache.value = tcon1 & 0xFF if ok else None
+        return ok
+
+    def refresh_cache(self):
+        """
+        Read the cached registers of all four pots from the device into their caches.
+        """
+        super().refresh_cache()
+        self.pot2.refresh_cache()
+        if self.pot3.wiper_cache is not None:
+            self.pot3.wiper_cache.invalidate()
+            self.pot3.get()
+
+    def invalidate_cache(self):
+        """
+        Discard the cached registers of all four pots, so they are read from the device on next use.
+        """
+        for pot in self.pots:
+            pot.invalidate_cache()
+
+    def _cache(self, i: int) -> RegisterCache:
+        """
+        Cache of the i-th register read by get_all(), the four wipers then TCON and TCON1.
+        """
+        if i < 4:
+            return self.pots[i].wiper_cache
+        return self.tcon_cache if i == 4 else self.tcon1_cache
+
+    def _address(self, i: int) -> int:
+        """
+        Address of the i-th register read by get_all().
+        """
+        return WIPER_ADDRESSES[i] if i < 4 else TCON_ADDRESSES[2 * (i - 4)]
+
+
+def _tcon_pots(pots) -> list:
+    """
+    :return: the first of the pots for each TCON register, TCON first
+    """
+    found = []
+    for pot in pots:
+        for other in found:
+            if other._tcon_address == pot._tcon_address:
+                break
+        else:
+            found.append(pot)
+    return found
+
+
+def _snapshot(device: MCP4XXX, pots) -> DeviceState:
+    """
+    Read the wipers of pots, their TCON registers and STATUS in one frame sent by device.
+    """
+    tcon_pots = _tcon_pots(pots)
+    n = 2 * (len(pots) + len(tcon_pots) + 1)
+    tx = bytearray(n)
+    rx = bytearray(n)
+    pos = 0
+    for pot in pots:
+        pos += device._build_command(tx, pos, pot._wiper_address, COMMAND_READ, DATA_MASK_WORD)
+    for pot in tcon_pots:
+        pos += device._build_command(tx, pos, pot._tcon_address, COMMAND_READ, DATA_MASK_WORD)
+    device._build_command(tx, pos, ADDRESS_STATUS, COMMAND_READ, DATA_MASK_WORD)
+    if not device._transfer_frame(tx, rx):
+        return None
+    wipers = []
+    pos = 0
+    for pot in pots:
+        value = rx[pos + 1] | (rx[pos] & 0b00000001) << 8
+        if pot.wiper_cache is not None:
+            pot.wiper_cache.value = value
+        wipers.append(value)
+        pos += 2
+    tcons = []
+    for pot in tcon_pots:
+        if pot.tcon_cache is not None:
+            pot.tcon_cache.value = rx[pos + 1]
+        tcons.append(rx[pos + 1])
+        pos += 2
+    return DeviceState(tuple(wipers), tuple(tcons), rx[pos + 1])
+
+
+def _unchanged(cache: RegisterCache, value: int, current) -> bool:
+    """
+    Whether a register is known to hold value, from the current state or a trusted cache.
+    """
+    if current is not None:
+        return current == value
+    if cache is not None and cache.trusted and cache.value == value:
+        cache.saved += 1
+        return True
+    return False
+
+
+def _restore(device: MCP4XXX, pots, state: DeviceState, current: DeviceState) -> bool:
+    """
+    Write the wipers and TCON registers of state that differ in one frame sent by device.
+
+    A register is not written if current, or else a trusted cache, shows it already holds its
+    value. STATUS is read-only so is not restored.
+    """
+    tcon_pots = _tcon_pots(pots)
+    if len(state.wipers) != len(pots) or len(state.tcons) != len(tcon_pots):
+        raise ValueError("state is of another device")
+    n = 2 * (len(pots) + len(tcon_pots))
+    tx = bytearray(n)
+    pos = 0
+    for i in range(len(pots)):
+        pot = pots[i]
+        value = state.wipers[i]
+        if not _unchanged(pot.wiper_cache, value, current.wipers[i] if current is not None else None):
+            pos += device._build_command(tx, pos, pot._wiper_address, COMMAND_WRITE, value)
+    for i in range(len(tcon_pots)):
+        pot = tcon_pots[i]
+        value = state.tcons[i]
+        if not _unchanged(pot.tcon_cache, value, current.tcons[i] if current is not None else None):
+            pos += device._build_command(tx, pos, pot._tcon_address, COMMAND_WRITE, 0x100 | value)
+    if not pos:
+        return True
+    ok = device._transfer_frame(memoryview(tx)[:pos], memoryview(bytearray(pos)))
+    for i in range(len(pots)):
+        if pots[i].wiper_cache is not None:
+            pots[i].wiper_cache.value = state.wipers[i] if ok else None
+    for i in range(len(tcon_pots)):
+        if tcon_pots[i].tcon_cache is not None:
+            tcon_pots[i].tcon_cache.value = state.tcons[i] if ok else None
+    return ok
+
+
+# How Batch decodes the response to each queued command.
+_RESULT_NONE = const(0)
+_RESULT_WORD = const(1)
+_RESULT_BYTE = const(2)
+_RESULT_BIT = const(3)
+_RESULT_NOT_BIT = const(4)
+
+
+class Batch:
+    """
+    A sequence of commands sent to a device back to back in a single chip-select frame.
+
+    Commands are queued with the methods below, which mirror the MCP4XXX API, and are encoded
+    into one contiguous buffer. execute() clocks the whole buffer out with a single
+    write_readinto() call and returns one decoded result per queued command, in order:
+    the wiper position for get(), the register value for get_tcon(), a bool for the status
+    getters and None for commands that do not read anything.
+
+    The queued commands are kept after execute(), so a batch can be sent repeatedly.
+    Used as a context manager the batch is executed on exit and the results are left in
+    the results attribute.
+
+    Methods that address a wiper take an optional pot, which defaults to the device's pot.
+    The TCON methods address the register holding the pot's status, TCON1 for pots 2 and 3.
+
+    The TCON status setters are encoded as a write of the whole TCON register, computed from
+    the register's cache if valid, otherwise from a read of the register when first queued.
+    The caches of the pots the batch was created with are kept up to date by execute().
+
+    The device's error_policy applies to the frame. A rejected command and the commands queued
+    after it are not executed, their results are None and rejected is set to the index of the
+    rejected command. With the RAISE and RETRY policies the CommandError is raised once the
+    results of the executed commands are decoded, with its index set.
+    """
+
+    def __init__(self, device: MCP4XXX, size: int = 16, pots=None):
+        """
+        :param device: device to send the commands to
+        :param size: initial size of the command buffer in bytes
+        :param pots: all the MCP4XXX pots of the device, whose caches are updated, (device,) by default
+        """
+        self.device = device
+        self.pots = pots if pots is not None else (device,)
+        self.results = None
+        self.rejected = None
+        self._tx = bytearray(max(size, 2))
+        self._rx = bytearray(len(self._tx))
+        self._pos = 0
+        self._ops = []
+        # The values of TCON and TCON1 after the queued commands, used to encode the TCON status setters.
+        self._tcon = [None, None]
+
+    def __len__(self):
+        return len(self._ops)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+
+    def clear(self):
+        """
+        Remove all queued commands.
+        """
+        self._pos = 0
+        self._ops = []
+        self._tcon = [None, None]
+        self.results = None
+        self.rejected = None
+
+    def increment(self, pot=None):
+        """
+        Queue an increase of the wiper position by 1.
+        """
+        self._queue(self._wiper_address(pot), COMMAND_INCREMENT)
+
+    def decrement(self, pot=None):
+        """
+        Queue a decrease of the wiper position by 1.
+        """
+        self._queue(self._wiper_address(pot), COMMAND_DECREMENT)
+
+    def set(self, value: int, pot=None):
+        """
+        Queue setting the wiper position.
+        :param value: The new wiper position (must be between 0 and max_value()).
+        """
+        value = max(0, min(value, self.device.max_value()))
+        if pot is None or pot == self.device.m_pot:
+            self._queue_frame(self.device._frames, value)
+        else:
+            self._queue(self._wiper_address(pot), COMMAND_WRITE, value)
+
+    def get(self, pot=None):
+        """
+        Queue reading the wiper position, the result is the wiper position.
+        """
+        self._queue(self._wiper_address(pot), COMMAND_READ, DATA_MASK_WORD, _RESULT_WORD)
+
+    def set_tcon(self, value: int, pot=None):
+        """
+        Queue writing the whole TCON register, or TCON1 for pots 2 and 3.
+        :param value: single byte value of TCON register
+        """
+        pot = self._pot(pot)
+        self._queue(TCON_ADDRESSES[pot], COMMAND_WRITE, 0x100 | value)
+        self._tcon[pot >> 1] = value & 0xFF
+
+    def get_tcon(self, pot=None):
+        """
+        Queue reading the TCON register, or TCON1 for pots 2 and 3, the result is the register value.
+        """
+        self._queue(TCON_ADDRESSES[self._pot(pot)], COMMAND_READ, DATA_MASK_WORD, _RESULT_BYTE)
+
+    def set_terminal_a_status(self, connected: bool, pot=None):
+        """
+        Queue setting the status of terminal "A".
+        :param connected: True to connect, False to disconnect
+        """
+        self._set_tcon_bit(TCON_TERM_A_MASK, connected, pot)
+
+    def get_terminal_a_status(self, pot=None):
+        """
+        Queue reading the status of terminal "A", the result is True if connected.
+        """
+        self._get_tcon_bit(TCON_TERM_A_MASK, _RESULT_BIT, pot)
+
+    def set_terminal_b_status(self, connected: bool, pot=None):
+        """
+        Queue setting the status of terminal "B".
+        :param connected: True to connect, False to disconnect
+        """
+        self._set_tcon_bit(TCON_TERM_B_MASK, connected, pot)
+
+    def get_terminal_b_status(self, pot=None):
+        """
+        Queue reading the status of terminal "B", the result is True if connected.
+        """
+        self._get_tcon_bit(TCON_TERM_B_MASK, _RESULT_BIT, pot)
+
+    def set_wiper_status(self, connected: bool, pot=None):
+        """
+        Queue setting the status of the wiper.
+        :param connected: True to connect, False to disconnect
+        """
+        self._set_tcon_bit(TCON_WIPER_MASK, connected, pot)
+
+    def get_wiper_status(self, pot=None):
+        """
+        Queue reading the status of the wiper, the result is True if connected.
+        """
+        self._get_tcon_bit(TCON_WIPER_MASK, _RESULT_BIT, pot)
+
+    def set_shutdown_status(self, shutdown: bool, pot=None):
+        """
+        Queue setting the software shutdown status.
+        :param shutdown: True to shutdown, False to enable
+        """
+        self._set_tcon_bit(TCON_SHUTDOWN_MASK, not shutdown, pot)
+
+    def get_shutdown_status(self, pot=None):
+        """
+        Queue reading the software shutdown status, the result is True if shutdown.
+        """
+        self._get_tcon_bit(TCON_SHUTDOWN_MASK, _RESULT_NOT_BIT, pot)
+
+    def get_hardware_shutdown_status(self):
+        """
+        Queue reading the status of the hardware shutdown pin, the result is True if shutdown.
+        """
+        self._queue(ADDRESS_STATUS, COMMAND_READ, DATA_MASK_WORD, _RESULT_BIT, STATUS_SHUTDOWN_MASK)
+
+    def execute(self) -> list:
+        """
+        Send all queued commands in a single chip-select frame.
+        :return: decoded result of each queued command, in the order queued
+        """
+        error = None
+        failed = -1
+        if self._pos:
+            tx = memoryview(self._tx)[:self._pos]
+            rx = memoryview(self._rx)[:self._pos]
+            try:
+                if not self.device._transfer_frame(tx, rx):
+                    failed = _first_rejected(tx, rx)
+            except CommandError as e:
+                error = e
+                failed = e.position
+        tx = self._tx
+        rx = self._rx
+        results = []
+        self.rejected = None
+        for pos, kind, arg in self._ops:
+            if 0 <= failed <= pos:
+                if self.rejected is None:
+                    self.rejected = len(results)
+                results.append(None)
+                continue
+            self._update_caches(tx, rx, pos)
+            if kind == _RESULT_NONE:
+                results.append(None)
+            elif kind == _RESULT_WORD:
+                results.append(rx[pos + 1] | (rx[pos] & 0b00000001) << 8)
+            elif kind == _RESULT_BYTE:
+                results.append(rx[pos + 1])
+            elif kind == _RESULT_BIT:
+                results.append(bool(rx[pos + 1] & arg))
+            else:
+                results.append(not (rx[pos + 1] & arg))
+        self.results = results
+        if error is not None:
+            error.index = self.rejected
+            raise error
+        return results
+
+    def _queue(self, address, command, data: int = None, kind=_RESULT_NONE, arg=0):
+        if self._pos + 2 > len(self._tx):
+            self._grow()
+        pos = self._pos
+        self._pos += self.device._build_command(self._tx, pos, address, command, data)
+        self._ops.append((pos, kind, arg))
+
+    def _update_caches(self, tx, rx, pos: int):
+        address = tx[pos] >> 4
+        for pot in self.pots:
+            if pot.tcon_cache is not None and address == pot._tcon_address:
+                pot.tcon_cache.value = (rx if tx[pos] & COMMAND_MASK == COMMAND_MASK else tx)[pos + 1]
+            elif pot.wiper_cache is not None and address == pot._wiper_address:
+                self._update_wiper_cache(pot.wiper_cache, tx, rx, pos)
+
+    def _update_wiper_cache(self, cache: RegisterCache, tx, rx, pos: int):
+        command = (tx[pos] & COMMAND_MASK) >> 2
+        if command == COMMAND_WRITE:
+            cache.value = tx[pos + 1] | (tx[pos] & 0b00000001) << 8
+        elif command == COMMAND_READ:
+            cache.value = rx[pos + 1] | (rx[pos] & 0b00000001) << 8
+        elif cache.value is not None:
+            if command == COMMAND_INCREMENT:
+                cache.value = min(cache.value + 1, self.device.max_value())
+            else:
+                cache.value = max(cache.value - 1, 0)
+
+    def _set_tcon_bit(self, mask: int, value: bool, pot):
+        pot = self._pot(pot)
+        # The values of pots 1 and 3 are 4 bits higher in their TCON register.
+        mask <<= 4 if pot & 1 else 0
+        tcon = self._tcon[pot >> 1]
+        if tcon is None:
+            tcon = self._read_tcon(pot)
+        self.set_tcon(tcon | mask if value else tcon & (~mask & 0xFF), pot)
+
+    def _read_tcon(self, pot) -> int:
+        address = TCON_ADDRESSES[pot]
+        for device in self.pots:
+            if device._tcon_address == address:
+                cache = device.tcon_cache
+                if cache is not None and cache.value is not None:
+                    cache.saved += 1
+                    return cache.value
+                tcon = device._get_tcon()
+                break
+        else:
+            resp = self.device._transfer(address, COMMAND_READ, DATA_MASK_WORD)
+            tcon = resp[1] if resp is not None else None
+        if tcon is None:
+            raise CommandError(address, COMMAND_READ)
+        return tcon
+
+    def _get_tcon_bit(self, mask: int, kind, pot):
+        pot = self._pot(pot)
+        self._queue(TCON_ADDRESSES[pot], COMMAND_READ, DATA_MASK_WORD, kind, mask << 4 if pot & 1 else mask)
+
+    def _queue_frame(self, frames, value: int):
+        if self._pos + 2 > len(self._tx):
+            self._grow()
+        pos = self._pos
+        self._tx[pos] = frames[2 * value]
+        self._tx[pos + 1] = frames[2 * value + 1]
+        self._pos += 2
+        self._ops.append((pos, _RESULT_NONE, 0))
+
+    def _grow(self):
+        grow = len(self._tx)
+        self._tx.extend(bytearray(grow))
+        self._rx.extend(bytearray(grow))
+
+    def _pot(self, pot):
+        return self.device.m_pot if pot is None else pot
 
-        return tcon & mask
+    def _wiper_address(self, pot):
+        return WIPER_ADDRESSES[self._pot(pot)]
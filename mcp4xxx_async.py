@@ -0,0 +1,217 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * asyncio (uasyncio) interface to the MCP4XXX driver.
+ *
+ * Please see README.md for more information.
+"""
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+from mcp4xxx import COMMAND_DECREMENT
+from mcp4xxx import COMMAND_INCREMENT
+
+# asyncio locks by SPI bus, see bus_lock().
+_bus_locks = {}
+
+
+def bus_lock(spi) -> asyncio.Lock:
+    """
+    Get the lock that serialises tasks using an SPI bus, shared by all devices on the bus.
+    :param spi: SPI interface
+    :return: asyncio lock for the bus
+    """
+    entry = _bus_locks.get(id(spi))
+    if entry is None or entry[0] is not spi:
+        entry = (spi, asyncio.Lock())
+        _bus_locks[id(spi)] = entry
+    return entry[1]
+
+
+class AsyncMCP4XXX:
+    """
+    Non-blocking counterpart of MCP4XXX for asyncio applications.
+
+    Each method holds the bus lock while its frames are sent, so commands from tasks sharing
+    the bus never interleave within an operation, then yields to other tasks. Long operations
+    such as ramps are sent in chunks, releasing the lock and yielding between chunks, so other
+    tasks keep a bounded latency while a pot is being driven.
+
+    Hold the lock to make a sequence of operations atomic:
+
+        async with pot.lock:
+            pot.device.set_shutdown_status(False)
+            pot.device.set(100)
+    """
+
+    def __init__(self, device, lock=None, steps_per_chunk: int = 16):
+        """
+        :param device: MCP4XXX to drive
+        :param lock: asyncio lock to hold while using the bus, the bus_lock() of the device's spi by default
+        :param steps_per_chunk: maximum number of steps sent by ramp_to() and step() before yielding
+        """
+        self.device = device
+        self.lock = lock if lock is not None else bus_lock(device.spi)
+        self.steps_per_chunk = steps_per_chunk
+
+    def __repr__(self):
+        return f"AsyncMCP4XXX({self.device})"
+
+    def max_value(self):
+        """
+        Retrieve the maximum value allowed for the wiper position, see MCP4XXX.max_value().
+        """
+        return self.device.max_value()
+
+    async def increment(self) -> bool:
+        """
+        Increase the wiper position by 1.
+        :return: True on success; otherwise, False.
+        """
+        return await self._call(self.device.increment)
+
+    async def decrement(self) -> bool:
+        """
+        Decrease the wiper position by 1.
+        :return: True on success; otherwise, False.
+        """
+        return await self._call(self.device.decrement)
+
+    async def set(self, value: int) -> bool:
+        """
+        Set the wiper position.
+        :param value: The new wiper position (must be between 0 and max_value()).
+        :return: True on success; otherwise, False.
+        """
+        return await self._call(self.device.set, value)
+
+    async def get(self) -> int:
+        """
+        Get the wiper position.
+        :returns: current wiper position
+        """
+        return await self._call(self.device.get)
+
+    async def step(self, n: int) -> bool:
+        """
+        Move the wiper by n steps, up if n is positive, down if negative.
+        The steps are sent steps_per_chunk at a time, yielding between chunks.
+        :param n: number of steps to move the wiper
+        :return: True on success; otherwise, False.
+        """
+        while n != 0:
+            chunk = max(-self.steps_per_chunk, min(n, self.steps_per_chunk))
+            if not await self._call(self.device.step, chunk):
+                return False
+            n -= chunk
+        return True
+
+    async def ramp_to(self, target: int) -> bool:
+        """
+        Ramp the wiper to a position, passing through every position in between.
+        The steps are sent steps_per_chunk at a time, yielding between chunks.
+        :param target: The new wiper position (must be between 0 and max_value()).
+        :return: True on success; otherwise, False.
+        """
+        device = self.device
+        target = max(0, min(target, device.max_value()))
+        async with self.lock:
+            cache = device.wiper_cache
+            position = cache.value if cache is not None and cache.value is not None else device.get()
+        if position is None:
+            return False
+        command = COMMAND_INCREMENT if target > position else COMMAND_DECREMENT
+        remaining = abs(target - position)
+        while remaining > 0:
+            n = min(remaining, self.steps_per_chunk)
+            if not await self._call(device._stream_steps, command, n):
+                return False
+            remaining -= n
+        return True
+
+    async def execute(self, batch) -> list:
+        """
+        Send a batch of commands, see MCP4XXX.batch().
+        :return: decoded result of each queued command, in the order queued
+        """
+        return await self._call(batch.execute)
+
+    async def set_terminal_a_status(self, connected: bool) -> bool:
+        """
+        Set the status of terminal "A".
+        :param connected: True to connect, False to disconnect
+        :return: True on success, otherwise False
+        """
+        return await self._call(self.device.set_terminal_a_status, connected)
+
+    async def get_terminal_a_status(self) -> bool:
+        """
+        Get the status of terminal "A".
+        :return: True if connected
+        """
+        return await self._call(self.device.get_terminal_a_status)
+
+    async def set_terminal_b_status(self, connected: bool) -> bool:
+        """
+        Set the status of terminal "B".
+        :param connected: True to connect, False to disconnect
+        :return: True on success, otherwise False
+        """
+        return await self._call(self.device.set_terminal_b_status, connected)
+
+    async def get_terminal_b_status(self) -> bool:
+        """
+        Get the status of terminal "B".
+        :return: True if connected
+        """
+        return await self._call(self.device.get_terminal_b_status)
+
+    async def set_wiper_status(self, connected: bool) -> bool:
+        """
+        Set the status of the wiper.
+        :param connected: True to connect, False to disconnect
+        :return: True on success, otherwise False
+        """
+        return await self._call(self.device.set_wiper_status, connected)
+
+    async def get_wiper_status(self) -> bool:
+        """
+        Get the status of the wiper.
+        :return: True if wiper is connected otherwise false
+        """
+        return await self._call(self.device.get_wiper_status)
+
+    async def set_shutdown_status(self, shutdown: bool) -> bool:
+        """
+        Set the software shutdown status.
+        :param shutdown: True to shutdown, False to enable
+        :return: True on success, otherwise False
+        """
+        return await self._call(self.device.set_shutdown_status, shutdown)
+
+    async def get_shutdown_status(self) -> bool:
+        """
+        Get the software shutdown status.
+        :return: device software shutdown state
+        """
+        return await self._call(self.device.get_shutdown_status)
+
+    async def get_hardware_shutdown_status(self) -> bool:
+        """
+        Get the status of the hardware shutdown pin, if present.
+        :return: True if shutdown, False if enabled
+        """
+        return await self._call(self.device.get_hardware_shutdown_status)
+
+    async def _call(self, fn, *args):
+        """
+        Call fn holding the bus lock, then yield to other tasks.
+        :return: the result of fn
+        """
+        async with self.lock:
+            result = fn(*args)
+        await asyncio.sleep(0)
+        return result
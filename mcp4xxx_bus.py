@@ -0,0 +1,175 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * Manages many MCP4XXX devices sharing one SPI bus.
+ *
+ * Please see README.md for more information.
+"""
+from mcp4xxx import _default_spi
+from mcp4xxx import _pack_wiper
+from mcp4xxx import _record_wiper
+from mcp4xxx import bus_lock
+from mcp4xxx import ChipSelect
+from mcp4xxx import MCP4XXX
+from mcp4xxx import Pot
+from mcp4xxx import RegisterCache
+from mcp4xxx import Resolution
+from mcp4xxx import WiperConfiguration
+
+
+class SPIBus:
+    """
+    Owns an SPI bus shared by many MCP4XXX devices, each on its own chip-select line.
+
+    If a device rejects a frame, see MCP4XXX.error_policy, flush() raises with the RAISE and
+    RETRY policies and the staged positions are kept, so the next flush() resends those not yet
+    written. The wiper caches of the device are invalidated, whatever the policy.
+
+    Pots are registered by name with add(). Pots of a dual or quad pot device are added with the
+    same select pin, and share its chip-select line and TCON caches.
+
+    New wiper positions staged with stage() are written by flush() in one pass. Repeated
+    stages of the same pot are coalesced, the latest value wins, and all staged pots of a
+    device are written in a single chip-select frame, so each device is selected at most once
+    per flush. Pots with a trusted wiper cache are skipped if already at the staged position.
+
+    staged      - number of positions staged
+    coalesced   - number of staged positions replaced by a later stage before being flushed
+    written     - number of wiper writes sent
+    skipped     - number of staged positions not sent as the wiper was already there
+    frames      - number of chip-select frames sent by flush()
+    """
+
+    def __init__(self, spi=None, lock=None):
+        """
+        :param spi: SPI interface, by default the hardware spi shared by devices created without one,
+                    used at the clock rate it was initialised to, 250 kHz unless re-initialised
+        :param lock: BusLock shared by all pots and held by flush(), True for the bus_lock() of the spi bus,
+                     None to not lock for use by a single thread.
+        """
+        if not spi:
+            spi = _default_spi()
+        self.spi = spi
+        self.lock = bus_lock(spi) if lock is True else lock
+        self.channels = {}
+        self.staged: int = 0
+        self.coalesced: int = 0
+        self.written: int = 0
+        self.skipped: int = 0
+        self.frames: int = 0
+        self._pending = {}
+        # Registered devices in order, each a list of [chip select, (TCON cache, TCON1 cache), (name, pot)...]
+        self._devices = []
+        self._devices_by_pin = {}
+        self._tx = bytearray(4)
+        self._rx = bytearray(4)
+
+    def __repr__(self):
+        return f"SPIBus(channels={list(self.channels)}, spi={self.spi})"
+
+    def __getitem__(self, name) -> MCP4XXX:
+        return self.channels[name]
+
+    def __contains__(self, name) -> bool:
+        return name in self.channels
+
+    def add(self, name, select_pin, pot=Pot.POT_0, resolution=Resolution.RES_8BIT,
+            config=WiperConfiguration.POTENTIOMETER, wiper_cache=True) -> MCP4XXX:
+        """
+        Register a pot on the bus.
+        :param name: name of the pot, used to stage positions
+        :param select_pin: chip-select pin number of the device
+        :param pot: For the 2-pot (MCP42XX) and 4-pot (MCP43XX) variants, the potentiometer to control.
+        :param resolution: res_7bit for MCP4X3X and MCP4X4X, res_8bit for MCP4X5X and MCP4X6X.
+        :param config: POTENTIOMETER or REOSTAT
+        :param wiper_cache: RegisterCache shadowing the wiper position, True to create a trusted one,
+                            None for no cache.
+        :return: the pot
+        """
+        if name in self.channels:
+            raise ValueError(f"channel {name} already added")
+        device = self._devices_by_pin.get(select_pin)
+        if device is None:
+            device = [ChipSelect(select_pin), (RegisterCache(), RegisterCache())]
+            self._devices.append(device)
+            self._devices_by_pin[select_pin] = device
+        channel = MCP4XXX(self.spi, device[0], pot, resolution, config, device[1][pot >> 1], wiper_cache,
+                          self.lock)
+        device.append((name, channel))
+        if len(self._tx) < 2 * (len(device) - 2):
+            self._tx = bytearray(2 * (len(device) - 2))
+            self._rx = bytearray(len(self._tx))
+        self.channels[name] = channel
+        return channel
+
+    def stage(self, name, value: int):
+        """
+        Stage a new wiper position, written by the next flush().
+        :param name: name of the pot
+        :param value: The new wiper position (must be between 0 and max_value()).
+        """
+        if name not in self.channels:
+            raise KeyError(name)
+        if name in self._pending:
+            self.coalesced += 1
+        self._pending[name] = value
+        self.staged += 1
+
+    def pending(self) -> int:
+        """
+        :return: number of pots with staged positions
+        """
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Write all staged wiper positions, one chip-select frame per device.
+        :return: number of frames sent
+        """
+        if not self._pending:
+            return 0
+        if self.lock is None:
+            return self._flush()
+        with self.lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        pending = self._pending
+        frames = 0
+        tx = self._tx
+        tx_view = memoryview(self._tx)
+        rx_view = memoryview(self._rx)
+        for device in self._devices:
+            pos = 0
+            for i in range(2, len(device)):
+                name, channel = device[i]
+                if name not in pending:
+                    continue
+                n = _pack_wiper(tx, pos, channel, pending[name])
+                if not n:
+                    self.skipped += 1
+                pos += n
+            if pos:
+                try:
+                    ok = device[2][1]._transfer_frame(tx_view[:pos], rx_view[:pos])
+                except Exception:
+                    # The staged positions are kept, but which of them were written is unknown.
+                    self._update_caches(device, False)
+                    raise
+                frames += 1
+                self.written += pos // 2
+                self._update_caches(device, ok)
+        pending.clear()
+        self.frames += frames
+        return frames
+
+    def _update_caches(self, device, ok: bool):
+        """
+        Record the staged positions of a device's pots in their wiper caches if written, else invalidate them.
+        """
+        pending = self._pending
+        for i in range(2, len(device)):
+            name, channel = device[i]
+            if name in pending:
+                _record_wiper(channel, pending[name], ok)
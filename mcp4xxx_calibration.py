@@ -0,0 +1,217 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * Setting and reading MCP4XXX pots in ohms or as a divider ratio, through calibration tables.
+ *
+ * Please see README.md for more information.
+"""
+from array import array
+
+from mcp4xxx import WiperConfiguration
+
+# Typical wiper resistance of the range, see the datasheet.
+WIPER_RESISTANCE = 75
+
+
+class Calibration:
+    """
+    Table of a quantity, e.g. the resistance or the divider ratio, at every wiper position of a
+    pot, for converting between the two. The table is built once, by resistance_table(),
+    ratio_table() or measured_table(), and stored as an array('f'), so a conversion is a lookup,
+    or a binary search and a comparison of the two nearest values, with no interpolation.
+
+    The quantity must be monotonic in the wiper position, rising or falling.
+
+    values  - the quantity at each wiper position
+    """
+
+    def __init__(self, values):
+        """
+        :param values: the quantity at each wiper position, from 0 to max_value()
+        """
+        self.values = array("f", values)
+        if len(self.values) < 2:
+            raise ValueError("a calibration needs at least 2 wiper positions")
+        self._falling = self.values[-1] < self.values[0]
+
+    def __repr__(self):
+        return f"Calibration(positions={len(self.values)}, min={self.values[0]}, max={self.values[-1]})"
+
+    def __len__(self):
+        return len(self.values)
+
+    def value(self, code: int) -> float:
+        """
+        :param code: wiper position
+        :return: the quantity at the wiper position
+        """
+        return self.values[code]
+
+    def code(self, value: float) -> int:
+        """
+        :param value: the quantity wanted
+        :return: the wiper position giving the nearest value, the lower on a tie
+        """
+        values = self.values
+        falling = self._falling
+        lo = 0
+        hi = len(values) - 1
+        # Find the first position at or past value.
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if (values[mid] > value) if falling else (values[mid] < value):
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo and abs(values[lo - 1] - value) <= abs(values[lo] - value):
+            return lo - 1
+        return lo
+
+    def codes(self, values, out=None) -> array:
+        """
+        Convert a sequence of values to wiper positions, e.g. to play with a WaveformPlayer.
+        :param values: the quantities wanted
+        :param out: array('H') of the same length reused for the result, None to create one
+        :return: the wiper positions, an array('H')
+        """
+        if out is None:
+            out = array("H", [0] * len(values))
+        for i in range(len(values)):
+            out[i] = self.code(values[i])
+        return out
+
+    def values_at(self, codes, out=None) -> array:
+        """
+        Convert a sequence of wiper positions to values.
+        :param codes: wiper positions
+        :param out: array('f') of the same length reused for the result, None to create one
+        :return: the quantities, an array('f')
+        """
+        if out is None:
+            out = array("f", [0] * len(codes))
+        for i in range(len(codes)):
+            out[i] = self.values[codes[i]]
+        return out
+
+
+def resistance_table(pot, r_ab: float, r_w: float = WIPER_RESISTANCE, terminal_a: bool = False) -> Calibration:
+    """
+    Build the nominal resistance table of a pot, from the datasheet model of its resistor ladder.
+    :param pot: MCP4XXX
+    :param r_ab: resistance between terminals A and B, e.g. 10_000 for the 10 kOhm devices
+    :param r_w: wiper resistance
+    :param terminal_a: True for the resistance between the wiper and terminal A, falling with the
+                       wiper position, False for that between the wiper and terminal B
+    :return: the table
+    """
+    if terminal_a and pot.config == WiperConfiguration.RHEOSTAT:
+        raise ValueError("the rheostat devices have no terminal A")
+    steps = pot.resolution + 1
+    step = r_ab / steps
+    return Calibration([((steps - code) if terminal_a else code) * step + r_w for code in range(pot.max_value() + 1)])
+
+
+def ratio_table(pot) -> Calibration:
+    """
+    Build the nominal table of the divider ratio of a pot, the voltage at the wiper as a fraction
+    of that across terminals A and B, with the wiper unloaded.
+    :param pot: MCP4XXX
+    :return: the table
+    """
+    steps = pot.resolution + 1
+    return Calibration([code / steps for code in range(pot.max_value() + 1)])
+
+
+def measured_table(points, max_value: int) -> Calibration:
+    """
+    Build a table from values measured at some wiper positions, interpolating linearly between
+    them and extrapolating past the first and last:
+
+        table = measured_table([(0, 112.0), (64, 2_580.0), (128, 5_050.0), (256, 9_930.0)], pot.max_value())
+
+    :param points: pairs of wiper position and value measured, at least 2 at different positions
+    :param max_value: maximum wiper position of the pot, see MCP4XXX.max_value()
+    :return: the table
+    """
+    points = sorted(points)
+    if len(points) < 2:
+        raise ValueError("a calibration needs at least 2 measured points")
+    for i in range(1, len(points)):
+        if points[i][0] == points[i - 1][0]:
+            raise ValueError(f"wiper position {points[i][0]} measured twice")
+    values = []
+    segment = 0
+    for code in range(max_value + 1):
+        while segment < len(points) - 2 and code > points[segment + 1][0]:
+            segment += 1
+        code0, value0 = points[segment]
+        code1, value1 = points[segment + 1]
+        values.append(value0 + (value1 - value0) * (code - code0) / (code1 - code0))
+    return Calibration(values)
+
+
+class CalibratedPot:
+    """
+    A pot set and read in ohms or as a divider ratio, through calibration tables:
+
+        pot = MCP4XXX()
+        calibrated = CalibratedPot(pot, resistance_table(pot, r_ab=10_000))
+        calibrated.set_resistance(4_700)
+        calibrated.set_ratio(0.25)
+
+    Values are set to the nearest wiper position.
+
+    pot         - the MCP4XXX
+    resistance  - resistance table, None if the pot is not set in ohms
+    ratio       - divider ratio table
+    """
+
+    def __init__(self, pot, resistance: Calibration = None, ratio: Calibration = None):
+        """
+        :param pot: MCP4XXX, e.g. a pot of an MCP42XX
+        :param resistance: resistance table, see resistance_table() and measured_table()
+        :param ratio: divider ratio table, by default the nominal ratio_table() of the pot
+        """
+        self.pot = pot
+        self.resistance = resistance
+        self.ratio = ratio if ratio is not None else ratio_table(pot)
+        for table in (self.resistance, self.ratio):
+            if table is not None and len(table) != pot.max_value() + 1:
+                raise ValueError("calibration is of a pot of another resolution")
+
+    def __repr__(self):
+        return f"CalibratedPot(pot={self.pot}, resistance={self.resistance}, ratio={self.ratio})"
+
+    def set_resistance(self, ohms: float) -> bool:
+        """
+        Set the wiper to the position nearest a resistance.
+        :return: True on success; otherwise, False, see MCP4XXX.set()
+        """
+        return self.pot.set(self._resistance().code(ohms))
+
+    def get_resistance(self) -> float:
+        """
+        :return: the resistance at the wiper position, None if the read was rejected
+        """
+        code = self.pot.get()
+        return self._resistance().value(code) if code is not None else None
+
+    def set_ratio(self, ratio: float) -> bool:
+        """
+        Set the wiper to the position nearest a divider ratio.
+        :return: True on success; otherwise, False, see MCP4XXX.set()
+        """
+        return self.pot.set(self.ratio.code(ratio))
+
+    def get_ratio(self) -> float:
+        """
+        :return: the divider ratio at the wiper position, None if the read was rejected
+        """
+        code = self.pot.get()
+        return self.ratio.value(code) if code is not None else None
+
+    def _resistance(self) -> Calibration:
+        if self.resistance is None:
+            raise ValueError("no resistance calibration")
+        return self.resistance
@@ -0,0 +1,18 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * Debugging helpers for the MCP4XXX driver, kept out of the driver's import path.
+ *
+ * Please see README.md for more information.
+"""
+
+
+def tobinarystr(b: bytearray) -> str:
+    """ Pretty print a byte array as binary bytes separated by a space"""
+    s = ""
+    for i in range(len(b)):
+        if len(s) > 0:
+            s = s + " "
+        s = s + f"{b[i]:08b}"
+    return s
@@ -0,0 +1,144 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * Non-blocking scheduling of EEPROM writes to many MCP4X4X and MCP4X6X devices.
+ *
+ * Please see README.md for more information.
+"""
+from mcp4xxx import CommandError
+from mcp4xxx import COMMAND_WRITE
+from mcp4xxx import DATA_MASK_WORD
+from mcp4xxx import NV_WIPER_ADDRESSES
+from mcp4xxx import sleep_us
+from mcp4xxx import ticks_diff
+from mcp4xxx import ticks_us
+
+
+class EEPROMScheduler:
+    """
+    Writes non-volatile wiper positions and EEPROM locations without waiting for write cycles.
+
+    A device can only run one EEPROM write cycle at a time, and rejects non-volatile commands
+    until it completes. Writes are queued per device and poll() starts the next write of each
+    device whose previous write cycle has completed, found by reading the EEWA bit of its STATUS
+    register. poll() never waits, so the bus stays free for other devices, and volatile commands
+    to the device itself, while write cycles run. Call it from the main loop, a timer or a task:
+
+        scheduler = EEPROMScheduler()
+        scheduler.set_nv(volume, 100)
+        scheduler.write_eeprom(volume, 0, preset)
+        while scheduler.poll():
+            ...  # other work
+
+    Queuing a write to a location that already has a write queued replaces the queued value,
+    so a preset saved repeatedly costs one write cycle, and EEPROM wear, per poll.
+
+    writes      - number of write cycles started
+    coalesced   - number of queued writes replaced by a later write before being sent
+    polls       - number of STATUS reads made
+    """
+
+    def __init__(self, poll_us: int = 1_000, clock=ticks_us):
+        """
+        :param poll_us: minimum time between STATUS reads of a device, write cycles take several
+                        milliseconds so polling more often only loads the bus
+        :param clock: microsecond clock, time.ticks_us by default
+        """
+        self.poll_us = poll_us
+        self.clock = clock
+        self.writes: int = 0
+        self.coalesced: int = 0
+        self.polls: int = 0
+        # Devices in order of first write, each a list of [pot, time of last write or poll, writes...].
+        # The time is None while no write cycle is in progress, each write is a list of [address, data].
+        self._devices = []
+        self._devices_by_select = {}
+
+    def __repr__(self):
+        return f"EEPROMScheduler(pending={self.pending()}, writes={self.writes})"
+
+    def set_nv(self, pot, value: int):
+        """
+        Queue setting the non-volatile wiper position of a pot, see MCP4XXX.set_nv().
+        :param pot: MCP4XXX pot
+        :param value: The new non-volatile wiper position (must be between 0 and max_value()).
+        """
+        self._queue(pot, NV_WIPER_ADDRESSES[pot.m_pot], max(0, min(value, pot.max_value())))
+
+    def write_eeprom(self, device, index: int, value: int):
+        """
+        Queue writing a general purpose EEPROM location, see MCP4XXX.write_eeprom().
+        :param device: MCP4XXX, MCP42XX or MCP43XX
+        :param index: location, 0 to EEPROM_SIZE - 1, or QUAD_EEPROM_SIZE - 1 for the quad devices
+        :param value: 9-bit value to store
+        """
+        pot = getattr(device, "pot0", device)
+        if not 0 <= index < pot._eeprom_size:
+            raise ValueError(f"EEPROM index {index} out of range")
+        self._queue(pot, pot._eeprom_address + index, value & DATA_MASK_WORD)
+
+    def pending(self) -> int:
+        """
+        :return: number of writes queued or with their write cycle in progress
+        """
+        count = 0
+        for device in self._devices:
+            count += len(device) - 2 + (device[1] is not None)
+        return count
+
+    def poll(self) -> int:
+        """
+        Start the next queued write of each device that has completed its last write cycle.
+        :return: number of writes still pending, see pending()
+        """
+        now = self.clock()
+        for device in self._devices:
+            pot = device[0]
+            if device[1] is not None:
+                if ticks_diff(now, device[1]) < self.poll_us:
+                    continue
+                self.polls += 1
+                if pot.eeprom_busy():
+                    device[1] = now
+                    continue
+                device[1] = None
+            if len(device) > 2:
+                address, data = device[2]
+                try:
+                    sent = pot._send(address, COMMAND_WRITE, data)
+                except CommandError:
+                    sent = False
+                if sent:
+                    device.pop(2)
+                    self.writes += 1
+                # A rejected write, whatever the pot's error policy, stays queued and is retried once
+                # the device reports no write cycle in progress.
+                device[1] = now
+        return self.pending()
+
+    def wait(self, timeout_us: int = None) -> bool:
+        """
+        Poll until every queued write has completed, blocking the caller.
+        :param timeout_us: maximum time to wait, None to wait until done
+        :return: True if all writes completed, False on timeout
+        """
+        start = self.clock()
+        while self.poll():
+            if timeout_us is not None and ticks_diff(self.clock(), start) >= timeout_us:
+                return False
+            sleep_us(self.poll_us)
+        return True
+
+    def _queue(self, pot, address: int, data: int):
+        device = self._devices_by_select.get(pot.m_select)
+        if device is None:
+            device = [pot, None]
+            self._devices.append(device)
+            self._devices_by_select[pot.m_select] = device
+        for i in range(2, len(device)):
+            if device[i][0] == address:
+                device[i][1] = data
+                self.coalesced += 1
+                return
+        device.append([address, data])
@@ -0,0 +1,201 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * I2C devices of the range, MCP44XX, MCP45XX and MCP46XX, driven through the MCP4XXX API.
+ *
+ * Please see README.md for more information.
+"""
+from mcp4xxx import bus_lock
+from mcp4xxx import CMDERR_MASK
+from mcp4xxx import COMMAND_DECREMENT
+from mcp4xxx import COMMAND_INCREMENT
+from mcp4xxx import COMMAND_READ
+from mcp4xxx import ErrorPolicy
+from mcp4xxx import MCP42XX
+from mcp4xxx import MCP43XX
+from mcp4xxx import MCP4XXX
+from mcp4xxx import Pot
+from mcp4xxx import Resolution
+from mcp4xxx import WiperConfiguration
+
+# I2C address with the address pins LOW, 0b0101 followed by the levels of the A2, A1 and A0 pins.
+# Devices without some of the pins have those address bits fixed, see the datasheet.
+I2C_ADDRESS = 0b0101000
+
+
+class I2CTransport:
+    """
+    Sends frames of encoded MCP4XXX commands to an I2C device, standing in for machine.SPI.
+
+    The I2C devices use the same command encoding as the SPI devices, except that the bit the
+    SPI devices use for CMDERR carries data bit 9, so it is cleared. Runs of write, increment and
+    decrement commands in a frame are packed into a single I2C write transaction using the
+    devices' continuous write mode. Each read is a write of the command followed by a restarted
+    two byte read.
+
+    The I2C devices NACK an invalid command instead of clocking out CMDERR. The response is
+    reported as the SPI devices would: CMDERR HIGH for each accepted command and LOW from the
+    rejected command onwards, so the MCP4XXX error policy applies unchanged.
+
+    An address no device acknowledges raises OSError(ENODEV) from machine.I2C, whatever the
+    error policy.
+
+    transactions    - number of I2C transactions
+    """
+
+    def __init__(self, i2c, address: int = I2C_ADDRESS):
+        """
+        :param i2c: machine.I2C bus
+        :param address: 7-bit I2C address of the device
+        """
+        self.i2c = i2c
+        self.address = address
+        self.transactions: int = 0
+        self._cmd = bytearray(1)
+        self._word = bytearray(2)
+        self._buf = bytearray(16)
+
+    def __repr__(self):
+        return f"I2CTransport(address={self.address:#04x}, i2c={self.i2c})"
+
+    def write_readinto(self, write_buf, read_buf):
+        """
+        Send a frame of encoded commands, reading the response into read_buf.
+        """
+        n = len(write_buf)
+        pos = 0
+        while pos < n:
+            if write_buf[pos] >> 2 & 0b11 == COMMAND_READ:
+                if not self._read(write_buf, read_buf, pos):
+                    return
+                pos += 2
+            else:
+                end = self._write(write_buf, read_buf, pos)
+                if end < 0:
+                    return
+                pos = end
+
+    def _read(self, write_buf, read_buf, pos: int) -> bool:
+        """
+        Read the register addressed by the read command at pos.
+        :return: False if the command was rejected
+        """
+        self._cmd[0] = write_buf[pos] & ~CMDERR_MASK
+        self.transactions += 1
+        if self.i2c.writeto(self.address, self._cmd, False) < 1:
+            self._reject(read_buf, pos)
+            return False
+        self.i2c.readfrom_into(self.address, self._word)
+        read_buf[pos] = 0b11111110 | (self._word[0] & 0b1)
+        read_buf[pos + 1] = self._word[1]
+        return True
+
+    def _write(self, write_buf, read_buf, pos: int) -> int:
+        """
+        Send the run of commands other than reads starting at pos in one continuous write.
+        :return: offset of the command after the run, -1 if a command was rejected
+        """
+        n = len(write_buf)
+        end = pos
+        while end < n:
+            command = write_buf[end] >> 2 & 0b11
+            if command == COMMAND_READ:
+                break
+            end += 1 if command == COMMAND_INCREMENT or command == COMMAND_DECREMENT else 2
+        if end - pos > len(self._buf):
+            self._buf = bytearray(end - pos)
+        buf = self._buf
+        i = pos
+        while i < end:
+            command = write_buf[i] >> 2 & 0b11
+            buf[i - pos] = write_buf[i] & ~CMDERR_MASK
+            if command == COMMAND_INCREMENT or command == COMMAND_DECREMENT:
+                i += 1
+            else:
+                buf[i - pos + 1] = write_buf[i + 1]
+                i += 2
+        self.transactions += 1
+        # writeto() counts the data bytes acknowledged, so the first byte not acknowledged is at acks.
+        acks = self.i2c.writeto(self.address, memoryview(buf)[:end - pos])
+        failed = pos + acks
+        i = pos
+        while i < end:
+            command = write_buf[i] >> 2 & 0b11
+            size = 1 if command == COMMAND_INCREMENT or command == COMMAND_DECREMENT else 2
+            if i + size > failed:
+                self._reject(read_buf, i)
+                return -1
+            read_buf[i] = 0xFF
+            if size == 2:
+                read_buf[i + 1] = 0xFF
+            i += size
+        return end
+
+    def _reject(self, read_buf, pos: int):
+        """
+        Report the command at pos, and those after it, as rejected.
+        """
+        for i in range(pos, len(read_buf)):
+            read_buf[i] = 0x00
+
+
+class MCP45XX(MCP4XXX):
+    """
+    A pot of an I2C device, MCP45XX or MCP46XX, with the MCP4XXX API.
+
+    For the dual pot MCP46XX use MCP46XX, so that both pots share the bus and TCON cache.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, i2c, address: int = I2C_ADDRESS, pot=Pot.POT_0, resolution=Resolution.RES_8BIT,
+                 config=WiperConfiguration.POTENTIOMETER, tcon_cache=None, wiper_cache=None, lock=None,
+                 error_policy=ErrorPolicy.RAISE):
+        """
+        :param i2c: machine.I2C bus
+        :param address: 7-bit I2C address of the device, set by its address pins
+        :param lock: BusLock held while using the bus, True for the bus_lock() shared by all devices
+                     on the i2c bus, None to not lock for use by a single thread.
+        See MCP4XXX for the other parameters.
+        """
+        super().__init__(I2CTransport(i2c, address), None, pot, resolution, config, tcon_cache, wiper_cache,
+                         bus_lock(i2c) if lock is True else lock, error_policy)
+
+
+class MCP46XX(MCP42XX):
+    """
+    A dual pot I2C device (MCP46XX), with the MCP42XX API.
+    """
+
+    def __init__(self, i2c, address: int = I2C_ADDRESS, resolution=Resolution.RES_8BIT,
+                 config=WiperConfiguration.POTENTIOMETER, tcon_cache=True, wiper_cache=None, lock=None,
+                 error_policy=ErrorPolicy.RAISE):
+        """
+        :param i2c: machine.I2C bus
+        :param address: 7-bit I2C address of the device, set by its address pins
+        :param lock: BusLock held while using the bus, True for the bus_lock() shared by all devices
+                     on the i2c bus, None to not lock for use by a single thread.
+        See MCP42XX for the other parameters.
+        """
+        super().__init__(I2CTransport(i2c, address), None, resolution, config, tcon_cache, wiper_cache,
+                         bus_lock(i2c) if lock is True else lock, error_policy)
+
+
+class MCP44XX(MCP43XX):
+    """
+    A quad pot I2C device (MCP44XX), with the MCP43XX API.
+    """
+
+    def __init__(self, i2c, address: int = I2C_ADDRESS, resolution=Resolution.RES_8BIT,
+                 config=WiperConfiguration.POTENTIOMETER, tcon_cache=True, wiper_cache=None, lock=None,
+                 error_policy=ErrorPolicy.RAISE):
+        """
+        :param i2c: machine.I2C bus
+        :param address: 7-bit I2C address of the device, set by its address pins
+        :param lock: BusLock held while using the bus, True for the bus_lock() shared by all devices
+                     on the i2c bus, None to not lock for use by a single thread.
+        See MCP43XX for the other parameters.
+        """
+        super().__init__(I2CTransport(i2c, address), None, resolution, config, tcon_cache, wiper_cache,
+                         bus_lock(i2c) if lock is True else lock, error_policy)
@@ -0,0 +1,237 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * Instrumentation of the SPI traffic generated by MCP4XXX devices.
+ *
+ * Please see README.md for more information.
+"""
+from mcp4xxx import ADDRESS_POT0_WIPER
+from mcp4xxx import ADDRESS_POT1_WIPER
+from mcp4xxx import ADDRESS_POT2_WIPER
+from mcp4xxx import ADDRESS_POT3_WIPER
+from mcp4xxx import ADDRESS_STATUS
+from mcp4xxx import ADDRESS_TCON
+from mcp4xxx import ADDRESS_TCON1
+from mcp4xxx import CMDERR_MASK
+from mcp4xxx import COMMAND_DECREMENT
+from mcp4xxx import COMMAND_INCREMENT
+from mcp4xxx import COMMAND_READ
+from mcp4xxx import COMMAND_WRITE
+
+# Number of latency histogram buckets, the last counts every frame of 2^(HISTOGRAM_BUCKETS - 2) us or more.
+HISTOGRAM_BUCKETS = 20
+
+_ADDRESS_NAMES = {
+    ADDRESS_POT0_WIPER: "POT0_WIPER",
+    ADDRESS_POT1_WIPER: "POT1_WIPER",
+    ADDRESS_TCON: "TCON",
+    ADDRESS_STATUS: "STATUS",
+    ADDRESS_POT2_WIPER: "POT2_WIPER",
+    ADDRESS_POT3_WIPER: "POT3_WIPER",
+    ADDRESS_TCON1: "TCON1",
+}
+
+_COMMAND_NAMES = {
+    COMMAND_WRITE: "WRITE",
+    COMMAND_READ: "READ",
+    COMMAND_INCREMENT: "INCR",
+    COMMAND_DECREMENT: "DECR",
+}
+
+
+class TransferMetrics:
+    """
+    Counts the traffic of the devices it monitors, set as the monitor of an MCP4XXX, MCP42XX or MCP43XX:
+
+        metrics = TransferMetrics()
+        pot.monitor = metrics
+
+    Every command sent is decoded from the frame and counted by address and command. A command
+    answered with the CMDERR bit LOW is counted as a command error, the device ignores the rest
+    of the frame so no further commands in it are counted.
+
+    Recording does not allocate, so the monitor can be left attached to devices driven from
+    control loops. Without a monitor the driver pays a single attribute test per frame.
+
+    frames          - number of chip-select frames sent
+    bytes           - number of bytes clocked
+    selects         - number of times the chip-select line was driven LOW, frames sent within a
+                      transaction() share one
+    errors          - number of frames that raised an exception
+    command_errors  - number of commands rejected by the device with CMDERR
+    elapsed_us      - total time taken by the frames, including waiting for the bus lock
+    commands        - count of each command sent, indexed by address << 2 | command
+    histogram       - frame latency histogram, bucket 0 counts frames taking 0 us and bucket n
+                      frames taking 2^(n-1) us up to 2^n us
+    """
+
+    def __init__(self):
+        self.commands = [0] * 64
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+        self.reset()
+
+    def __repr__(self):
+        return f"TransferMetrics(frames={self.frames}, bytes={self.bytes}, selects={self.selects}, " + \
+               f"errors={self.errors}, command_errors={self.command_errors}, elapsed_us={self.elapsed_us})"
+
+    def reset(self):
+        """
+        Zero all the counters.
+        """
+        self.frames: int = 0
+        self.bytes: int = 0
+        self.selects: int = 0
+        self.errors: int = 0
+        self.command_errors: int = 0
+        self.elapsed_us: int = 0
+        for i in range(len(self.commands)):
+            self.commands[i] = 0
+        for i in range(len(self.histogram)):
+            self.histogram[i] = 0
+
+    def selected(self, device):
+        """
+        Called by the device when it drives its chip-select line LOW.
+        :param device: MCP4XXX selected
+        """
+        self.selects += 1
+
+    def before(self, device, tx):
+        """
+        Called by the device before a frame is sent.
+        :param device: MCP4XXX sending the frame
+        :param tx: encoded commands
+        """
+
+    def after(self, device, tx, rx, elapsed_us: int, error):
+        """
+        Called by the device after a frame is sent, or failed to be sent.
+        :param device: MCP4XXX that sent the frame
+        :param tx: encoded commands
+        :param rx: response
+        :param elapsed_us: time taken to send the frame
+        :param error: exception raised sending the frame, None on success
+        """
+        self.frames += 1
+        self.elapsed_us += elapsed_us
+        bucket = 0
+        while elapsed_us > 0 and bucket < HISTOGRAM_BUCKETS - 1:
+            elapsed_us >>= 1
+            bucket += 1
+        self.histogram[bucket] += 1
+        if error is not None:
+            self.errors += 1
+            return
+        n = len(tx)
+        self.bytes += n
+        pos = 0
+        while pos < n:
+            cmd = tx[pos]
+            self.commands[cmd >> 2 & 0b111111] += 1
+            if not rx[pos] & CMDERR_MASK:
+                self.command_errors += 1
+                return
+            command = cmd >> 2 & 0b11
+            pos += 1 if command == COMMAND_INCREMENT or command == COMMAND_DECREMENT else 2
+
+    def command_count(self, address, command) -> int:
+        """
+        :param address: 4 bit address code, e.g. ADDRESS_POT0_WIPER
+        :param command: 2 bit command code, e.g. COMMAND_WRITE
+        :return: number of the command sent to the address
+        """
+        return self.commands[address << 2 | command]
+
+    def command_counts(self) -> dict:
+        """
+        :return: count of each command sent, keyed by name, e.g. "POT0_WIPER WRITE"
+        """
+        counts = {}
+        for i in range(len(self.commands)):
+            if self.commands[i]:
+                address = _ADDRESS_NAMES.get(i >> 2, f"{i >> 2:#03x}")
+                counts[f"{address} {_COMMAND_NAMES[i & 0b11]}"] = self.commands[i]
+        return counts
+
+    def latency_percentile(self, fraction: float) -> int:
+        """
+        Estimate a frame latency percentile from the histogram.
+        :param fraction: percentile as a fraction, e.g. 0.99
+        :return: upper bound of the histogram bucket holding the percentile, in microseconds
+        """
+        target = fraction * self.frames
+        count = 0
+        for bucket in range(HISTOGRAM_BUCKETS):
+            count += self.histogram[bucket]
+            if count >= target:
+                return 1 << bucket if bucket else 0
+        return 1 << (HISTOGRAM_BUCKETS - 1)
+
+    def merge(self, other: "TransferMetrics"):
+        """
+        Add the counts of other to this.
+        """
+        self.frames += other.frames
+        self.bytes += other.bytes
+        self.selects += other.selects
+        self.errors += other.errors
+        self.command_errors += other.command_errors
+        self.elapsed_us += other.elapsed_us
+        for i in range(len(self.commands)):
+            self.commands[i] += other.commands[i]
+        for i in range(HISTOGRAM_BUCKETS):
+            self.histogram[i] += other.histogram[i]
+
+
+class BusMetrics:
+    """
+    Metrics of many devices sharing a bus kept apart, to find which devices and control loops
+    load the bus:
+
+        metrics = BusMetrics()
+        metrics.attach("volume", volume)
+        metrics.attach("tone", tone)
+        ...
+        for name, device in metrics.devices.items():
+            print(name, device.frames, device.elapsed_us)
+
+    devices - TransferMetrics of each device, by name
+    """
+
+    def __init__(self):
+        self.devices = {}
+
+    def __repr__(self):
+        return f"BusMetrics(devices={list(self.devices)})"
+
+    def __getitem__(self, name) -> TransferMetrics:
+        return self.devices[name]
+
+    def attach(self, name, device) -> TransferMetrics:
+        """
+        Start monitoring a device.
+        :param name: name of the device
+        :param device: MCP4XXX or MCP42XX to monitor
+        :return: metrics of the device
+        """
+        metrics = TransferMetrics()
+        device.monitor = metrics
+        self.devices[name] = metrics
+        return metrics
+
+    def total(self) -> TransferMetrics:
+        """
+        :return: metrics of all devices combined
+        """
+        total = TransferMetrics()
+        for metrics in self.devices.values():
+            total.merge(metrics)
+        return total
+
+    def reset(self):
+        """
+        Zero the metrics of all devices.
+        """
+        for metrics in self.devices.values():
+            metrics.reset()
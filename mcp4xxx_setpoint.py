@@ -0,0 +1,294 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * Latest-value-wins setpoint queue, decoupling control loops from the SPI bus.
+ *
+ * Please see README.md for more information.
+"""
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+from mcp4xxx import _pack_wiper
+from mcp4xxx import _record_wiper
+from mcp4xxx import sleep_us
+from mcp4xxx import ticks_diff
+from mcp4xxx import ticks_us
+
+
+class SetpointQueue:
+    """
+    Sink for wiper setpoints that control code writes into without waiting for the bus.
+
+    put() only records the setpoint, replacing any not yet sent for the same pot, so a control
+    loop running faster than the bus never backs up. A flusher sends the most recent setpoint
+    of each pot, at most max_rate times per second, with the pots of a device written in a
+    single chip-select frame. Run the flusher as a thread with start(), as an asyncio task with
+    run(), or call poll() from a main loop or machine.Timer:
+
+        queue = SetpointQueue(max_rate=500)
+        queue.start()
+        while True:
+            queue.put(volume, control())
+
+    A frame that is rejected, or raises, is not retried, its setpoints are counted as dropped and
+    the next put() for the pots is sent instead. The staleness of a setpoint is the time from
+    its put() until the frame carrying it has been sent.
+
+    puts                - number of setpoints put
+    coalesced           - number of setpoints replaced by a later put() before being sent
+    written             - number of wiper writes sent
+    skipped             - number of setpoints not sent as a trusted wiper cache held them already
+    dropped             - number of setpoints lost to frames that were rejected or raised
+    frames              - number of chip-select frames sent
+    max_staleness_us    - longest staleness of a written setpoint
+    total_staleness_us  - total staleness of the written setpoints, see mean_staleness_us()
+    error               - last exception raised sending a frame, None if none
+    """
+
+    def __init__(self, max_rate: int = 1_000, clock=ticks_us):
+        """
+        :param max_rate: maximum number of flushes per second made by poll()
+        :param clock: microsecond clock, time.ticks_us by default
+        """
+        self.period_us = 1_000_000 // max_rate
+        self.clock = clock
+        self.error = None
+        self._lock = _thread.allocate_lock() if _thread is not None else None
+        self._running = False
+        self._active = False
+        self._flushing = False
+        self._last = None
+        self._index = {}
+        # Registered pots, and per pot the setpoint not yet sent, or None, and the time it was put.
+        self._pots = []
+        self._values = []
+        self._times = []
+        # The setpoints taken by the flush in progress, so put() can continue while it sends them.
+        self._sending = []
+        self._sent_times = []
+        # Pot indexes of each device, grouped by chip select.
+        self._devices = []
+        self._devices_by_select = {}
+        self._tx = bytearray(8)
+        self._rx = bytearray(8)
+        tx = memoryview(self._tx)
+        rx = memoryview(self._rx)
+        # A view of each even length, so that frames are sent without allocating.
+        self._views = [(tx[:n], rx[:n]) for n in range(0, 9, 2)]
+        self.reset_stats()
+
+    def __repr__(self):
+        return f"SetpointQueue(pots={len(self._pots)}, pending={self.pending()}, written={self.written}, " + \
+               f"coalesced={self.coalesced}, dropped={self.dropped}, max_staleness_us={self.max_staleness_us})"
+
+    def reset_stats(self):
+        """
+        Zero the statistics.
+        """
+        self.puts: int = 0
+        self.coalesced: int = 0
+        self.written: int = 0
+        self.skipped: int = 0
+        self.dropped: int = 0
+        self.frames: int = 0
+        self.max_staleness_us: int = 0
+        self.total_staleness_us: int = 0
+
+    def add(self, pot) -> int:
+        """
+        Register a pot, done by the first put() for the pot if not called before.
+        :param pot: MCP4XXX, e.g. a pot of an MCP42XX
+        :return: index of the pot
+        """
+        lock = self._lock
+        if lock is None:
+            return self._add(pot)
+        with lock:
+            return self._add(pot)
+
+    def put(self, pot, value: int):
+        """
+        Set the next wiper position of a pot, without waiting for it to be sent.
+        :param pot: MCP4XXX
+        :param value: The new wiper position (must be between 0 and max_value()).
+        """
+        now = self.clock()
+        lock = self._lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            index = self._index.get(pot)
+            if index is None:
+                index = self._add(pot)
+            if self._values[index] is not None:
+                self.coalesced += 1
+            self._values[index] = value
+            self._times[index] = now
+            self.puts += 1
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def pending(self) -> int:
+        """
+        :return: number of pots with a setpoint not yet sent
+        """
+        count = 0
+        for value in self._values:
+            count += value is not None
+        return count
+
+    def mean_staleness_us(self) -> float:
+        """
+        :return: mean staleness of the written setpoints
+        """
+        return self.total_staleness_us / self.written if self.written else 0.0
+
+    def poll(self, timer=None) -> int:
+        """
+        Flush, unless the last flush was less than 1 / max_rate seconds ago. The timer argument
+        lets poll be used directly as a machine.Timer callback.
+        :return: number of frames sent
+        """
+        if self._last is not None and ticks_diff(self.clock(), self._last) < self.period_us:
+            return 0
+        return self.flush()
+
+    def flush(self) -> int:
+        """
+        Send the pending setpoints now, one chip-select frame per device. A flush called while
+        another is in progress, e.g. by poll() from a timer interrupting it, sends nothing.
+        :return: number of frames sent
+        """
+        lock = self._lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            if self._flushing:
+                return 0
+            self._flushing = True
+            self._last = self.clock()
+            values = self._values
+            for i in range(len(values)):
+                self._sending[i] = values[i]
+                self._sent_times[i] = self._times[i]
+                values[i] = None
+        finally:
+            if lock is not None:
+                lock.release()
+        frames = 0
+        try:
+            for device in self._devices:
+                frames += self._flush_device(device)
+        finally:
+            self._flushing = False
+        self.frames += frames
+        return frames
+
+    def start(self):
+        """
+        Start a thread that calls poll() until stop().
+        """
+        if _thread is None:
+            raise RuntimeError("SetpointQueue.start() requires _thread")
+        self._running = True
+        self._active = True
+        _thread.start_new_thread(self._run, ())
+
+    def stop(self):
+        """
+        Stop the thread started by start(), after its current flush.
+        """
+        self._running = False
+        while self._active:
+            sleep_us(100)
+
+    async def run(self):
+        """
+        Call poll() at max_rate until cancelled, as an asyncio task:
+
+            asyncio.create_task(queue.run())
+        """
+        # Imported here so that the thread and timer flushers do not load asyncio.
+        try:
+            import asyncio
+        except ImportError:
+            import uasyncio as asyncio
+        while True:
+            self.poll()
+            await asyncio.sleep(self.period_us / 1_000_000)
+
+    def _run(self):
+        try:
+            while self._running:
+                self.poll()
+                wait = self.period_us - ticks_diff(self.clock(), self._last)
+                if wait > 0:
+                    sleep_us(wait)
+        finally:
+            self._active = False
+
+    def _add(self, pot) -> int:
+        index = self._index.get(pot)
+        if index is not None:
+            return index
+        device = self._devices_by_select.get(pot.m_select)
+        if device is None:
+            device = []
+            self._devices.append(device)
+            self._devices_by_select[pot.m_select] = device
+        if len(device) == len(self._views) - 1:
+            raise ValueError("too many pots on one chip select")
+        index = len(self._pots)
+        device.append(index)
+        self._pots.append(pot)
+        self._values.append(None)
+        self._times.append(0)
+        self._sending.append(None)
+        self._sent_times.append(0)
+        self._index[pot] = index
+        return index
+
+    def _flush_device(self, device) -> int:
+        """
+        Send the taken setpoints of the pots of a device in one frame.
+        :return: 1 if a frame was sent, else 0
+        """
+        tx = self._tx
+        pos = 0
+        for index in device:
+            value = self._sending[index]
+            if value is None:
+                continue
+            n = _pack_wiper(tx, pos, self._pots[index], value)
+            if not n:
+                self.skipped += 1
+                self._sending[index] = None
+            pos += n
+        if not pos:
+            return 0
+        tx_view, rx_view = self._views[pos // 2]
+        try:
+            ok = self._pots[device[0]]._transfer_frame(tx_view, rx_view)
+        except Exception as e:
+            self.error = e
+            ok = False
+        now = self.clock()
+        for index in device:
+            value = self._sending[index]
+            if value is None:
+                continue
+            self._sending[index] = None
+            _record_wiper(self._pots[index], value, ok)
+            if not ok:
+                self.dropped += 1
+                continue
+            self.written += 1
+            staleness = ticks_diff(now, self._sent_times[index])
+            self.total_staleness_us += staleness
+            if staleness > self.max_staleness_us:
+                self.max_staleness_us = staleness
+        return 1
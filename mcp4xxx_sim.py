@@ -0,0 +1,463 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * Simulated MCP4XXX devices and SPI bus, for developing and testing without hardware.
+ *
+ * Please see README.md for more information.
+"""
+try:
+    from errno import ENODEV
+except ImportError:
+    from uerrno import ENODEV
+
+from mcp4xxx import ADDRESS_EEPROM
+from mcp4xxx import ADDRESS_QUAD_EEPROM
+from mcp4xxx import ADDRESS_STATUS
+from mcp4xxx import ADDRESS_TCON
+from mcp4xxx import ADDRESS_TCON1
+from mcp4xxx import COMMAND_DECREMENT
+from mcp4xxx import COMMAND_INCREMENT
+from mcp4xxx import COMMAND_READ
+from mcp4xxx import COMMAND_WRITE
+from mcp4xxx import EEPROM_SIZE
+from mcp4xxx import NV_WIPER_ADDRESSES
+from mcp4xxx import QUAD_EEPROM_SIZE
+from mcp4xxx import Resolution
+from mcp4xxx import STATUS_EEPROM_WRITE_MASK
+from mcp4xxx import STATUS_SHUTDOWN_MASK
+from mcp4xxx import ticks_diff
+from mcp4xxx import ticks_us
+from mcp4xxx import WIPER_ADDRESSES
+from mcp4xxx import WiperConfiguration
+
+
+class SimulatedDevice:
+    """
+    Model of an MCP41XX, MCP42XX or MCP43XX device, optionally with EEPROM (MCP4X4X and MCP4X6X).
+
+    The device is clocked a byte at a time, so any number of commands can be sent back to back
+    while it is selected, in one or several transfers. An invalid address or command sets the
+    CMDERR bit of the response LOW, after which the device ignores the rest of the frame and
+    holds its output LOW until deselected.
+
+    Wiper writes beyond max_value() and increments and decrements beyond either end saturate.
+
+    A write to a non-volatile wiper or the general purpose EEPROM starts a write cycle of
+    write_us, timed by the clock, during which STATUS reports EEWA and all non-volatile commands
+    are rejected. The non-volatile memory survives reset(), which loads the wipers from it.
+
+    wipers          - volatile wiper positions
+    tcon            - TCON register
+    tcon1           - TCON1 register, quad devices only
+    nv_wipers       - non-volatile wiper positions, EEPROM devices only
+    eeprom          - general purpose EEPROM, EEPROM devices only
+    shutdown_pin    - True if the hardware shutdown pin is asserted, reported by STATUS
+    errors          - number of commands rejected with CMDERR
+    eeprom_writes   - number of EEPROM write cycles started
+    """
+
+    def __init__(self, pots: int = 1, resolution=Resolution.RES_8BIT, config=WiperConfiguration.POTENTIOMETER,
+                 nonvolatile: bool = False, write_us: int = 5_000, clock=ticks_us):
+        """
+        :param pots: number of pots, 1 for MCP41XX, 2 for MCP42XX and 4 for MCP43XX
+        :param resolution: res_7bit for MCP4X3X and MCP4X4X, res_8bit for MCP4X5X and MCP4X6X.
+        :param config: POTENTIOMETER or REOSTAT
+        :param nonvolatile: True for the EEPROM devices, MCP4X4X and MCP4X6X
+        :param write_us: duration of an EEPROM write cycle
+        :param clock: microsecond clock timing the write cycles, time.ticks_us by default
+        """
+        self.pots = pots
+        self.resolution = resolution
+        self.config = config
+        self.nonvolatile = nonvolatile
+        self.write_us = write_us
+        self.clock = clock
+        self.shutdown_pin = False
+        self.errors: int = 0
+        self.eeprom_writes: int = 0
+        self.selected = False
+        self.nv_wipers = [(resolution + 1) // 2] * pots if nonvolatile else []
+        # The quad devices have fewer EEPROM locations, after their TCON1 register.
+        self._eeprom_address = ADDRESS_QUAD_EEPROM if pots == 4 else ADDRESS_EEPROM
+        self.eeprom = [0] * (QUAD_EEPROM_SIZE if pots == 4 else EEPROM_SIZE) if nonvolatile else []
+        self._write_start = None
+        self.reset()
+
+    def __repr__(self):
+        return f"SimulatedDevice(pots={self.pots}, wipers={self.wipers}, tcon={self.tcon:#05x})"
+
+    def max_value(self) -> int:
+        """
+        Retrieve the maximum value allowed for the wiper position, see MCP4XXX.max_value().
+        """
+        return self.resolution + self.config
+
+    def reset(self):
+        """
+        Power on reset, wipers at mid scale, or the non-volatile positions, and all terminals connected.
+        """
+        self.wipers = list(self.nv_wipers) if self.nonvolatile else [(self.resolution + 1) // 2] * self.pots
+        self.tcon = 0x1FF
+        self.tcon1 = 0x1FF
+        self._command = None
+        self._error = False
+
+    def select(self):
+        """
+        Chip select LOW, starting a frame.
+        """
+        self.selected = True
+        self._command = None
+        self._error = False
+
+    def deselect(self):
+        """
+        Chip select HIGH, ending a frame. An incomplete 16-bit command is discarded.
+        """
+        self.selected = False
+        self._command = None
+
+    def exchange(self, byte: int) -> int:
+        """
+        Clock a byte in and out of the selected device.
+        :param byte: byte clocked in on SDI
+        :return: byte clocked out on SDO
+        """
+        if self._error:
+            return 0x00
+        if self._command is not None:
+            return self._data(byte)
+
+        address = byte >> 4
+        command = (byte >> 2) & 0b11
+        if not self._valid(address, command):
+            self._error = True
+            self.errors += 1
+            # SDO is HIGH during the address and command bits, then held LOW from the CMDERR bit.
+            return 0b11111100
+        if command == COMMAND_INCREMENT:
+            pot = self._wiper(address)
+            self.wipers[pot] = min(self.wipers[pot] + 1, self.max_value())
+            return 0xFF
+        if command == COMMAND_DECREMENT:
+            pot = self._wiper(address)
+            self.wipers[pot] = max(self.wipers[pot] - 1, 0)
+            return 0xFF
+        self._command = byte
+        if command == COMMAND_READ:
+            return 0b11111110 | (self._register(address) >> 8)
+        return 0xFF
+
+    def _data(self, byte: int) -> int:
+        """
+        Clock in the data byte of a 16-bit command.
+        """
+        first = self._command
+        self._command = None
+        address = first >> 4
+        if (first >> 2) & 0b11 == COMMAND_READ:
+            return self._register(address) & 0xFF
+        data = ((first & 0b1) << 8) | byte
+        if self._wiper(address) >= 0:
+            self.wipers[self._wiper(address)] = min(data, self.max_value())
+        elif address == ADDRESS_TCON:
+            # The high nibble of TCON is reserved on single pot devices.
+            self.tcon = 0x100 | (data & 0xFF if self.pots > 1 else 0xF0 | data & 0x0F)
+        elif address == ADDRESS_TCON1 and self.pots == 4:
+            self.tcon1 = 0x100 | (data & 0xFF)
+        elif self._nv_wiper(address) >= 0:
+            self.nv_wipers[self._nv_wiper(address)] = min(data, self.max_value())
+            self._start_write()
+        else:
+            self.eeprom[address - self._eeprom_address] = data
+            self._start_write()
+        return 0xFF
+
+    def _start_write(self):
+        self._write_start = self.clock()
+        self.eeprom_writes += 1
+
+    def writing(self) -> bool:
+        """
+        Whether an EEPROM write cycle is in progress.
+        """
+        if self._write_start is not None and ticks_diff(self.clock(), self._write_start) >= self.write_us:
+            self._write_start = None
+        return self._write_start is not None
+
+    def _valid(self, address: int, command: int) -> bool:
+        """
+        Whether the device accepts a command for an address.
+        """
+        if self._wiper(address) >= 0:
+            return True
+        if address == ADDRESS_TCON or (address == ADDRESS_TCON1 and self.pots == 4):
+            return command == COMMAND_READ or command == COMMAND_WRITE
+        if address == ADDRESS_STATUS:
+            return command == COMMAND_READ
+        if self.nonvolatile and (self._nv_wiper(address) >= 0 or address >= self._eeprom_address):
+            return (command == COMMAND_READ or command == COMMAND_WRITE) and not self.writing()
+        return False
+
+    def _wiper(self, address: int) -> int:
+        """
+        The pot whose volatile wiper is at address, -1 if none.
+        """
+        for pot in range(self.pots):
+            if WIPER_ADDRESSES[pot] == address:
+                return pot
+        return -1
+
+    def _nv_wiper(self, address: int) -> int:
+        """
+        The pot whose non-volatile wiper is at address, -1 if none.
+        """
+        for pot in range(self.pots if self.nonvolatile else 0):
+            if NV_WIPER_ADDRESSES[pot] == address:
+                return pot
+        return -1
+
+    def _register(self, address: int) -> int:
+        """
+        Read the 9-bit value of a register.
+        """
+        if self._wiper(address) >= 0:
+            return self.wipers[self._wiper(address)]
+        if address == ADDRESS_TCON:
+            return self.tcon
+        if address == ADDRESS_TCON1:
+            return self.tcon1
+        if address == ADDRESS_STATUS:
+            # Bits 8 to 5 are reserved and read as 1.
+            return 0x1E0 | (STATUS_SHUTDOWN_MASK if self.shutdown_pin else 0) | \
+                (STATUS_EEPROM_WRITE_MASK if self.nonvolatile and self.writing() else 0)
+        if self._nv_wiper(address) >= 0:
+            return self.nv_wipers[self._nv_wiper(address)]
+        return self.eeprom[address - self._eeprom_address]
+
+
+class SimulatedPin:
+    """
+    Chip-select pin of a simulated device, used as the select_pin of an MCP4XXX.
+    """
+
+    def __init__(self, spi, device: SimulatedDevice):
+        self.spi = spi
+        self.device = device
+        self._value = 1
+
+    def __repr__(self):
+        return f"SimulatedPin({self.device})"
+
+    def __call__(self, value: int = None):
+        return self.value(value)
+
+    def value(self, value: int = None):
+        """
+        Get or set the pin level, LOW selects the device.
+        """
+        if value is None:
+            return self._value
+        if value and not self._value:
+            self.device.deselect()
+        elif not value and self._value:
+            self.spi.selects += 1
+            self.spi.bus_time_us += self.spi.cs_overhead_us
+            self.device.select()
+        self._value = 1 if value else 0
+
+
+class SimulatedSPI:
+    """
+    Stand-in for machine.SPI with simulated devices attached.
+
+    Bus time is modelled as 8 bits per byte at the baud rate, plus cs_overhead_us for each chip
+    select and call_overhead_us for each transfer call, and is accumulated in bus_time_us.
+    Bytes clocked while no device is selected read as 0xFF.
+
+    Above max_baudrate the response is sampled late, as on a board whose SDO is too slow for the
+    clock, so it is read shifted by one bit.
+
+    transfers   - number of transfer calls
+    bytes       - number of bytes clocked
+    selects     - number of times a chip-select line was driven LOW
+    bus_time_us - simulated time the bus was busy
+    """
+
+    def __init__(self, baudrate: int = 250_000, cs_overhead_us: float = 1.0, call_overhead_us: float = 0.0,
+                 max_baudrate: int = None):
+        """
+        :param baudrate: SPI clock rate
+        :param cs_overhead_us: time taken by each chip select, including setup and hold times
+        :param call_overhead_us: time taken by each transfer call, over and above clocking its bytes
+        :param max_baudrate: fastest clock rate the response is read correctly at, None for no limit
+        """
+        self.baudrate = baudrate
+        self.max_baudrate = max_baudrate
+        self.cs_overhead_us = cs_overhead_us
+        self.call_overhead_us = call_overhead_us
+        self.devices = []
+        self.reset_stats()
+
+    def __repr__(self):
+        return f"SimulatedSPI(baudrate={self.baudrate}, devices={len(self.devices)})"
+
+    def reset_stats(self):
+        """
+        Zero the bus statistics.
+        """
+        self.transfers: int = 0
+        self.bytes: int = 0
+        self.selects: int = 0
+        self.bus_time_us: float = 0.0
+
+    def init(self, baudrate: int = None, **kwargs):
+        """
+        Initialise the bus, as machine.SPI.init(), only the baud rate is modelled.
+        """
+        if baudrate is not None:
+            self.baudrate = baudrate
+
+    def attach(self, device: SimulatedDevice) -> SimulatedPin:
+        """
+        Attach a device to the bus.
+        :param device: device to attach
+        :return: the device's chip-select pin
+        """
+        self.devices.append(device)
+        return SimulatedPin(self, device)
+
+    def write_readinto(self, write_buf, read_buf):
+        """
+        Clock write_buf out to the selected devices while reading their response into read_buf.
+        """
+        self.transfers += 1
+        self.bytes += len(write_buf)
+        self.bus_time_us += self.call_overhead_us + len(write_buf) * 8_000_000 / self.baudrate
+        devices = self.devices
+        for i in range(len(write_buf)):
+            out = 0xFF
+            for device in devices:
+                if device.selected:
+                    out &= device.exchange(write_buf[i])
+            read_buf[i] = out
+        if self.max_baudrate is not None and self.baudrate > self.max_baudrate:
+            # Each bit is read a bit late, the first reads the idle HIGH line.
+            carry = 1
+            for i in range(len(write_buf)):
+                out = read_buf[i]
+                read_buf[i] = carry << 7 | out >> 1
+                carry = out & 1
+
+    def write(self, buf):
+        """
+        Clock buf out to the selected devices, discarding their response.
+        """
+        self.write_readinto(buf, bytearray(len(buf)))
+
+    def readinto(self, buf, write: int = 0x00):
+        """
+        Read from the selected devices into buf while clocking out the write byte.
+        """
+        self.write_readinto(bytes([write]) * len(buf), buf)
+
+
+class SimulatedI2C:
+    """
+    Stand-in for machine.I2C with simulated devices attached, for the I2C devices (MCP44XX, MCP45XX
+    and MCP46XX).
+
+    A device acknowledges each byte written to it, except a command it rejects, which it NACKs,
+    ending the transaction. As with machine.I2C, a write returns the number of data bytes
+    acknowledged and an address no device acknowledges raises OSError(ENODEV). A read command
+    written without a stop is answered by the following two byte read.
+
+    Bus time is modelled as 9 bits per byte, including the address byte, at the baud rate.
+
+    transactions    - number of transactions, each a write or a read
+    bytes           - number of bytes clocked, including address bytes
+    bus_time_us     - simulated time the bus was busy
+    """
+
+    def __init__(self, baudrate: int = 400_000):
+        """
+        :param baudrate: I2C clock rate
+        """
+        self.baudrate = baudrate
+        self.devices = {}
+        self._read_command = None
+        self.reset_stats()
+
+    def __repr__(self):
+        return f"SimulatedI2C(baudrate={self.baudrate}, addresses={sorted(self.devices)})"
+
+    def reset_stats(self):
+        """
+        Zero the bus statistics.
+        """
+        self.transactions: int = 0
+        self.bytes: int = 0
+        self.bus_time_us: float = 0.0
+
+    def attach(self, device: SimulatedDevice, address: int):
+        """
+        Attach a device to the bus.
+        :param device: device to attach
+        :param address: 7-bit I2C address of the device
+        """
+        self.devices[address] = device
+
+    def scan(self) -> list:
+        """
+        :return: addresses of the attached devices
+        """
+        return sorted(self.devices)
+
+    def writeto(self, addr: int, buf, stop: bool = True) -> int:
+        """
+        Write buf to the device at addr.
+        :return: number of data bytes acknowledged
+        :exception: OSError(ENODEV) if no device is at addr
+        """
+        self._clock(1 + len(buf))
+        device = self.devices.get(addr)
+        if device is None:
+            raise OSError(ENODEV)
+        device.select()
+        acks = 0
+        try:
+            for i in range(len(buf)):
+                if not device.exchange(buf[i]) & 0b10:
+                    return acks
+                acks += 1
+            command = buf[len(buf) - 1] if len(buf) else 0
+            if not stop and len(buf) == 1 and (command >> 2) & 0b11 == COMMAND_READ:
+                self._read_command = command
+        finally:
+            device.deselect()
+        return acks
+
+    def readfrom_into(self, addr: int, buf, stop: bool = True):
+        """
+        Read the register addressed by the preceding read command into buf.
+        """
+        self._clock(1 + len(buf))
+        device = self.devices.get(addr)
+        if device is None:
+            raise OSError(ENODEV)
+        command = self._read_command
+        self._read_command = None
+        device.select()
+        try:
+            high = device.exchange(command)
+            low = device.exchange(0xFF)
+        finally:
+            device.deselect()
+        buf[0] = high & 0b1
+        buf[1] = low
+
+    def _clock(self, n: int):
+        self.transactions += 1
+        self.bytes += n
+        self.bus_time_us += n * 9_000_000 / self.baudrate
@@ -0,0 +1,390 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * Capture of the SPI traffic of MCP4XXX devices to a compact binary trace, and its decoding and replay.
+ *
+ * Please see README.md for more information.
+"""
+try:
+    from collections import namedtuple
+except ImportError:
+    from ucollections import namedtuple
+
+from mcp4xxx import CMDERR_MASK
+from mcp4xxx import COMMAND_DECREMENT
+from mcp4xxx import COMMAND_INCREMENT
+from mcp4xxx import COMMAND_READ
+from mcp4xxx import CommandError
+from mcp4xxx import DATA_MASK
+from mcp4xxx import sleep_us
+from mcp4xxx import ticks_diff
+from mcp4xxx import ticks_us
+
+# A trace starts with TRACE_MAGIC and the format version, followed by a record per frame.
+TRACE_MAGIC = b"MCPT"
+TRACE_VERSION = 1
+# A record is a header of RECORD_HEADER_SIZE bytes followed by the tx and then the rx bytes of the frame.
+# The header holds the microseconds since the previous frame (4 bytes, little endian, saturating),
+# the frame length (2 bytes, little endian), the device number and the flags.
+RECORD_HEADER_SIZE = 8
+# Device number of frames sent while no traced chip-select line was LOW.
+NO_DEVICE = 0xFF
+# Flag of a frame whose transfer raised, its response is not valid.
+FLAG_FAILED = 0b1
+
+_TRACE_HEADER = TRACE_MAGIC + bytes((TRACE_VERSION,))
+
+# A recorded frame. time_us is the time since the first frame of the trace.
+TraceFrame = namedtuple("TraceFrame", ("time_us", "device", "tx", "rx", "failed"))
+# A command decoded from a frame. data is None for increments and decrements, and for rejected reads.
+TraceCommand = namedtuple("TraceCommand", ("address", "command", "data", "accepted"))
+
+
+class TracePin:
+    """
+    Chip-select pin of a device traced by a TraceRecorder, see TraceRecorder.pin().
+    """
+
+    def __init__(self, recorder, pin, device: int):
+        self.recorder = recorder
+        self.pin = pin
+        self.device = device
+
+    def __repr__(self):
+        return f"TracePin(device={self.device}, pin={self.pin})"
+
+    def __call__(self, value: int = None):
+        return self.value(value)
+
+    def value(self, value: int = None):
+        """
+        Get or set the pin level, noting the device selected while it is LOW.
+        """
+        if value is None:
+            return self.pin()
+        if value:
+            self.pin(1)
+            if self.recorder.device == self.device:
+                self.recorder.device = NO_DEVICE
+        else:
+            self.recorder.device = self.device
+            self.pin(0)
+
+
+class TraceRecorder:
+    """
+    Stand-in for machine.SPI that records every frame sent through it, used as the spi of the
+    devices with their chip-select pins wrapped by pin():
+
+        trace = TraceRecorder(SPI(0), sink=open("trace.bin", "wb"))
+        volume = MCP4XXX(spi=trace, select_pin=trace.pin(17))
+        ...
+        trace.flush()
+
+    Each frame is recorded with its time, the device selected, and the bytes sent and received,
+    see RECORD_HEADER_SIZE. Records are written to a ring of chunks, chunk_size bytes each. When
+    the chunk being filled is full it is written to the sink, if any, and recording moves on to
+    the next chunk, overwriting its frames. So memory use is bounded: with a sink every frame is
+    streamed to it a chunk at a time, without one the latest frames are kept, to be written by
+    save(), e.g. after a fault.
+
+    Recording does not allocate, other than writing a chunk to the sink.
+
+    frames          - number of frames recorded
+    dropped         - number of frames overwritten before being written, or too long to record
+    bytes_written   - number of bytes written to the sink
+    """
+
+    def __init__(self, spi, sink=None, chunk_size: int = 1_024, chunks: int = 2, clock=ticks_us):
+        """
+        :param spi: SPI interface traced, e.g. machine.SPI or SimulatedSPI
+        :param sink: stream the trace is written to, e.g. a file opened for binary writing, None to
+                     keep only the latest frames
+        :param chunk_size: size of each chunk in bytes, the longest frame recorded is
+                           (chunk_size - RECORD_HEADER_SIZE) // 2 bytes
+        :param chunks: number of chunks in the ring, at least 2
+        :param clock: microsecond clock, time.ticks_us by default
+        """
+        if chunks < 2:
+            raise ValueError("a trace needs at least 2 chunks")
+        self.spi = spi
+        self.sink = sink
+        self.clock = clock
+        # Number of the device whose chip-select line is LOW, set by its TracePin.
+        self.device = NO_DEVICE
+        self.pins = []
+        self._chunks = [bytearray(chunk_size) for _ in range(chunks)]
+        self._views = [memoryview(chunk) for chunk in self._chunks]
+        # Bytes used and frames recorded in each chunk.
+        self._lengths = [0] * chunks
+        self._counts = [0] * chunks
+        self._chunk = 0
+        self._last = None
+        self._started = False
+        self.reset_stats()
+
+    def __repr__(self):
+        return f"TraceRecorder(frames={self.frames}, dropped={self.dropped}, devices={len(self.pins)}, " + \
+               f"spi={self.spi})"
+
+    def reset_stats(self):
+        """
+        Zero the statistics.
+        """
+        self.frames: int = 0
+        self.dropped: int = 0
+        self.bytes_written: int = 0
+
+    def init(self, *args, **kwargs):
+        """
+        Initialise the traced bus, see machine.SPI.init().
+        """
+        self.spi.init(*args, **kwargs)
+
+    def pin(self, pin) -> TracePin:
+        """
+        Wrap the chip-select pin of a device, so its frames are recorded with its device number.
+        Devices are numbered in the order their pins are wrapped, from 0.
+        :param pin: pin number, or an output Pin-like callable
+        :return: the pin to use as the select_pin of the device
+        """
+        if len(self.pins) == NO_DEVICE:
+            raise ValueError(f"at most {NO_DEVICE} devices can be traced")
+        if isinstance(pin, int):
+            from machine import Pin
+            pin = Pin(pin, mode=Pin.OUT, value=1)
+        pin = TracePin(self, pin, len(self.pins))
+        self.pins.append(pin)
+        return pin
+
+    def write_readinto(self, write_buf, read_buf):
+        """
+        Clock write_buf out to the traced bus while reading the response into read_buf, and record the frame.
+        """
+        start = self.clock()
+        failed = True
+        try:
+            self.spi.write_readinto(write_buf, read_buf)
+            failed = False
+        finally:
+            self._record(start, write_buf, read_buf, failed)
+
+    def flush(self):
+        """
+        Write the frames recorded since the last chunk was written to the sink.
+        """
+        if self.sink is not None:
+            self._write_chunk(self._chunk)
+
+    def save(self, stream):
+        """
+        Write the frames held, oldest first, as a trace, leaving them held.
+        :param stream: stream written to, e.g. a file opened for binary writing
+        """
+        stream.write(_TRACE_HEADER)
+        n = len(self._chunks)
+        for i in range(1, n + 1):
+            chunk = (self._chunk + i) % n
+            if self._lengths[chunk]:
+                stream.write(self._views[chunk][:self._lengths[chunk]])
+
+    def _record(self, time: int, tx, rx, failed: bool):
+        """
+        Append a frame to the chunk being filled, moving on to the next if it is full.
+        """
+        n = len(tx)
+        size = RECORD_HEADER_SIZE + 2 * n
+        buf = self._chunks[self._chunk]
+        if size > len(buf):
+            self.dropped += 1
+            return
+        if self._lengths[self._chunk] + size > len(buf):
+            self._next_chunk()
+            buf = self._chunks[self._chunk]
+        delta = 0 if self._last is None else ticks_diff(time, self._last)
+        self._last = time
+        if delta < 0:
+            delta = 0
+        elif delta > 0xFFFFFFFF:
+            delta = 0xFFFFFFFF
+        pos = self._lengths[self._chunk]
+        buf[pos] = delta & 0xFF
+        buf[pos + 1] = delta >> 8 & 0xFF
+        buf[pos + 2] = delta >> 16 & 0xFF
+        buf[pos + 3] = delta >> 24
+        buf[pos + 4] = n & 0xFF
+        buf[pos + 5] = n >> 8
+        buf[pos + 6] = self.device
+        buf[pos + 7] = FLAG_FAILED if failed else 0
+        pos += RECORD_HEADER_SIZE
+        i = 0
+        while i < n:
+            buf[pos + i] = tx[i]
+            buf[pos + n + i] = rx[i]
+            i += 1
+        self._lengths[self._chunk] = pos + 2 * n
+        self._counts[self._chunk] += 1
+        self.frames += 1
+
+    def _next_chunk(self):
+        """
+        Write the full chunk to the sink, if any, and move on to the next, discarding its frames.
+        """
+        if self.sink is not None:
+            self._write_chunk(self._chunk)
+        self._chunk = (self._chunk + 1) % len(self._chunks)
+        self.dropped += self._counts[self._chunk]
+        self._lengths[self._chunk] = 0
+        self._counts[self._chunk] = 0
+
+    def _write_chunk(self, chunk: int):
+        """
+        Write the frames of a chunk to the sink, and empty it.
+        """
+        if not self._started:
+            self.sink.write(_TRACE_HEADER)
+            self.bytes_written += len(_TRACE_HEADER)
+            self._started = True
+        length = self._lengths[chunk]
+        if length:
+            self.sink.write(self._views[chunk][:length])
+            self.bytes_written += length
+        self._lengths[chunk] = 0
+        self._counts[chunk] = 0
+
+
+def read_trace(data):
+    """
+    Decode the frames of a trace, written by TraceRecorder. A trace cut short, e.g. by a power
+    failure, is decoded up to its last complete frame.
+    :param data: bytes of the trace, e.g. read from its file
+    :return: iterator of TraceFrame
+    """
+    if bytes(data[:len(_TRACE_HEADER)]) != _TRACE_HEADER:
+        raise ValueError("not an MCP4XXX trace, or of another version")
+    data = memoryview(data)
+    pos = len(_TRACE_HEADER)
+    time = None
+    while pos + RECORD_HEADER_SIZE <= len(data):
+        n = data[pos + 4] | data[pos + 5] << 8
+        end = pos + RECORD_HEADER_SIZE + 2 * n
+        if end > len(data):
+            return
+        delta = data[pos] | data[pos + 1] << 8 | data[pos + 2] << 16 | data[pos + 3] << 24
+        # The first frame held may follow frames that were overwritten, so times start from it.
+        time = 0 if time is None else time + delta
+        tx = pos + RECORD_HEADER_SIZE
+        yield TraceFrame(time, data[pos + 6], bytes(data[tx:tx + n]), bytes(data[tx + n:end]),
+                         bool(data[pos + 7] & FLAG_FAILED))
+        pos = end
+
+
+def decode_frame(tx, rx) -> list:
+    """
+    Decode the commands of a frame.
+    :param tx: encoded commands
+    :param rx: response
+    :return: list of TraceCommand
+    """
+    commands = []
+    n = len(tx)
+    pos = 0
+    while pos < n:
+        address = tx[pos] >> 4
+        command = tx[pos] >> 2 & 0b11
+        accepted = bool(rx[pos] & CMDERR_MASK)
+        data = None
+        if command == COMMAND_INCREMENT or command == COMMAND_DECREMENT:
+            pos += 1
+        else:
+            source = rx if command == COMMAND_READ else tx
+            if pos + 1 < n and (accepted or command != COMMAND_READ):
+                data = (source[pos] & DATA_MASK) << 8 | source[pos + 1]
+            pos += 2
+        commands.append(TraceCommand(address, command, data, accepted))
+    return commands
+
+
+class TraceReplayer:
+    """
+    Re-sends the frames of a trace through MCP4XXX devices, e.g. on a SimulatedSPI, to compare
+    driver versions on recorded traffic:
+
+        replayer = TraceReplayer(open("trace.bin", "rb").read())
+        spi = SimulatedSPI()
+        replayer.run({0: MCP4XXX(spi=spi, select_pin=spi.attach(SimulatedDevice()))})
+        print(replayer.elapsed_us, replayer.mismatches)
+
+    Each frame is sent with the _transfer_frame() of the device for its device number, so it goes
+    through the device's bus lock, chip select, monitor and error policy, and the response is
+    compared with the one recorded. For a dual or quad pot device use its pot0. The trace is
+    decoded up front, so decoding is not timed.
+
+    frames      - number of frames replayed
+    skipped     - number of frames not replayed, as they failed when recorded or have no device
+    mismatches  - number of frames whose response differed from the one recorded
+    rejected    - number of frames the device rejected a command of
+    elapsed_us  - time spent sending the frames replayed
+    """
+
+    def __init__(self, trace):
+        """
+        :param trace: bytes of the trace, see read_trace()
+        """
+        self.trace = list(read_trace(trace))
+        longest = max([len(frame.tx) for frame in self.trace], default=0)
+        rx = memoryview(bytearray(longest))
+        # A view of each length, so that frames are replayed without allocating.
+        self._views = [rx[:n] for n in range(longest + 1)]
+        self.reset_stats()
+
+    def __repr__(self):
+        return f"TraceReplayer(frames={len(self.trace)})"
+
+    def reset_stats(self):
+        """
+        Zero the statistics.
+        """
+        self.frames: int = 0
+        self.skipped: int = 0
+        self.mismatches: int = 0
+        self.rejected: int = 0
+        self.elapsed_us: int = 0
+
+    def run(self, devices, realtime: bool = False, clock=ticks_us) -> int:
+        """
+        Replay the trace.
+        :param devices: MCP4XXX to replay the frames of each device number through, a dict or list
+        :param realtime: True to keep the recorded spacing of the frames, False to send them back to back
+        :param clock: microsecond clock, time.ticks_us by default
+        :return: number of frames replayed
+        """
+        start = clock()
+        replayed = 0
+        for frame in self.trace:
+            device = devices.get(frame.device) if isinstance(devices, dict) else \
+                devices[frame.device] if frame.device < len(devices) else None
+            if device is None or frame.failed:
+                self.skipped += 1
+                continue
+            if realtime:
+                wait = frame.time_us - ticks_diff(clock(), start)
+                if wait > 0:
+                    sleep_us(wait)
+            rx = self._views[len(frame.tx)]
+            sent = clock()
+            try:
+                ok = device._transfer_frame(frame.tx, rx)
+            except CommandError:
+                ok = False
+            self.elapsed_us += ticks_diff(clock(), sent)
+            replayed += 1
+            if not ok:
+                self.rejected += 1
+            for i in range(len(rx)):
+                if rx[i] != frame.rx[i]:
+                    self.mismatches += 1
+                    break
+        self.frames += replayed
+        return replayed
@@ -0,0 +1,142 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * Tuning of the SPI clock rate of a bus of MCP4XXX devices.
+ *
+ * Please see README.md for more information.
+"""
+try:
+    from collections import namedtuple
+except ImportError:
+    from ucollections import namedtuple
+
+from mcp4xxx import COMMAND_READ
+from mcp4xxx import COMMAND_WRITE
+from mcp4xxx import DATA_MASK_WORD
+from mcp4xxx import ErrorPolicy
+
+# Clock rates tried by tune_baudrate(), up to the 10 MHz maximum of the MCP4XXX range.
+BAUDRATES = (250_000, 500_000, 1_000_000, 2_000_000, 4_000_000, 5_000_000, 8_000_000, 10_000_000)
+# Alternating bit patterns written to the wipers, within max_value(), and TCON registers.
+WIPER_PATTERNS = (0x000, 0x055, 0x0AA, 0x100)
+TCON_PATTERNS = (0x55, 0xAA, 0xFF)
+
+# Result of tune_baudrate(). baudrate is the rate set, fastest the fastest rate that passed and
+# failed the first rate that did not, None if every rate passed.
+TuneResult = namedtuple("TuneResult", ("baudrate", "fastest", "failed"))
+
+
+def tune_baudrate(devices, baudrates=BAUDRATES, margin: float = 0.25, repeats: int = 4, path=None) -> TuneResult:
+    """
+    Find the fastest SPI clock rate the devices on a bus work reliably at, and set the bus to it
+    less a safety margin. If every rate passes the fastest is set as is, as it is not the limit
+    of the board.
+
+    The rates are tried in ascending order until one fails. At each rate every pot's wiper and
+    TCON register is written with alternating bit patterns and read back, repeats times, and
+    fails if a value read back differs or the device rejects a command with CMDERR. The state of
+    the devices is taken before tuning and restored after, at the rate set, but the outputs of
+    the pots follow the patterns while tuning, so tune before the outputs are in use.
+
+    :param devices: MCP4XXX, MCP42XX or MCP43XX, or a list of them, sharing one SPI bus
+    :param baudrates: rates to try, in ascending order
+    :param margin: fraction the fastest rate that passed is reduced by
+    :param repeats: number of times the patterns are written and read back at each rate
+    :param path: file the rate set is saved to, see load_baudrate(), None to not save it
+    :return: TuneResult
+    :exception: OSError if no rate passed, the bus is left at the slowest rate and the state restored
+    """
+    if not isinstance(devices, (list, tuple)):
+        devices = [devices]
+    spi = devices[0].spi
+    pots = []
+    for device in devices:
+        pots.extend(getattr(device, "pots", (device,)))
+    states = [device.snapshot() for device in devices]
+    policies = [(pot.error_policy, pot.command_errors) for pot in pots]
+    fastest = None
+    failed = None
+    try:
+        for pot in pots:
+            pot.error_policy = ErrorPolicy.COUNT
+        for baudrate in baudrates:
+            spi.init(baudrate=baudrate)
+            if not _check(pots, repeats):
+                failed = baudrate
+                break
+            fastest = baudrate
+    finally:
+        for i in range(len(pots)):
+            pots[i].error_policy, pots[i].command_errors = policies[i]
+        if fastest is None:
+            baudrate = baudrates[0]
+        else:
+            baudrate = int(fastest * (1 - margin)) if failed is not None else fastest
+        # Restored on failure too, as the patterns shut the devices down and disconnect their wipers.
+        spi.init(baudrate=baudrate)
+        for i in range(len(devices)):
+            devices[i].invalidate_cache()
+            if states[i] is not None:
+                devices[i].restore(states[i])
+    if fastest is None:
+        raise OSError(f"no reliable SPI clock rate, {baudrates[0]} Hz failed")
+    if path is not None:
+        save_baudrate(path, baudrate)
+    return TuneResult(baudrate, fastest, failed)
+
+
+def save_baudrate(path, baudrate: int):
+    """
+    Save a tuned clock rate, so it is used without tuning again on the next boot, see load_baudrate().
+    """
+    with open(path, "w") as f:
+        f.write(f"{baudrate}\n")
+
+
+def load_baudrate(path, default: int = 250_000) -> int:
+    """
+    Load a clock rate saved by tune_baudrate() or save_baudrate():
+
+        spi = SPI(0)
+        spi.init(baudrate=load_baudrate("spi_baudrate.txt"))
+
+    :param path: file the rate was saved to
+    :param default: rate returned if no rate was saved
+    :return: the clock rate
+    """
+    try:
+        with open(path) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return default
+
+
+def _check(pots, repeats: int) -> bool:
+    """
+    Write the patterns to the wiper and TCON register of each pot and read them back.
+    :return: True if every value was read back, False if one differed or a command was rejected
+    """
+    for _ in range(repeats):
+        for pot in pots:
+            for pattern in WIPER_PATTERNS:
+                if pattern <= pot.max_value() and \
+                        not _write_read(pot, pot._wiper_address, pattern, pattern, DATA_MASK_WORD):
+                    return False
+            # Only the bits of the pot are checked, those of a missing pot read as 1.
+            mask = 0x0F << pot._tcon_shift
+            for pattern in TCON_PATTERNS:
+                if not _write_read(pot, pot._tcon_address, 0x100 | pattern, pattern & mask, mask):
+                    return False
+    return True
+
+
+def _write_read(pot, address: int, value: int, expected: int, mask: int) -> bool:
+    """
+    Write a register and read it back.
+    :return: True if the value read back, masked, is expected
+    """
+    if not pot._send(address, COMMAND_WRITE, value):
+        return False
+    resp = pot._transfer(address, COMMAND_READ, DATA_MASK_WORD)
+    return resp is not None and ((resp[0] << 8 | resp[1]) & mask) == expected
@@ -0,0 +1,197 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <rockwren@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+"""
+ * Plays sequences of wiper positions on an MCP4XXX, using it as a crude DAC or attenuator.
+ *
+ * Please see README.md for more information.
+"""
+from mcp4xxx import sleep_us
+from mcp4xxx import ticks_diff
+from mcp4xxx import ticks_us
+
+try:
+    from time import ticks_add
+except ImportError:
+    def ticks_add(ticks: int, delta: int) -> int:
+        return ticks + delta
+
+
+class PlaybackStats:
+    """
+    Outcome of WaveformPlayer.play().
+
+    samples     - number of wiper positions sent
+    frames      - number of chip-select frames sent
+    elapsed_us  - time taken to play the sequence
+    underruns   - number of samples sent a whole sample period or more after they were due
+    errors      - number of frames rejected by the device, with the COUNT error policy
+    """
+
+    def __init__(self):
+        self.samples: int = 0
+        self.frames: int = 0
+        self.elapsed_us: int = 0
+        self.underruns: int = 0
+        self.errors: int = 0
+
+    def __repr__(self):
+        return f"PlaybackStats(samples={self.samples}, frames={self.frames}, " + \
+               f"elapsed_us={self.elapsed_us}, underruns={self.underruns}, errors={self.errors}, rate={self.rate():.1f})"
+
+    def rate(self) -> float:
+        """
+        :return: achieved sample rate in samples per second
+        """
+        return self.samples * 1_000_000 / self.elapsed_us if self.elapsed_us > 0 else 0.0
+
+
+class WaveformPlayer:
+    """
+    Plays a sequence of wiper positions, e.g. an array('H') or a generator, on a device.
+
+    Samples are encoded chunk by chunk into a frame buffer from the device's precomputed write
+    frames, so long sequences are streamed without being held in memory and the send loop does
+    not allocate.
+
+    With a sample rate each sample is sent in its own chip-select frame when it is due. The
+    sample times are paced by the tick source if one is given, otherwise by the clock. A sample
+    sent a whole period or more late is counted as an underrun and the schedule restarts from it.
+    Underruns are only detected when pacing by the clock.
+
+    Without a sample rate each chunk is sent as fast as possible in a single chip-select frame.
+    """
+
+    def __init__(self, device, rate: float = None, chunk: int = 64, tick=None, clock=ticks_us):
+        """
+        :param device: MCP4XXX to play the samples on
+        :param rate: target sample rate in samples per second, None for as fast as possible
+        :param chunk: number of samples encoded at a time
+        :param tick: callable that returns when the next sample is due, e.g. waiting on a hardware
+                     timer, None to pace samples with the clock
+        :param clock: microsecond clock, time.ticks_us by default
+        """
+        self.device = device
+        self.rate = rate
+        self.tick = tick
+        self.clock = clock
+        self._stop = False
+        self._deadline = 0
+        # Offset in the frame buffer of the last sample sent.
+        self._last = -1
+        self._chunk = chunk
+        self._tx = bytearray(2 * chunk)
+        self._rx = bytearray(2 * chunk)
+        tx = memoryview(self._tx)
+        rx = memoryview(self._rx)
+        self._tx_chunk = tx
+        self._rx_chunk = rx
+        # One view per sample, so that sending a sample does not allocate.
+        self._tx_samples = [tx[2 * i:2 * i + 2] for i in range(chunk)]
+        self._rx_sample = rx[:2]
+
+    def stop(self):
+        """
+        Stop playback after the current sample, e.g. from another thread or a timer callback.
+        """
+        self._stop = True
+
+    def play(self, samples, loops: int = 1) -> PlaybackStats:
+        """
+        Play a sequence of wiper positions.
+
+        :param samples: wiper positions, positions outside 0..max_value() are clamped
+        :param loops: number of times to play the sequence, 0 to loop until stop() is called.
+                      Looping requires a sequence that can be iterated repeatedly, not an iterator.
+        :return: playback statistics
+        :exception: ValueError if samples is an empty sequence
+        """
+        if loops != 1 and iter(samples) is samples:
+            raise ValueError("looping requires a sequence, not an iterator")
+        self._stop = False
+        self._last = -1
+        stats = PlaybackStats()
+        start = self.clock()
+        self._deadline = start
+        # A sequence that fits in one chunk is only encoded once.
+        count = -1
+        if hasattr(samples, "__len__") and len(samples) <= self._chunk:
+            count = self._encode(iter(samples))
+            if count == 0:
+                raise ValueError("no samples to play")
+        loop = 0
+        while not self._stop and (loops == 0 or loop < loops):
+            if count >= 0:
+                self._send(count, stats)
+            else:
+                it = iter(samples)
+                n = self._encode(it)
+                if n == 0:
+                    # Nothing to play, e.g. an exhausted iterator, so the bus is not touched.
+                    break
+                while not self._stop and n:
+                    self._last = -1
+                    self._send(n, stats)
+                    n = self._encode(it)
+            loop += 1
+        stats.elapsed_us = ticks_diff(self.clock(), start)
+
+        cache = self.device.wiper_cache
+        if cache is not None and stats.samples:
+            if self._last >= 0 and not stats.errors:
+                cache.value = self._tx[self._last + 1] | (self._tx[self._last] & 0b00000001) << 8
+            else:
+                cache.invalidate()
+        return stats
+
+    def _encode(self, it) -> int:
+        """
+        Encode up to a chunk of samples from an iterator into the frame buffer.
+        :return: number of samples encoded
+        """
+        frames = self.device._frames
+        max_value = self.device.max_value()
+        tx = self._tx
+        n = 0
+        for value in it:
+            value = max(0, min(value, max_value))
+            tx[2 * n] = frames[2 * value]
+            tx[2 * n + 1] = frames[2 * value + 1]
+            n += 1
+            if n == self._chunk:
+                break
+        return n
+
+    def _send(self, n: int, stats: PlaybackStats):
+        """
+        Send n encoded samples from the frame buffer.
+        """
+        device = self.device
+        if self.rate is None:
+            if not device._transfer_frame(self._tx_chunk[:2 * n], self._rx_chunk[:2 * n]):
+                stats.errors += 1
+            self._last = 2 * (n - 1)
+            stats.samples += n
+            stats.frames += 1
+            return
+
+        period = int(1_000_000 / self.rate)
+        clock = self.clock
+        for i in range(n):
+            if self.tick is not None:
+                self.tick()
+            else:
+                late = ticks_diff(clock(), self._deadline)
+                if late >= period:
+                    stats.underruns += 1
+                    self._deadline = clock()
+                elif late < 0:
+                    sleep_us(-late)
+            if self._stop:
+                return
+            if not device._transfer_frame(self._tx_samples[i], self._rx_sample):
+                stats.errors += 1
+            self._last = 2 * i
+            self._deadline = ticks_add(self._deadline, period)
+            stats.samples += 1
+            stats.frames += 1
@@ -17,5 +17,5 @@
     maintainer_email="code@crighton.nz",
     license="MIT",
     license_files="LICENSES",
-    py_modules=["mcp4xxx"]
+    py_modules=["mcp4xxx", "mcp4xxx_async", "mcp4xxx_bus", "mcp4xxx_calibration", "mcp4xxx_debug", "mcp4xxx_eeprom", "mcp4xxx_i2c", "mcp4xxx_metrics", "mcp4xxx_setpoint", "mcp4xxx_sim", "mcp4xxx_trace", "mcp4xxx_tune", "mcp4xxx_wave"]
 )
@@ -0,0 +1,38 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import unittest
+
+import test_mcp4xxx  # noqa: F401 installs the machine module stand-in
+
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def test_run(self):
+        import bench_mcp4xxx
+        results = bench_mcp4xxx.run(10)
+        self.assertEqual(len(bench_mcp4xxx.CONFIGS) * 18, len(results))
+        by_op = {(r["config"], r["op"]): r for r in results}
+        set_ = by_op[("8bit-potentiometer", "set")]
+        self.assertEqual(2.0, set_["bytes_per_op"])
+        self.assertEqual(1.0, set_["selects_per_op"])
+        self.assertEqual(0, set_["alloc_bytes"])
+        self.assertEqual(4.0, by_op[("7bit-rheostat", "set_both")]["bytes_per_op"])
+        self.assertEqual(1.0, by_op[("7bit-rheostat", "batch_4")]["selects_per_op"])
+
+    def test_compare(self):
+        from bench_mcp4xxx import compare
+        baseline = [{"config": "c", "op": "set", "ops_per_sec": 1000.0, "bytes_per_op": 2.0,
+                     "selects_per_op": 1.0, "transfers_per_op": 1.0, "bus_us_per_op": 65.0, "alloc_bytes": 0}]
+        same = [dict(baseline[0], ops_per_sec=850.0)]
+        self.assertEqual([], compare(baseline, same, tolerance=0.2))
+        slower = [dict(baseline[0], ops_per_sec=700.0, alloc_bytes=16)]
+        regressions = compare(baseline, slower, tolerance=0.2)
+        self.assertEqual(2, len(regressions))
+        self.assertIn("ops_per_sec", regressions[0])
+        self.assertIn("alloc_bytes", regressions[1])
+        self.assertEqual([], compare(baseline, [dict(baseline[0], op="new")]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 # SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
 #
 # SPDX-License-Identifier: MIT
+import threading
+import time
+import tracemalloc
 import unittest
 from unittest import mock
 from unittest.mock import MagicMock
@@ -92,6 +95,65 @@ def write_readinto(write_buf, read_buf):
         read_buf[1] = tcon
 
 
+class FakeSPI:
+    """ SPI stand-in that does not allocate, unlike mock.Mock """
+
+    def write_readinto(self, write_buf, read_buf):
+        write_readinto(write_buf, read_buf)
+
+
+class FrameSPI:
+    """ SPI stand-in that splits a frame of back to back commands and counts the frames """
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        # Each command is copied through these, so that splitting a frame does not allocate.
+        self._tx = bytearray(2)
+        self._rx = bytearray(2)
+
+    def write_readinto(self, write_buf, read_buf):
+        self.frames += 1
+        self.bytes += len(write_buf)
+        pos = 0
+        while pos < len(write_buf):
+            command = (write_buf[pos] & 0b00001100) >> 2
+            n = 1 if command == 0b01 or command == 0b10 else 2
+            self._tx[0] = write_buf[pos]
+            if n == 2:
+                self._tx[1] = write_buf[pos + 1]
+            write_readinto(self._tx, self._rx)
+            read_buf[pos] = self._rx[0]
+            if n == 2:
+                read_buf[pos + 1] = self._rx[1]
+            pos += n
+
+
+class FakePin:
+    """ Select pin stand-in that does not allocate, unlike mock.MagicMock """
+
+    def __call__(self, value):
+        pass
+
+
+def _peak_allocation(fn, count) -> int:
+    fn()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        for _ in range(count):
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - start
+
+
+def allocations(fn, count=100) -> int:
+    """ Return the bytes fn allocates on the heap while being called count times """
+    return _peak_allocation(fn, count) - _peak_allocation(lambda: None, count)
+
+
 spi_mock = mock.Mock()
 spi_mock.write_readinto = write_readinto
 
@@ -209,5 +271,617 @@ def test_pot1_terminal_b_status(self):
         self.assertEqual(True, self.pot1.get_terminal_b_status())
 
 
+class Mcp4xxxFrameTableTestCase(unittest.TestCase):
+
+    def test_frames_match_build_command(self):
+        from mcp4xxx import MCP4XXX, Pot, Resolution, WiperConfiguration, COMMAND_WRITE, wiper_frames
+        for pot in (Pot.POT_0, Pot.POT_1):
+            for resolution in (Resolution.RES_7BIT, Resolution.RES_8BIT):
+                for config in (WiperConfiguration.RHEOSTAT, WiperConfiguration.POTENTIOMETER):
+                    device = MCP4XXX(spi=FakeSPI(), pot=pot, resolution=resolution, config=config)
+                    frames = wiper_frames(pot, device.max_value())
+                    self.assertIs(frames, device._frames)
+                    self.assertEqual(2 * (device.max_value() + 1), len(frames))
+                    buf = bytearray(2)
+                    for value in range(device.max_value() + 1):
+                        device._build_command(buf, 0, pot, COMMAND_WRITE, value)
+                        self.assertEqual(buf, frames[2 * value:2 * value + 2])
+
+    def test_set_clamps_to_table(self):
+        from mcp4xxx import MCP4XXX, Resolution
+        device = MCP4XXX(spi=FakeSPI(), resolution=Resolution.RES_7BIT)
+        device.set(-1)
+        self.assertEqual(0, device.get())
+        device.set(129)
+        self.assertEqual(128, device.get())
+
+
+class Mcp4xxxAllocationTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX, Pot
+        self.pot0 = MCP4XXX(spi=FakeSPI())
+        self.pot0.m_select.pin = FakePin()
+        self.pot1 = MCP4XXX(spi=FakeSPI(), pot=Pot.POT_1)
+        self.pot1.m_select.pin = FakePin()
+
+    def test_set_get_does_not_allocate(self):
+        # CPython boxes ints above 256, so the frame table offsets of positions above 127 allocate
+        # under CPython. They are small ints, which do not allocate, on MicroPython.
+        def loop():
+            self.pot0.set(0)
+            self.pot0.get()
+            self.pot1.set(127)
+            self.pot1.get()
+        self.assertEqual(0, allocations(loop))
+
+    def test_set_get_both_does_not_allocate(self):
+        from mcp4xxx import MCP42XX
+        device = MCP42XX(spi=FrameSPI(), select_pin=FakePin())
+
+        def loop():
+            device.set_both(10, 127)
+            device.get_both()
+        # Few calls, as CPython allocates the FrameSPI counters above 256.
+        self.assertEqual(0, allocations(loop, count=20))
+
+    def test_increment_decrement_does_not_allocate(self):
+        def loop():
+            self.pot0.increment()
+            self.pot0.decrement()
+        self.assertEqual(0, allocations(loop))
+
+    def test_stream_steps_does_not_allocate(self):
+        from mcp4xxx import COMMAND_DECREMENT, COMMAND_INCREMENT, ErrorPolicy, MCP4XXX
+        # FakeSPI only answers the first command of a frame, so the responses are not checked.
+        pot = MCP4XXX(spi=FakeSPI(), select_pin=FakePin(), error_policy=ErrorPolicy.IGNORE)
+
+        def loop():
+            pot._stream_steps(COMMAND_INCREMENT, 20, 10)
+            pot._stream_steps(COMMAND_DECREMENT, 10)
+        self.assertEqual(0, allocations(loop))
+
+    def test_tcon_does_not_allocate(self):
+        def loop():
+            self.pot1.set_terminal_a_status(False)
+            self.pot1.get_terminal_a_status()
+            self.pot1.set_terminal_a_status(True)
+        self.assertEqual(0, allocations(loop))
+
+
+class Mcp4xxxBatchTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX
+        self.spi = FrameSPI()
+        self.pot0 = MCP4XXX(spi=self.spi)
+
+    def test_batch_is_one_frame(self):
+        from mcp4xxx import Pot
+        batch = self.pot0.batch()
+        batch.set(100)
+        batch.set(200, pot=Pot.POT_1)
+        batch.increment()
+        batch.decrement(pot=Pot.POT_1)
+        batch.decrement(pot=Pot.POT_1)
+        batch.get()
+        batch.get(pot=Pot.POT_1)
+        self.assertEqual([None, None, None, None, None, 101, 198], batch.execute())
+        self.assertEqual(1, self.spi.frames)
+
+    def test_batch_context_manager(self):
+        with self.pot0.batch() as batch:
+            batch.set(256)
+            batch.get()
+        self.assertEqual([None, 256], batch.results)
+
+    def test_batch_tcon(self):
+        from mcp4xxx import Pot
+        with self.pot0.batch() as batch:
+            batch.set_tcon(0b11110111)
+            batch.get_tcon()
+            batch.get_shutdown_status()
+            batch.get_shutdown_status(pot=Pot.POT_1)
+            batch.get_wiper_status()
+            batch.set_tcon(0b11111011)
+            batch.get_terminal_a_status()
+            batch.get_terminal_b_status()
+            batch.set_tcon(0b11111111)
+        self.assertEqual([None, 0b11110111, True, False, True, None, False, True, None], batch.results)
+        self.assertEqual(1, self.spi.frames)
+
+    def test_batch_grows_and_repeats(self):
+        batch = self.pot0.batch(size=2)
+        batch.set(0)
+        for _ in range(20):
+            batch.increment()
+        batch.get()
+        self.assertEqual(20, batch.execute()[-1])
+        self.assertEqual(20, batch.execute()[-1])
+        batch.clear()
+        self.assertEqual(0, len(batch))
+        self.assertEqual([], batch.execute())
+
+
+class Mcp4xxxTconCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX, Pot, RegisterCache
+        self.spi = FrameSPI()
+        self.cache = RegisterCache()
+        self.pot0 = MCP4XXX(spi=self.spi, tcon_cache=self.cache)
+        self.pot1 = MCP4XXX(spi=self.spi, pot=Pot.POT_1, tcon_cache=self.cache)
+        self.pot0._set_tcon(0xFF)
+
+    def test_set_status_is_one_write(self):
+        self.spi.frames = 0
+        self.pot0.set_shutdown_status(True)
+        self.pot1.set_terminal_a_status(False)
+        self.pot0.set_wiper_status(False)
+        self.assertEqual(3, self.spi.frames)
+        self.assertEqual(0b10110101, self.cache.value)
+        self.assertEqual(3, self.cache.saved)
+
+    def test_untrusted_get_reads_device(self):
+        global wiper_status1
+        wiper_status1 = False
+        self.spi.frames = 0
+        self.assertFalse(self.pot1.get_wiper_status())
+        self.assertEqual(1, self.spi.frames)
+        self.assertEqual(0b11011111, self.cache.value)
+
+    def test_trusted_get_is_served_from_cache(self):
+        self.cache.trusted = True
+        self.pot0.set_terminal_b_status(False)
+        self.spi.frames = 0
+        self.assertFalse(self.pot0.get_terminal_b_status())
+        self.assertTrue(self.pot1.get_terminal_b_status())
+        self.assertFalse(self.pot1.get_shutdown_status())
+        self.pot0.set_terminal_b_status(False)
+        self.assertEqual(0, self.spi.frames)
+
+    def test_invalidate_and_refresh(self):
+        self.pot1.invalidate_cache()
+        self.assertIsNone(self.cache.value)
+        self.spi.frames = 0
+        self.pot1.set_terminal_b_status(False)
+        self.assertEqual(2, self.spi.frames)
+        self.cache.value = 0
+        self.pot0.refresh_cache()
+        self.assertEqual(0b11101111, self.cache.value)
+
+    def test_batch_keeps_cache_coherent(self):
+        from mcp4xxx import Pot
+        self.spi.frames = 0
+        with self.pot0.batch() as batch:
+            batch.set_shutdown_status(True)
+            batch.set_wiper_status(False, pot=Pot.POT_1)
+            batch.get_tcon()
+            batch.get_shutdown_status()
+        self.assertEqual(1, self.spi.frames)
+        self.assertEqual([None, None, 0b11010111, True], batch.results)
+        self.assertEqual(0b11010111, self.cache.value)
+
+    def test_batch_set_status_without_cache(self):
+        from mcp4xxx import MCP4XXX
+        pot = MCP4XXX(spi=self.spi)
+        self.spi.frames = 0
+        with pot.batch() as batch:
+            batch.set_terminal_a_status(False)
+            batch.set_terminal_b_status(False)
+            batch.get_tcon()
+        self.assertEqual(2, self.spi.frames)
+        self.assertEqual(0b11111010, batch.results[-1])
+
+
+class Mcp4xxxWiperCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX
+        self.spi = FrameSPI()
+        self.pot0 = MCP4XXX(spi=self.spi, wiper_cache=True)
+
+    def test_redundant_set_is_skipped(self):
+        self.pot0.set(10)
+        self.pot0.set(10)
+        self.pot0.set(11)
+        self.assertEqual(2, self.spi.frames)
+        self.assertEqual(1, self.pot0.wiper_cache.saved)
+
+    def test_get_is_served_from_cache(self):
+        self.pot0.set(1000)
+        self.assertEqual(256, self.pot0.get())
+        self.assertEqual(1, self.spi.frames)
+
+    def test_get_reads_invalid_cache(self):
+        global wiper0
+        wiper0 = 42
+        self.assertEqual(42, self.pot0.get())
+        self.assertEqual(42, self.pot0.get())
+        self.assertEqual(1, self.spi.frames)
+
+    def test_increment_saturates_at_max_value(self):
+        from mcp4xxx import MCP4XXX, Resolution, WiperConfiguration
+        pot = MCP4XXX(spi=self.spi, resolution=Resolution.RES_7BIT, config=WiperConfiguration.RHEOSTAT,
+                      wiper_cache=True)
+        pot.set(126)
+        pot.increment()
+        pot.increment()
+        pot.increment()
+        self.assertEqual(127, pot.get())
+        self.assertEqual(2, self.spi.frames)
+        self.assertEqual(3, pot.wiper_cache.saved)
+
+    def test_decrement_saturates_at_0(self):
+        self.pot0.set(1)
+        self.pot0.decrement()
+        self.pot0.decrement()
+        self.assertEqual(0, self.pot0.get())
+        self.assertEqual(2, self.spi.frames)
+
+    def test_increment_with_invalid_cache(self):
+        self.pot0.increment()
+        self.assertIsNone(self.pot0.wiper_cache.value)
+        self.assertEqual(1, self.spi.frames)
+
+    def test_untrusted_cache_writes_and_reads(self):
+        from mcp4xxx import MCP4XXX, RegisterCache
+        pot = MCP4XXX(spi=self.spi, wiper_cache=RegisterCache())
+        pot.set(5)
+        pot.set(5)
+        self.assertEqual(5, pot.get())
+        self.assertEqual(3, self.spi.frames)
+
+    def test_invalidate_and_refresh(self):
+        global wiper0
+        self.pot0.set(7)
+        wiper0 = 9
+        self.pot0.invalidate_cache()
+        self.assertEqual(9, self.pot0.get())
+        wiper0 = 11
+        self.pot0.refresh_cache()
+        self.assertEqual(11, self.pot0.wiper_cache.value)
+
+    def test_batch_keeps_cache_coherent(self):
+        from mcp4xxx import Pot
+        with self.pot0.batch() as batch:
+            batch.set(20)
+            batch.increment()
+            batch.increment()
+            batch.decrement()
+            batch.set(100, pot=Pot.POT_1)
+        self.assertEqual(21, self.pot0.wiper_cache.value)
+        self.assertEqual(21, self.pot0.get())
+        self.assertEqual(1, self.spi.frames)
+
+
+class Mcp4xxxStepTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX
+        global wiper0
+        wiper0 = 10
+        self.spi = FrameSPI()
+        self.pot0 = MCP4XXX(spi=self.spi)
+        self.cached = MCP4XXX(spi=self.spi, wiper_cache=True)
+
+    def test_step_streams_in_one_frame(self):
+        self.pot0.step(10)
+        self.assertEqual((1, 10), (self.spi.frames, self.spi.bytes))
+        self.pot0.step(-3)
+        self.assertEqual((2, 13), (self.spi.frames, self.spi.bytes))
+        self.assertEqual(17, wiper0)
+
+    def test_step_saturates(self):
+        self.pot0.step(-300, steps_per_frame=100)
+        self.assertEqual((3, 300), (self.spi.frames, self.spi.bytes))
+        self.assertEqual(0, wiper0)
+
+    def test_cached_step_writes_when_cheaper(self):
+        self.cached.set(10)
+        self.cached.step(100)
+        self.assertEqual((2, 4), (self.spi.frames, self.spi.bytes))
+        self.assertEqual(110, wiper0)
+        self.assertEqual(110, self.cached.get())
+
+    def test_cached_step_streams_when_cheaper(self):
+        self.cached.set(10)
+        self.cached.step(-2)
+        self.assertEqual((2, 4), (self.spi.frames, self.spi.bytes))
+        self.cached.step(3, steps_per_frame=1)
+        self.assertEqual((3, 6), (self.spi.frames, self.spi.bytes))
+        self.assertEqual(11, wiper0)
+
+    def test_cached_step_is_clamped(self):
+        self.cached.set(255)
+        self.cached.step(2)
+        self.cached.step(5)
+        self.assertEqual((2, 3), (self.spi.frames, self.spi.bytes))
+        self.assertEqual(256, self.cached.get())
+
+    def test_ramp_to_passes_through_every_position(self):
+        self.pot0.ramp_to(50, steps_per_frame=8)
+        self.assertEqual((6, 42), (self.spi.frames, self.spi.bytes))
+        self.assertEqual(50, wiper0)
+        self.pot0.ramp_to(-5)
+        self.assertEqual(0, wiper0)
+
+    def test_cached_ramp_to(self):
+        self.cached.set(200)
+        self.cached.ramp_to(180, steps_per_frame=10)
+        self.assertEqual((3, 22), (self.spi.frames, self.spi.bytes))
+        self.assertEqual(180, wiper0)
+        self.assertEqual(180, self.cached.get())
+
+
+class Mcp42xxTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP42XX
+        self.spi = FrameSPI()
+        self.device = MCP42XX(spi=self.spi)
+
+    def test_channels_share_select_and_tcon(self):
+        self.assertIs(self.device.pot0.m_select, self.device.pot1.m_select)
+        self.assertIs(self.device.pot0.tcon_cache, self.device.pot1.tcon_cache)
+        self.assertIs(self.spi, self.device.pot1.spi)
+
+    def test_set_both_is_one_frame(self):
+        self.device.set_both(100, 1000)
+        self.assertEqual((1, 4), (self.spi.frames, self.spi.bytes))
+        self.assertEqual((100, 256), (wiper0, wiper1))
+
+    def test_get_both_is_one_frame(self):
+        self.device.pot0.set(7)
+        self.device.pot1.set(8)
+        self.spi.frames = 0
+        self.assertEqual((7, 8), self.device.get_both())
+        self.assertEqual(1, self.spi.frames)
+
+    def test_cached_set_both_skips_unchanged_wiper(self):
+        from mcp4xxx import MCP42XX
+        device = MCP42XX(spi=self.spi, wiper_cache=True)
+        self.assertIsNot(device.pot0.wiper_cache, device.pot1.wiper_cache)
+        device.set_both(1, 2)
+        device.set_both(1, 3)
+        device.set_both(1, 3)
+        self.assertEqual((2, 6), (self.spi.frames, self.spi.bytes))
+        self.assertEqual((1, 3), device.get_both())
+        self.assertEqual(2, self.spi.frames)
+
+    def test_tcon_is_read_and_written_once(self):
+        self.device.set_tcon(0b01110111)
+        self.assertEqual(1, self.spi.frames)
+        self.assertTrue(self.device.pot0.get_shutdown_status())
+        self.assertTrue(self.device.pot1.get_shutdown_status())
+        self.device.pot0.set_shutdown_status(False)
+        self.device.pot1.set_terminal_b_status(False)
+        self.assertEqual(0b01101111, self.device.get_tcon())
+
+    def test_batch_spans_both_pots(self):
+        from mcp4xxx import Pot
+        with self.device.batch() as batch:
+            batch.set(30)
+            batch.set(40, pot=Pot.POT_1)
+            batch.get(pot=Pot.POT_1)
+        self.assertEqual([None, None, 40], batch.results)
+        self.assertEqual(1, self.spi.frames)
+
+
+class SelectCountingPin:
+    """ Select pin stand-in that counts the times it is driven LOW """
+
+    def __init__(self):
+        self.selects = 0
+
+    def __call__(self, value):
+        if not value:
+            self.selects += 1
+
+
+class SlowSPI(FrameSPI):
+    """ FrameSPI that yields to other threads mid frame, and detects overlapping frames """
+
+    def __init__(self):
+        super().__init__()
+        self.active = False
+        self.overlaps = 0
+
+    def write_readinto(self, write_buf, read_buf):
+        if self.active:
+            self.overlaps += 1
+        self.active = True
+        time.sleep(0.0001)
+        super().write_readinto(write_buf, read_buf)
+        self.active = False
+
+
+class Mcp4xxxTransactionTestCase(unittest.TestCase):
+
+    def test_transaction_holds_select(self):
+        from mcp4xxx import MCP4XXX
+        pin = SelectCountingPin()
+        pot = MCP4XXX(spi=FrameSPI(), select_pin=pin)
+        with pot.transaction():
+            pot.set(pot.get() + 1)
+            pot.increment()
+        self.assertEqual(1, pin.selects)
+
+    def test_devices_share_bus_lock(self):
+        from mcp4xxx import MCP4XXX, MCP42XX, bus_lock
+        spi = FrameSPI()
+        pot = MCP4XXX(spi=spi, lock=True)
+        device = MCP42XX(spi=spi, select_pin=5, lock=True)
+        self.assertIs(bus_lock(spi), pot.lock)
+        self.assertIs(pot.lock, device.pot0.lock)
+        self.assertIs(pot.lock, device.pot1.lock)
+        self.assertIsNone(MCP4XXX(spi=spi).lock)
+
+    def test_default_bus_lock_does_not_touch_the_bus(self):
+        import mcp4xxx
+        from mcp4xxx import MCP4XXX, bus_lock
+        pot = MCP4XXX(lock=True)
+        self.assertIsNone(pot._spi)
+        self.assertIs(bus_lock(mcp4xxx._default_spi()), pot.lock)
+
+    def test_lock_is_reentrant_and_counts_acquisitions(self):
+        from mcp4xxx import MCP4XXX
+        pot = MCP4XXX(spi=FrameSPI(), lock=True)
+        pot.lock.reset_stats()
+        with pot.transaction():
+            pot.set_wiper_status(True)
+            pot.get()
+        self.assertEqual(1, pot.lock.acquisitions)
+        self.assertGreaterEqual(pot.lock.hold_us, 0)
+
+    def test_transactions_are_atomic_across_threads(self):
+        from mcp4xxx import MCP4XXX
+        global wiper0
+        wiper0 = 0
+        spi = SlowSPI()
+        pots = [MCP4XXX(spi=spi, select_pin=5, lock=True), MCP4XXX(spi=spi, select_pin=6, lock=True)]
+        pots[0].lock.reset_stats()
+
+        def work(pot):
+            for _ in range(20):
+                with pot.transaction():
+                    pot.set(pot.get() + 1)
+
+        threads = [threading.Thread(target=work, args=(pot,)) for pot in pots]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(40, wiper0)
+        self.assertEqual(0, spi.overlaps)
+        self.assertEqual(40, pots[0].lock.acquisitions)
+
+
+class Mcp4xxxFootprintTestCase(unittest.TestCase):
+
+    def test_instances_have_no_dict(self):
+        from mcp4xxx import ChipSelect, MCP4XXX, RegisterCache
+        for obj in (MCP4XXX(spi=FrameSPI()), ChipSelect(None), RegisterCache()):
+            self.assertFalse(hasattr(obj, "__dict__"))
+
+    def test_default_spi_is_shared_and_initialised_on_first_use(self):
+        import mcp4xxx
+        from mcp4xxx import MCP4XXX, MCP42XX
+        mcp4xxx._spi = None
+        machine_mock.SPI.reset_mock()
+        pot = MCP4XXX()
+        device = MCP42XX()
+        machine_mock.SPI.assert_not_called()
+        pot.set(1)
+        machine_mock.SPI.assert_called_once_with(0)
+        self.assertIs(pot.spi, device.pot1.spi)
+
+    def test_tobinarystr(self):
+        from mcp4xxx_debug import tobinarystr
+        self.assertEqual("00000001 11111111", tobinarystr(bytearray([1, 255])))
+
+
+class Mcp4xxxCommandErrorTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX, Pot
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        self.spi = SimulatedSPI()
+        self.sim = SimulatedDevice()
+        pin = self.spi.attach(self.sim)
+        self.pot = MCP4XXX(spi=self.spi, select_pin=pin, wiper_cache=True)
+        # A single pot device has no pot 1, so rejects its commands.
+        self.missing = MCP4XXX(spi=self.spi, select_pin=self.pot.m_select, pot=Pot.POT_1, wiper_cache=True)
+
+    def test_success(self):
+        self.assertTrue(self.pot.set(10))
+        self.assertTrue(self.pot.increment())
+        self.assertTrue(self.pot.set_wiper_status(False))
+        self.assertEqual(0, self.pot.command_errors)
+
+    def test_raise(self):
+        from mcp4xxx import ADDRESS_POT1_WIPER, COMMAND_WRITE, CommandError
+        with self.assertRaises(CommandError) as cm:
+            self.missing.set(10)
+        self.assertEqual((ADDRESS_POT1_WIPER, COMMAND_WRITE, 0),
+                         (cm.exception.address, cm.exception.command, cm.exception.position))
+        self.assertIsNone(self.missing.wiper_cache.value)
+        self.assertEqual(1, self.missing.command_errors)
+        self.assertEqual(0, self.missing.m_select.nesting)
+
+    def test_count(self):
+        from mcp4xxx import ErrorPolicy
+        self.missing.error_policy = ErrorPolicy.COUNT
+        self.assertFalse(self.missing.set(10))
+        self.assertFalse(self.missing.increment())
+        self.assertFalse(self.missing.step(-3))
+        self.assertIsNone(self.missing.get())
+        self.assertIsNone(self.missing.wiper_cache.value)
+        self.assertEqual(4, self.missing.command_errors)
+
+    def test_ignore(self):
+        from mcp4xxx import ErrorPolicy
+        self.missing.error_policy = ErrorPolicy.IGNORE
+        self.assertTrue(self.missing.set(10))
+        self.assertEqual(0, self.missing.command_errors)
+
+    def test_retry(self):
+        from mcp4xxx import CommandError, ErrorPolicy
+        self.pot.error_policy = ErrorPolicy.RETRY
+        self.spi.write_readinto = self._glitch(self.spi.write_readinto, 2)
+        self.assertTrue(self.pot.set(10))
+        self.assertEqual(10, self.sim.wipers[0])
+        self.assertEqual(2, self.pot.command_errors)
+        self.assertEqual(3, self.spi.selects)
+
+        self.spi.write_readinto = self._glitch(self.spi.write_readinto, 3)
+        with self.assertRaises(CommandError):
+            self.pot.set(20)
+        self.assertEqual(5, self.pot.command_errors)
+
+    def test_retry_in_transaction(self):
+        from mcp4xxx import ErrorPolicy
+        self.pot.error_policy = ErrorPolicy.RETRY
+        self.spi.write_readinto = self._glitch(self.spi.write_readinto, 1)
+        with self.pot.transaction():
+            self.assertTrue(self.pot.set(10))
+            self.assertTrue(self.pot.increment())
+        self.assertEqual(11, self.sim.wipers[0])
+        # The retry ends the device's frame so it accepts commands again.
+        self.assertEqual(2, self.spi.selects)
+
+    def test_batch(self):
+        from mcp4xxx import ADDRESS_STATUS, COMMAND_WRITE, CommandError, ErrorPolicy
+        batch = self.pot.batch()
+        batch.set(5)
+        batch._queue(ADDRESS_STATUS, COMMAND_WRITE, 0)
+        batch.set(9)
+        with self.assertRaises(CommandError) as cm:
+            batch.execute()
+        self.assertEqual((1, 2), (cm.exception.index, cm.exception.position))
+        self.assertEqual(1, batch.rejected)
+        self.assertEqual(5, self.pot.wiper_cache.value)
+        self.assertEqual(5, self.sim.wipers[0])
+
+        self.pot.error_policy = ErrorPolicy.COUNT
+        batch = self.pot.batch()
+        batch.get()
+        batch._queue(ADDRESS_STATUS, COMMAND_WRITE, 0)
+        batch.get()
+        self.assertEqual([5, None, None], batch.execute())
+        self.assertEqual(1, batch.rejected)
+
+    def _glitch(self, write_readinto, count: int):
+        """ Wrap write_readinto to report the first count frames as rejected """
+        remaining = [count]
+
+        def glitched(write_buf, read_buf):
+            write_readinto(write_buf, read_buf)
+            if remaining[0]:
+                remaining[0] -= 1
+                read_buf[0] &= 0b11111101
+        return glitched
+
+
 if __name__ == '__main__':
     unittest.main()
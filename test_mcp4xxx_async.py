@@ -0,0 +1,102 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import asyncio
+import unittest
+
+import test_mcp4xxx
+from test_mcp4xxx import FrameSPI
+
+
+class RecordingSPI(FrameSPI):
+    """ FrameSPI that records the first command byte of each frame """
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def write_readinto(self, write_buf, read_buf):
+        super().write_readinto(write_buf, read_buf)
+        self.sent.append(write_buf[0])
+
+
+class AsyncMcp4xxxTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP42XX
+        from mcp4xxx_async import AsyncMCP4XXX
+        self.spi = RecordingSPI()
+        self.device = MCP42XX(spi=self.spi, wiper_cache=True)
+        self.pot0 = AsyncMCP4XXX(self.device.pot0, steps_per_chunk=10)
+        self.pot1 = AsyncMCP4XXX(self.device.pot1)
+
+    def test_pots_on_a_bus_share_a_lock(self):
+        from mcp4xxx_async import bus_lock
+        self.assertIs(self.pot0.lock, self.pot1.lock)
+        self.assertIs(bus_lock(self.spi), self.pot0.lock)
+        self.assertIsNot(bus_lock(FrameSPI()), self.pot0.lock)
+
+    def test_set_get(self):
+        async def run():
+            await self.pot0.set(100)
+            await self.pot0.increment()
+            await self.pot0.increment()
+            await self.pot0.decrement()
+            return await self.pot0.get()
+        self.assertEqual(101, asyncio.run(run()))
+        self.assertEqual(101, test_mcp4xxx.wiper0)
+
+    def test_tcon(self):
+        async def run():
+            await self.pot1.set_terminal_a_status(False)
+            await self.pot1.set_terminal_b_status(True)
+            await self.pot1.set_wiper_status(False)
+            await self.pot1.set_shutdown_status(True)
+            return (await self.pot1.get_terminal_a_status(), await self.pot1.get_terminal_b_status(),
+                    await self.pot1.get_wiper_status(), await self.pot1.get_shutdown_status())
+        self.assertEqual((False, True, False, True), asyncio.run(run()))
+
+    def test_ramp_yields_between_chunks(self):
+        async def ramp():
+            await self.pot0.set(0)
+            await self.pot0.ramp_to(35)
+
+        async def other():
+            for value in range(5):
+                await self.pot1.set(value + 1)
+
+        async def run():
+            await asyncio.gather(ramp(), other())
+        asyncio.run(run())
+        self.assertEqual(35, test_mcp4xxx.wiper0)
+        self.assertEqual(5, test_mcp4xxx.wiper1)
+        # The ramp is sent in 4 frames of increments, with the writes to pot 1 in between.
+        write0, write1, increment0 = 0b00000010, 0b00010010, 0b00000110
+        self.assertEqual([write0, write1, increment0, write1, increment0, write1, increment0, write1, increment0,
+                          write1], self.spi.sent)
+
+    def test_step_and_batch(self):
+        async def run():
+            await self.pot0.set(50)
+            await self.pot0.step(-25)
+            batch = self.device.batch()
+            batch.get()
+            return await self.pot0.execute(batch)
+        self.assertEqual([25], asyncio.run(run()))
+
+    def test_rejected_commands_return_false(self):
+        from mcp4xxx import ErrorPolicy, MCP4XXX, Pot
+        from mcp4xxx_async import AsyncMCP4XXX
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        spi = SimulatedSPI()
+        pin = spi.attach(SimulatedDevice())
+        # A single pot device has no pot 1, so rejects its commands.
+        missing = AsyncMCP4XXX(MCP4XXX(spi=spi, select_pin=pin, pot=Pot.POT_1, error_policy=ErrorPolicy.COUNT))
+
+        async def run():
+            return await missing.ramp_to(10), await missing.step(-3), await missing.set(10)
+        self.assertEqual((False, False, False), asyncio.run(run()))
+
+
+if __name__ == '__main__':
+    unittest.main()
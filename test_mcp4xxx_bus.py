@@ -0,0 +1,132 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import unittest
+
+import test_mcp4xxx
+from test_mcp4xxx import FrameSPI
+
+
+class SelectRecordingSPI(FrameSPI):
+    """ FrameSPI that records the bytes of each frame """
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def write_readinto(self, write_buf, read_buf):
+        super().write_readinto(write_buf, read_buf)
+        self.sent.append(bytes(write_buf))
+
+
+class SPIBusTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import Pot
+        from mcp4xxx_bus import SPIBus
+        self.spi = SelectRecordingSPI()
+        self.bus = SPIBus(self.spi)
+        self.left = self.bus.add("left", 5, Pot.POT_0)
+        self.right = self.bus.add("right", 5, Pot.POT_1)
+        self.bass = self.bus.add("bass", 6)
+
+    def test_pots_of_a_device_share_select_and_tcon(self):
+        self.assertIs(self.left.m_select, self.right.m_select)
+        self.assertIs(self.left.tcon_cache, self.right.tcon_cache)
+        self.assertIsNot(self.left.m_select, self.bass.m_select)
+        self.assertIs(self.bass, self.bus["bass"])
+        self.assertIn("left", self.bus)
+
+    def test_quad_pots_share_tcon1(self):
+        from mcp4xxx import Pot
+        treble = self.bus.add("treble", 5, Pot.POT_2)
+        mid = self.bus.add("mid", 5, Pot.POT_3)
+        self.assertIs(treble.tcon_cache, mid.tcon_cache)
+        self.assertIsNot(self.left.tcon_cache, treble.tcon_cache)
+        self.assertIs(self.left.m_select, treble.m_select)
+
+    def test_duplicate_name_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.bus.add("bass", 7)
+
+    def test_stage_unknown_name_is_rejected(self):
+        with self.assertRaises(KeyError):
+            self.bus.stage("treble", 1)
+
+    def test_flush_writes_each_device_in_one_frame(self):
+        self.bus.stage("bass", 3)
+        self.bus.stage("right", 2)
+        self.bus.stage("left", 1)
+        self.assertEqual(3, self.bus.pending())
+        self.assertEqual(2, self.bus.flush())
+        self.assertEqual([b'\x02\x01\x12\x02', b'\x02\x03'], self.spi.sent)
+        self.assertEqual(0, self.bus.pending())
+        self.assertEqual(0, self.bus.flush())
+
+    def test_latest_stage_wins(self):
+        self.bus.stage("left", 1)
+        self.bus.stage("left", 2)
+        self.bus.stage("left", 300)
+        self.bus.flush()
+        self.assertEqual([b'\x03\x00'], self.spi.sent)
+        self.assertEqual(256, test_mcp4xxx.wiper0)
+        self.assertEqual((3, 2, 1), (self.bus.staged, self.bus.coalesced, self.bus.written))
+
+    def test_unchanged_positions_are_skipped(self):
+        self.bus.stage("left", 10)
+        self.bus.stage("right", 20)
+        self.bus.flush()
+        self.bus.stage("left", 10)
+        self.bus.stage("right", 21)
+        self.bus.flush()
+        self.bus.stage("right", 21)
+        self.assertEqual(0, self.bus.flush())
+        self.assertEqual([b'\x02\x0a\x12\x14', b'\x12\x15'], self.spi.sent)
+        self.assertEqual((3, 2), (self.bus.written, self.bus.skipped))
+        self.assertEqual(21, self.right.get())
+
+    def test_default_bus_is_shared_and_not_reclocked(self):
+        import mcp4xxx
+        from mcp4xxx_bus import SPIBus
+        spi = mcp4xxx._default_spi()
+        spi.init.reset_mock()
+        self.assertIs(spi, SPIBus().spi)
+        spi.init.assert_not_called()
+
+    def test_rejected_frame_invalidates_caches(self):
+        from mcp4xxx import CommandError, Pot
+        from mcp4xxx_bus import SPIBus
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        spi = SimulatedSPI()
+        bus = SPIBus(spi)
+        pin = spi.attach(SimulatedDevice())
+        present = bus.add("present", pin)
+        # A single pot device has no pot 1, so rejects its commands.
+        bus.add("missing", pin, Pot.POT_1)
+        bus.stage("present", 10)
+        bus.flush()
+        bus.stage("present", 20)
+        bus.stage("missing", 5)
+        with self.assertRaises(CommandError):
+            bus.flush()
+        self.assertIsNone(present.wiper_cache.value)
+        self.assertEqual(2, bus.pending())
+
+    def test_shared_lock(self):
+        from mcp4xxx import bus_lock
+        from mcp4xxx_bus import SPIBus
+        spi = FrameSPI()
+        bus = SPIBus(spi, lock=True)
+        left = bus.add("left", 5)
+        bass = bus.add("bass", 6)
+        self.assertIs(bus_lock(spi), bus.lock)
+        self.assertIs(bus.lock, left.lock)
+        self.assertIs(bus.lock, bass.lock)
+        bus.stage("left", 1)
+        bus.stage("bass", 2)
+        bus.flush()
+        self.assertEqual(1, bus.lock.acquisitions)
+
+
+if __name__ == '__main__':
+    unittest.main()
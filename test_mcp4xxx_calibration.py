@@ -0,0 +1,80 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import unittest
+from array import array
+
+import test_mcp4xxx  # noqa: F401 installs the machine module stand-in
+
+
+class CalibrationTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX
+        from mcp4xxx_calibration import CalibratedPot, resistance_table
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        self.spi = SimulatedSPI()
+        self.sim = SimulatedDevice()
+        self.pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(self.sim))
+        self.calibrated = CalibratedPot(self.pot, resistance_table(self.pot, r_ab=10_240, r_w=100))
+
+    def test_nominal_tables(self):
+        from mcp4xxx import MCP4XXX, Resolution, WiperConfiguration
+        from mcp4xxx_calibration import ratio_table, resistance_table
+        from mcp4xxx_sim import SimulatedDevice
+        table = resistance_table(self.pot, r_ab=10_240, r_w=100)
+        self.assertEqual(257, len(table))
+        self.assertEqual((100, 4_100, 10_340), (table.value(0), table.value(100), table.value(256)))
+        self.assertEqual(10_340, resistance_table(self.pot, r_ab=10_240, r_w=100, terminal_a=True).value(0))
+        self.assertEqual(0.5, ratio_table(self.pot).value(128))
+        rheostat = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(SimulatedDevice()), resolution=Resolution.RES_7BIT,
+                           config=WiperConfiguration.RHEOSTAT)
+        self.assertEqual(128, len(resistance_table(rheostat, r_ab=5_000)))
+        with self.assertRaises(ValueError):
+            resistance_table(rheostat, r_ab=5_000, terminal_a=True)
+
+    def test_code_is_nearest_position(self):
+        from mcp4xxx_calibration import resistance_table
+        table = self.calibrated.resistance
+        self.assertEqual(100, table.code(4_100))
+        self.assertEqual(100, table.code(4_119))
+        self.assertEqual(101, table.code(4_121))
+        self.assertEqual(0, table.code(-5))
+        self.assertEqual(256, table.code(1e6))
+        falling = resistance_table(self.pot, r_ab=10_240, r_w=100, terminal_a=True)
+        self.assertEqual(156, falling.code(4_100))
+        self.assertEqual(256, falling.code(0))
+
+    def test_set_and_get(self):
+        self.assertTrue(self.calibrated.set_resistance(4_700))
+        self.assertEqual([115], self.sim.wipers)
+        self.assertEqual(4_700, self.calibrated.get_resistance())
+        self.assertTrue(self.calibrated.set_ratio(0.25))
+        self.assertEqual([64], self.sim.wipers)
+        self.assertEqual(0.25, self.calibrated.get_ratio())
+
+    def test_bulk_conversion(self):
+        table = self.calibrated.resistance
+        codes = table.codes([100, 4_100, 10_340])
+        self.assertEqual(array("H", [0, 100, 256]), codes)
+        self.assertEqual(array("f", [100, 4_100, 10_340]), table.values_at(codes))
+        out = array("H", [0, 0, 0])
+        self.assertIs(out, table.codes((10_340, 100, 4_100), out))
+        self.assertEqual(array("H", [256, 0, 100]), out)
+
+    def test_measured_table(self):
+        from mcp4xxx_calibration import CalibratedPot, measured_table
+        table = measured_table([(128, 5_000), (0, 200), (64, 2_600)], self.pot.max_value())
+        self.assertEqual((200, 1_400, 2_600, 3_800, 5_000, 9_800), tuple(table.value(code) for code in
+                                                                         (0, 32, 64, 96, 128, 256)))
+        self.assertEqual(96, table.code(3_800))
+        with self.assertRaises(ValueError):
+            CalibratedPot(self.pot, measured_table([(0, 0), (127, 1)], 127))
+        with self.assertRaises(ValueError):
+            measured_table([(0, 200), (64, 2_600), (64, 2_610)], self.pot.max_value())
+        with self.assertRaises(ValueError):
+            CalibratedPot(self.pot).set_resistance(1_000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import unittest
+
+import test_mcp4xxx  # noqa: F401 installs the machine module stand-in
+
+
+class FakeClock:
+    """ Microsecond clock advanced by the test """
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self) -> int:
+        return self.now
+
+
+class NonVolatileTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX, MCP42XX
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        self.clock = FakeClock()
+        self.spi = SimulatedSPI()
+        self.sim = SimulatedDevice(nonvolatile=True, write_us=4_000, clock=self.clock)
+        self.dual = SimulatedDevice(pots=2, nonvolatile=True, write_us=4_000, clock=self.clock)
+        self.pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(self.sim))
+        self.device = MCP42XX(spi=self.spi, select_pin=self.spi.attach(self.dual))
+
+    def test_nv_wiper(self):
+        self.pot.set(10)
+        self.assertTrue(self.pot.set_nv(200))
+        self.assertEqual(10, self.pot.get())
+        self.assertTrue(self.pot.eeprom_busy())
+        self.clock.now = 4_000
+        self.assertFalse(self.pot.eeprom_busy())
+        self.assertEqual(200, self.pot.get_nv())
+        self.sim.reset()
+        self.assertEqual(200, self.pot.get())
+
+    def test_eeprom(self):
+        self.assertTrue(self.device.write_eeprom(9, 0x1AB))
+        self.clock.now = 4_000
+        self.assertEqual(0x1AB, self.device.read_eeprom(9))
+        self.assertEqual(0x1AB, self.dual.eeprom[9])
+        with self.assertRaises(ValueError):
+            self.pot.write_eeprom(10, 0)
+
+    def test_nv_commands_rejected_while_writing(self):
+        from mcp4xxx import CommandError
+        self.device.pot1.set_nv(5)
+        with self.assertRaises(CommandError):
+            self.device.pot0.set_nv(6)
+        # Volatile commands are still accepted.
+        self.device.set_both(1, 2)
+        self.assertEqual([1, 2], self.dual.wipers)
+        self.clock.now = 4_000
+        self.assertTrue(self.device.pot0.set_nv(6))
+        self.assertEqual([6, 5], self.dual.nv_wipers)
+
+    def test_wait_eeprom(self):
+        from unittest import mock
+        self.pot.write_eeprom(0, 1)
+        with mock.patch("mcp4xxx.sleep_us", side_effect=lambda us: setattr(self.clock, "now", self.clock.now + us)):
+            self.assertTrue(self.pot.wait_eeprom(poll_us=1_000))
+            self.assertEqual(4_000, self.clock.now)
+            self.pot.write_eeprom(0, 2)
+            self.sim.write_us = 1_000_000
+            with mock.patch("mcp4xxx.ticks_us", self.clock):
+                self.assertFalse(self.pot.wait_eeprom(timeout_us=10_000, poll_us=1_000))
+
+    def test_volatile_device_rejects_nv_commands(self):
+        from mcp4xxx import MCP4XXX, CommandError
+        from mcp4xxx_sim import SimulatedDevice
+        pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(SimulatedDevice()))
+        with self.assertRaises(CommandError):
+            pot.set_nv(1)
+
+
+class EEPROMSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX, MCP42XX
+        from mcp4xxx_eeprom import EEPROMScheduler
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        self.clock = FakeClock()
+        self.spi = SimulatedSPI()
+        self.sim = SimulatedDevice(nonvolatile=True, write_us=4_000, clock=self.clock)
+        self.dual = SimulatedDevice(pots=2, nonvolatile=True, write_us=4_000, clock=self.clock)
+        self.pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(self.sim))
+        self.device = MCP42XX(spi=self.spi, select_pin=self.spi.attach(self.dual))
+        self.scheduler = EEPROMScheduler(poll_us=1_000, clock=self.clock)
+
+    def run_until_done(self) -> int:
+        """ Poll every 1 ms until idle, return the number of polls """
+        count = 0
+        while self.scheduler.poll():
+            self.clock.now += 1_000
+            count += 1
+        return count
+
+    def test_writes_each_device_in_parallel(self):
+        self.scheduler.set_nv(self.pot, 10)
+        self.scheduler.write_eeprom(self.pot, 0, 11)
+        self.scheduler.set_nv(self.device.pot0, 20)
+        self.scheduler.set_nv(self.device.pot1, 21)
+        self.assertEqual(4, self.scheduler.pending())
+        self.assertEqual(4, self.scheduler.poll())
+        # One write cycle runs on each device at a time.
+        self.assertEqual((1, 1), (self.sim.eeprom_writes, self.dual.eeprom_writes))
+        self.assertEqual(8, self.run_until_done())
+        self.assertEqual([10], self.sim.nv_wipers)
+        self.assertEqual([11], self.sim.eeprom[:1])
+        self.assertEqual([20, 21], self.dual.nv_wipers)
+        self.assertEqual(0, self.sim.errors + self.dual.errors)
+        self.assertEqual(4, self.scheduler.writes)
+
+    def test_bus_free_while_writing(self):
+        self.scheduler.set_nv(self.pot, 10)
+        self.scheduler.set_nv(self.pot, 12)
+        self.scheduler.poll()
+        self.spi.reset_stats()
+        # Polls before poll_us has passed do not touch the bus.
+        self.scheduler.poll()
+        self.assertEqual(0, self.spi.transfers)
+        self.pot.set(5)
+        self.assertEqual(5, self.sim.wipers[0])
+        self.run_until_done()
+        self.assertEqual([12], self.sim.nv_wipers)
+        self.assertEqual((1, 1), (self.scheduler.writes, self.scheduler.coalesced))
+        self.assertEqual(1, self.sim.eeprom_writes)
+
+    def test_rejected_write_stays_queued_with_default_policy(self):
+        from mcp4xxx import ErrorPolicy
+        self.assertEqual(ErrorPolicy.RAISE, self.pot.error_policy)
+        # A write cycle started outside the scheduler rejects its first write.
+        self.pot.set_nv(10)
+        self.scheduler.set_nv(self.pot, 20)
+        self.assertTrue(self.scheduler.poll())
+        self.assertEqual((0, 1), (self.scheduler.writes, self.sim.errors))
+        self.run_until_done()
+        self.assertEqual([20], self.sim.nv_wipers)
+        self.assertEqual(1, self.scheduler.writes)
+
+    def test_wait(self):
+        from unittest import mock
+        self.scheduler.set_nv(self.pot, 10)
+        self.scheduler.write_eeprom(self.device, 3, 7)
+        with mock.patch("mcp4xxx_eeprom.sleep_us", side_effect=lambda us: setattr(self.clock, "now", self.clock.now + us)):
+            self.assertTrue(self.scheduler.wait())
+        self.assertEqual(7, self.dual.eeprom[3])
+        self.assertEqual(0, self.scheduler.pending())
+
+
+if __name__ == '__main__':
+    unittest.main()
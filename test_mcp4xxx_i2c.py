@@ -0,0 +1,136 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import unittest
+
+import test_mcp4xxx  # noqa: F401 installs the machine module stand-in
+
+
+class RecordingI2C:
+    """ SimulatedI2C that records the bytes of each write """
+
+    def __init__(self):
+        from mcp4xxx_sim import SimulatedI2C
+        self.i2c = SimulatedI2C()
+        self.writes = []
+
+    def writeto(self, addr, buf, stop=True):
+        self.writes.append(bytes(buf))
+        return self.i2c.writeto(addr, buf, stop)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        self.i2c.readfrom_into(addr, buf, stop)
+
+
+class I2CTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx_i2c import MCP45XX, MCP46XX
+        from mcp4xxx_sim import SimulatedDevice
+        self.bus = RecordingI2C()
+        self.i2c = self.bus.i2c
+        self.sim = SimulatedDevice()
+        self.dual = SimulatedDevice(pots=2)
+        self.i2c.attach(self.sim, 0x28)
+        self.i2c.attach(self.dual, 0x2C)
+        self.pot = MCP45XX(self.bus, 0x28)
+        self.device = MCP46XX(self.bus, 0x2C)
+
+    def test_same_api(self):
+        self.assertTrue(self.pot.set(200))
+        self.assertEqual(200, self.pot.get())
+        self.assertTrue(self.pot.increment())
+        self.assertEqual([201], self.sim.wipers)
+        self.pot.set_terminal_a_status(False)
+        self.assertFalse(self.pot.get_terminal_a_status())
+        self.assertTrue(self.pot.get_terminal_b_status())
+        self.device.set_both(1, 256)
+        self.assertEqual((1, 256), self.device.get_both())
+        self.device.pot1.set_shutdown_status(True)
+        self.assertTrue(self.device.pot1.get_shutdown_status())
+        self.assertFalse(self.device.pot0.get_shutdown_status())
+
+    def test_cmderr_bit_is_not_sent(self):
+        self.pot.set(256)
+        self.pot.increment()
+        self.assertEqual([b'\x01\x00', b'\x04'], self.bus.writes)
+
+    def test_continuous_write(self):
+        self.i2c.reset_stats()
+        self.pot.step(-5)
+        self.assertEqual(1, self.i2c.transactions)
+        self.assertEqual(6, self.i2c.bytes)
+        self.device.set_both(3, 4)
+        self.assertEqual(2, self.i2c.transactions)
+        self.assertEqual([3, 4], self.dual.wipers)
+
+    def test_batch(self):
+        batch = self.device.batch()
+        batch.set(10)
+        batch.increment(pot=1)
+        batch.set_tcon(0xF0)
+        batch.get()
+        batch.get(pot=1)
+        batch.set(20)
+        self.i2c.reset_stats()
+        self.assertEqual([None, None, None, 10, 129, None], batch.execute())
+        # One write of three commands, two reads of a write and a read each, and a write.
+        self.assertEqual(6, self.i2c.transactions)
+        self.assertEqual([20, 129], self.dual.wipers)
+        self.assertEqual(0x1F0, self.dual.tcon)
+
+    def test_rejected_command(self):
+        from mcp4xxx import ADDRESS_STATUS, COMMAND_WRITE, CommandError, ErrorPolicy, Pot
+        from mcp4xxx_i2c import MCP45XX
+        missing = MCP45XX(self.bus, 0x28, pot=Pot.POT_1)
+        with self.assertRaises(CommandError):
+            missing.set(1)
+        self.pot.error_policy = ErrorPolicy.COUNT
+        batch = self.pot.batch()
+        batch.set(5)
+        batch._queue(ADDRESS_STATUS, COMMAND_WRITE, 0)
+        batch.set(9)
+        self.assertEqual([None, None, None], batch.execute())
+        self.assertEqual(1, batch.rejected)
+        self.assertEqual([5], self.sim.wipers)
+
+    def test_no_device(self):
+        from errno import ENODEV
+        from mcp4xxx_i2c import MCP45XX
+        with self.assertRaises(OSError) as cm:
+            MCP45XX(self.bus, 0x2F).set(1)
+        self.assertEqual(ENODEV, cm.exception.args[0])
+
+    def test_accepted_commands_with_count_policy(self):
+        from mcp4xxx import ErrorPolicy
+        from mcp4xxx_i2c import MCP45XX
+        pot = MCP45XX(self.bus, 0x28, error_policy=ErrorPolicy.COUNT)
+        self.assertTrue(pot.set(200))
+        self.assertTrue(pot.increment())
+        self.assertEqual(201, pot.get())
+        self.assertEqual(0, pot.command_errors)
+
+    def test_bus_lock_is_shared(self):
+        from mcp4xxx import bus_lock
+        from mcp4xxx_i2c import MCP45XX, MCP46XX
+        pot = MCP45XX(self.bus, 0x28, lock=True)
+        device = MCP46XX(self.bus, 0x2C, lock=True)
+        self.assertIs(bus_lock(self.bus), pot.lock)
+        self.assertIs(pot.lock, device.pot1.lock)
+
+    def test_quad_set_all_is_one_write(self):
+        from mcp4xxx_i2c import MCP44XX
+        from mcp4xxx_sim import SimulatedDevice
+        quad = SimulatedDevice(pots=4)
+        self.i2c.attach(quad, 0x2D)
+        device = MCP44XX(self.bus, 0x2D)
+        self.i2c.reset_stats()
+        self.assertTrue(device.set_all((1, 2, 3, 4), (0xFF, 0x0F)))
+        self.assertEqual(1, self.i2c.transactions)
+        self.assertEqual([1, 2, 3, 4], quad.wipers)
+        self.assertEqual(0x10F, quad.tcon1)
+        self.assertEqual((1, 2, 3, 4), device.get_all())
+
+
+if __name__ == '__main__':
+    unittest.main()
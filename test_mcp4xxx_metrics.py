@@ -0,0 +1,132 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import unittest
+
+import test_mcp4xxx  # noqa: F401 installs the machine module stand-in
+
+
+class FailingSPI:
+    """ SPI that fails every transfer """
+
+    def write_readinto(self, write_buf, read_buf):
+        raise OSError("bus fault")
+
+
+class TransferMetricsTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX, MCP42XX
+        from mcp4xxx_metrics import TransferMetrics
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        self.spi = SimulatedSPI()
+        self.sim = SimulatedDevice()
+        self.pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(self.sim))
+        self.device = MCP42XX(spi=self.spi, select_pin=self.spi.attach(SimulatedDevice(pots=2)))
+        self.metrics = TransferMetrics()
+        self.pot.monitor = self.metrics
+
+    def test_counts_commands(self):
+        from mcp4xxx import ADDRESS_POT0_WIPER, ADDRESS_TCON, COMMAND_INCREMENT, COMMAND_READ, COMMAND_WRITE
+        self.pot.set(10)
+        self.pot.increment()
+        self.pot.get()
+        self.pot.set_wiper_status(False)
+        self.assertEqual(5, self.metrics.frames)
+        self.assertEqual(self.spi.bytes, self.metrics.bytes)
+        self.assertEqual(4, self.metrics.selects)
+        self.assertEqual(0, self.metrics.errors)
+        self.assertEqual(1, self.metrics.command_count(ADDRESS_POT0_WIPER, COMMAND_WRITE))
+        self.assertEqual(1, self.metrics.command_count(ADDRESS_POT0_WIPER, COMMAND_INCREMENT))
+        self.assertEqual({"POT0_WIPER WRITE": 1, "POT0_WIPER INCR": 1, "POT0_WIPER READ": 1,
+                          "TCON READ": 1, "TCON WRITE": 1}, self.metrics.command_counts())
+        self.assertEqual(1, self.metrics.command_count(ADDRESS_TCON, COMMAND_READ))
+        self.assertEqual(5, sum(self.metrics.histogram))
+
+    def test_counts_commands_in_a_frame(self):
+        from mcp4xxx import ADDRESS_POT0_WIPER, COMMAND_DECREMENT
+        self.pot.step(-3)
+        with self.pot.batch() as batch:
+            batch.set(5)
+            batch.get()
+        self.assertEqual(2, self.metrics.frames)
+        self.assertEqual(3, self.metrics.command_count(ADDRESS_POT0_WIPER, COMMAND_DECREMENT))
+        self.assertEqual(5, sum(self.metrics.commands))
+
+    def test_counts_command_errors(self):
+        from mcp4xxx import ADDRESS_STATUS, COMMAND_WRITE, ErrorPolicy
+        self.pot.error_policy = ErrorPolicy.COUNT
+        with self.pot.batch() as batch:
+            batch._queue(ADDRESS_STATUS, COMMAND_WRITE, 0)
+            batch.set(5)
+        self.assertEqual(1, self.metrics.command_errors)
+        self.assertEqual(1, self.metrics.command_count(ADDRESS_STATUS, COMMAND_WRITE))
+        self.assertEqual(1, sum(self.metrics.commands))
+
+    def test_counts_failed_frames(self):
+        self.pot.spi = FailingSPI()
+        with self.assertRaises(OSError):
+            self.pot.set(10)
+        self.assertEqual(1, self.metrics.errors)
+        self.assertEqual(0, self.metrics.bytes)
+        self.assertEqual(0, self.pot.m_select.nesting)
+
+    def test_transaction_shares_select(self):
+        with self.pot.transaction():
+            self.pot.set(1)
+            self.pot.set(2)
+        self.assertEqual(2, self.metrics.frames)
+        self.assertEqual(1, self.metrics.selects)
+
+    def test_latency_percentile(self):
+        from mcp4xxx_metrics import TransferMetrics
+        metrics = TransferMetrics()
+        for elapsed_us in (0, 3, 3, 100):
+            metrics.after(self.pot, b"", b"", elapsed_us, None)
+        self.assertEqual([1, 0, 2, 0, 0, 0, 0, 1], metrics.histogram[:8])
+        self.assertEqual(4, metrics.latency_percentile(0.5))
+        self.assertEqual(128, metrics.latency_percentile(1.0))
+        self.assertEqual(106, metrics.elapsed_us)
+
+    def test_recording_does_not_allocate(self):
+        from test_mcp4xxx import allocations
+        tx = bytearray(b"\x00\x10\x04")
+        rx = bytearray(b"\xff\xff\xff")
+        metrics = self.metrics
+        pot = self.pot
+        # Few calls, as CPython allocates counters above 256.
+        self.assertEqual(0, allocations(lambda: metrics.after(pot, tx, rx, 12, None), count=10))
+
+    def test_dual_pot_device(self):
+        self.device.monitor = self.metrics
+        self.assertIs(self.metrics, self.device.pot1.monitor)
+        self.device.set_both(1, 2)
+        self.device.pot1.increment()
+        self.assertEqual(2, self.metrics.frames)
+        self.assertEqual(5, self.metrics.bytes)
+
+    def test_removing_monitor(self):
+        self.pot.monitor = None
+        self.pot.set(10)
+        self.assertEqual(0, self.metrics.frames)
+
+    def test_bus_metrics(self):
+        from mcp4xxx_metrics import BusMetrics
+        metrics = BusMetrics()
+        metrics.attach("pot", self.pot)
+        metrics.attach("device", self.device)
+        self.pot.set(1)
+        self.device.set_both(1, 2)
+        self.device.get_both()
+        self.assertEqual(1, metrics["pot"].frames)
+        self.assertEqual(2, metrics["device"].frames)
+        total = metrics.total()
+        self.assertEqual(3, total.frames)
+        self.assertEqual(10, total.bytes)
+        metrics.reset()
+        self.assertEqual(0, metrics["device"].frames)
+        self.assertEqual(0, sum(metrics["device"].commands))
+
+
+if __name__ == '__main__':
+    unittest.main()
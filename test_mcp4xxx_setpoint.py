@@ -0,0 +1,168 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import asyncio
+import time
+import unittest
+
+import test_mcp4xxx
+
+
+class FakeClock:
+    """ Microsecond clock advanced by the test """
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self) -> int:
+        return self.now
+
+
+class SetpointQueueTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX, MCP42XX
+        from mcp4xxx_setpoint import SetpointQueue
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        self.clock = FakeClock()
+        self.spi = SimulatedSPI()
+        self.sim = SimulatedDevice()
+        self.dual = SimulatedDevice(pots=2)
+        self.pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(self.sim))
+        self.device = MCP42XX(spi=self.spi, select_pin=self.spi.attach(self.dual))
+        self.queue = SetpointQueue(max_rate=1_000, clock=self.clock)
+
+    def test_latest_value_wins(self):
+        for value in (10, 20, 30):
+            self.queue.put(self.pot, value)
+        self.assertEqual(1, self.queue.pending())
+        self.assertEqual(1, self.queue.flush())
+        self.assertEqual([30], self.sim.wipers)
+        self.assertEqual((3, 2, 1), (self.queue.puts, self.queue.coalesced, self.queue.written))
+        self.assertEqual(0, self.queue.flush())
+
+    def test_pots_of_a_device_share_a_frame(self):
+        self.queue.put(self.device.pot0, 1)
+        self.queue.put(self.device.pot1, 2)
+        self.queue.put(self.pot, 3)
+        self.assertEqual(2, self.queue.flush())
+        self.assertEqual((2, 6), (self.spi.selects, self.spi.bytes))
+        self.assertEqual([1, 2], self.dual.wipers)
+
+    def test_poll_is_rate_limited(self):
+        self.queue.put(self.pot, 1)
+        self.assertEqual(1, self.queue.poll())
+        self.queue.put(self.pot, 2)
+        self.clock.now = 500
+        self.assertEqual(0, self.queue.poll())
+        self.clock.now = 1_000
+        self.assertEqual(1, self.queue.poll())
+        self.assertEqual([2], self.sim.wipers)
+
+    def test_staleness(self):
+        self.queue.put(self.pot, 1)
+        self.clock.now = 300
+        self.queue.put(self.device.pot0, 2)
+        self.clock.now = 400
+        self.queue.flush()
+        self.assertEqual(400, self.queue.max_staleness_us)
+        self.assertEqual(250.0, self.queue.mean_staleness_us())
+        self.queue.reset_stats()
+        self.assertEqual(0.0, self.queue.mean_staleness_us())
+
+    def test_rejected_frames_are_dropped(self):
+        from mcp4xxx import CommandError, ErrorPolicy, MCP4XXX, Pot
+        from mcp4xxx_sim import SimulatedDevice
+        missing = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(SimulatedDevice()), pot=Pot.POT_1,
+                          wiper_cache=True)
+        self.queue.put(missing, 1)
+        self.queue.put(self.pot, 2)
+        self.assertEqual(2, self.queue.flush())
+        self.assertIsInstance(self.queue.error, CommandError)
+        self.assertIsNone(missing.wiper_cache.value)
+        missing.error_policy = ErrorPolicy.COUNT
+        self.queue.put(missing, 3)
+        self.queue.flush()
+        self.assertEqual((2, 1), (self.queue.dropped, self.queue.written))
+        self.assertEqual([2], self.sim.wipers)
+
+    def test_flush_during_a_flush_sends_nothing(self):
+        write_readinto = self.spi.write_readinto
+        inner = []
+
+        def interrupted(write_buf, read_buf):
+            # A timer poll() interrupting the flush, after a new put().
+            if not inner:
+                self.queue.put(self.pot, 7)
+                inner.append(self.queue.flush())
+            write_readinto(write_buf, read_buf)
+        self.spi.write_readinto = interrupted
+        self.queue.put(self.pot, 3)
+        self.assertEqual(1, self.queue.flush())
+        self.assertEqual([0], inner)
+        self.assertEqual([3], self.sim.wipers)
+        self.assertEqual(1, self.queue.flush())
+        self.assertEqual([7], self.sim.wipers)
+
+    def test_trusted_cache_skips_unchanged(self):
+        from mcp4xxx import MCP4XXX
+        from mcp4xxx_sim import SimulatedDevice
+        pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(SimulatedDevice()), wiper_cache=True)
+        self.queue.put(pot, 5)
+        self.queue.flush()
+        self.queue.put(pot, 5)
+        self.assertEqual(0, self.queue.flush())
+        self.assertEqual((1, 1), (self.queue.written, self.queue.skipped))
+
+    def test_put_does_not_allocate(self):
+        self.queue.put(self.pot, 1)
+        # Few calls, as CPython allocates the counters once they pass 256.
+        self.assertEqual(0, test_mcp4xxx.allocations(lambda: self.queue.put(self.pot, 5), count=20))
+
+    def test_put_registers_under_the_lock(self):
+        from mcp4xxx import MCP4XXX, MCP43XX
+        from mcp4xxx_setpoint import SetpointQueue
+        from mcp4xxx_sim import SimulatedDevice
+        quad = MCP43XX(spi=self.spi, select_pin=self.spi.attach(SimulatedDevice(pots=4)))
+        queue = SetpointQueue()
+        for pot in quad.pots:
+            queue.put(pot, 1)
+        with self.assertRaises(ValueError):
+            queue.put(MCP4XXX(spi=self.spi, select_pin=quad.pot0.m_select), 1)
+        # The lock was released, so the queue is still usable.
+        queue.put(self.pot, 2)
+        self.assertEqual(2, queue.flush())
+        self.assertEqual([2], self.sim.wipers)
+
+    def test_thread_flusher(self):
+        from mcp4xxx_setpoint import SetpointQueue
+        queue = SetpointQueue(max_rate=10_000)
+        queue.start()
+        try:
+            for value in range(100):
+                queue.put(self.pot, value)
+            deadline = time.time() + 5
+            while queue.pending() and time.time() < deadline:
+                time.sleep(0.001)
+        finally:
+            queue.stop()
+        self.assertEqual(0, queue.pending())
+        self.assertEqual([99], self.sim.wipers)
+        self.assertEqual(100, queue.written + queue.coalesced)
+
+    def test_asyncio_flusher(self):
+        from mcp4xxx_setpoint import SetpointQueue
+        queue = SetpointQueue(max_rate=1_000)
+
+        async def main():
+            task = asyncio.create_task(queue.run())
+            queue.put(self.pot, 42)
+            await asyncio.sleep(0.01)
+            task.cancel()
+
+        asyncio.run(main())
+        self.assertEqual([42], self.sim.wipers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,280 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import unittest
+
+import test_mcp4xxx  # noqa: F401 installs the machine module stand-in
+
+
+class SimulatorTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX, MCP42XX
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        self.spi = SimulatedSPI(baudrate=1_000_000, cs_overhead_us=2.0, call_overhead_us=5.0)
+        self.single = SimulatedDevice()
+        self.dual = SimulatedDevice(pots=2)
+        self.pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(self.single))
+        self.device = MCP42XX(spi=self.spi, select_pin=self.spi.attach(self.dual))
+
+    def test_power_on_reset(self):
+        from mcp4xxx import Resolution
+        from mcp4xxx_sim import SimulatedDevice
+        self.assertEqual(128, self.pot.get())
+        self.assertEqual(64, SimulatedDevice(resolution=Resolution.RES_7BIT).wipers[0])
+        self.assertTrue(self.pot.get_wiper_status())
+        self.assertFalse(self.pot.get_shutdown_status())
+
+    def test_devices_are_selected_independently(self):
+        self.pot.set(10)
+        self.device.set_both(20, 30)
+        self.assertEqual([10], self.single.wipers)
+        self.assertEqual([20, 30], self.dual.wipers)
+        self.assertEqual((20, 30), self.device.get_both())
+
+    def test_saturation(self):
+        from mcp4xxx import MCP4XXX, Resolution, WiperConfiguration
+        from mcp4xxx_sim import SimulatedDevice
+        for resolution in (Resolution.RES_7BIT, Resolution.RES_8BIT):
+            for config in (WiperConfiguration.RHEOSTAT, WiperConfiguration.POTENTIOMETER):
+                sim = SimulatedDevice(resolution=resolution, config=config)
+                pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(sim), resolution=resolution, config=config)
+                pot.set(sim.max_value())
+                pot.increment()
+                self.assertEqual(pot.max_value(), pot.get())
+                pot._transfer(0, 0, 0x1FF)
+                self.assertEqual(pot.max_value(), sim.wipers[0])
+                pot.set(0)
+                pot.decrement()
+                self.assertEqual(0, sim.wipers[0])
+
+    def test_tcon_and_status(self):
+        self.device.pot1.set_terminal_a_status(False)
+        self.assertEqual(0x1BF, self.dual.tcon)
+        self.pot.set_terminal_a_status(False)
+        # The high nibble is reserved on single pot devices.
+        self.pot._set_tcon(0x0B)
+        self.assertEqual(0x1FB, self.single.tcon)
+        self.assertFalse(self.pot.get_hardware_shutdown_status())
+        self.single.shutdown_pin = True
+        self.assertTrue(self.pot.get_hardware_shutdown_status())
+
+    def test_continuous_frame(self):
+        with self.device.batch() as batch:
+            batch.set(100)
+            batch.increment()
+            batch.set_tcon(0x0F)
+            batch.get()
+            batch.get_tcon()
+            batch.get_hardware_shutdown_status()
+        self.assertEqual([None, None, None, 101, 0x0F, False], batch.results)
+        self.assertEqual(1, self.spi.transfers)
+
+    def test_cmderr(self):
+        from mcp4xxx import ADDRESS_POT1_WIPER, ADDRESS_STATUS, COMMAND_INCREMENT, COMMAND_WRITE, ErrorPolicy
+        self.pot.error_policy = ErrorPolicy.COUNT
+        self.assertFalse(self.pot._send(ADDRESS_STATUS, COMMAND_WRITE, 0))
+        self.assertEqual(b'\xfc\x00', self.pot._rx)
+        self.assertFalse(self.pot._send(ADDRESS_POT1_WIPER, COMMAND_INCREMENT))
+        self.assertEqual(0, self.pot._rx[0] & 0b10)
+        self.assertEqual(2, self.single.errors)
+        # The rest of the frame after an error is ignored.
+        with self.pot.batch() as batch:
+            batch.set_tcon(0)
+            batch.set(1, pot=1)
+            batch.set(2)
+        self.assertEqual(128, self.single.wipers[0])
+
+    def test_timing_model(self):
+        self.spi.reset_stats()
+        self.pot.set(1)
+        self.pot.increment()
+        self.device.set_both(1, 2)
+        self.assertEqual((3, 7, 3), (self.spi.transfers, self.spi.bytes, self.spi.selects))
+        self.assertAlmostEqual(3 * 2.0 + 3 * 5.0 + 7 * 8.0, self.spi.bus_time_us)
+        self.spi.init(baudrate=8_000_000)
+        self.spi.reset_stats()
+        self.pot.set(1)
+        self.assertAlmostEqual(2.0 + 5.0 + 2.0, self.spi.bus_time_us)
+
+    def test_response_skewed_above_max_baudrate(self):
+        self.pot.set(0x0AA)
+        self.spi.max_baudrate = 1_000_000
+        self.assertEqual(0x0AA, self.pot.get())
+        self.spi.init(baudrate=2_000_000)
+        # The CMDERR bit reads the bit before it, so the skew is not seen as an error.
+        self.assertEqual(0x155, self.pot.get())
+
+    def test_incomplete_command_is_discarded(self):
+        self.pot._transfer_frame(b'\x00', bytearray(1))
+        self.pot.set(5)
+        self.assertEqual(5, self.single.wipers[0])
+
+
+class QuadSimulatorTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP43XX
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        self.spi = SimulatedSPI()
+        self.quad = SimulatedDevice(pots=4)
+        self.device = MCP43XX(spi=self.spi, select_pin=self.spi.attach(self.quad))
+
+    def test_pots_have_their_own_registers(self):
+        for i, pot in enumerate(self.device.pots):
+            pot.set(10 + i)
+        self.assertEqual([10, 11, 12, 13], self.quad.wipers)
+        self.assertEqual(12, self.device.pot2.get())
+        self.device.pot3.increment()
+        self.assertEqual(14, self.quad.wipers[3])
+        self.assertIs(self.device.pot2.tcon_cache, self.device.pot3.tcon_cache)
+        self.assertIsNot(self.device.pot0.tcon_cache, self.device.pot2.tcon_cache)
+
+    def test_tcon1_holds_pots_2_and_3(self):
+        self.device.pot2.set_shutdown_status(True)
+        self.device.pot3.set_terminal_a_status(False)
+        self.assertEqual(0x1FF, self.quad.tcon)
+        self.assertEqual(0x1B7, self.quad.tcon1)
+        self.assertTrue(self.device.pot2.get_shutdown_status())
+        self.assertFalse(self.device.pot0.get_shutdown_status())
+        self.assertFalse(self.device.pot3.get_terminal_a_status())
+
+    def test_set_all_is_one_frame(self):
+        self.spi.reset_stats()
+        self.assertTrue(self.device.set_all((1, 2, 3, 300), (0x77, 0xF0)))
+        self.assertEqual((1, 1, 12), (self.spi.transfers, self.spi.selects, self.spi.bytes))
+        self.assertEqual([1, 2, 3, 256], self.quad.wipers)
+        self.assertEqual((0x177, 0x1F0), (self.quad.tcon, self.quad.tcon1))
+        self.assertEqual((0x77, 0xF0), (self.device.tcon_cache.value, self.device.tcon1_cache.value))
+
+    def test_get_all_is_one_frame(self):
+        self.device.set_all((5, 6, 7, 8))
+        self.device.set_tcons(0x12, 0x34)
+        self.spi.reset_stats()
+        self.assertEqual((5, 6, 7, 8), self.device.get_all())
+        self.assertEqual((5, 6, 7, 8, 0x12, 0x34), self.device.get_all(tcons=True))
+        self.assertEqual((0x12, 0x34), self.device.get_tcons())
+        self.assertEqual((3, 3), (self.spi.transfers, self.spi.selects))
+
+    def test_cached_bulk_access_skips_unchanged_registers(self):
+        from mcp4xxx import MCP43XX, RegisterCache
+        from mcp4xxx_sim import SimulatedDevice
+        device = MCP43XX(spi=self.spi, select_pin=self.spi.attach(SimulatedDevice(pots=4)),
+                         tcon_cache=RegisterCache(True), wiper_cache=True)
+        self.assertTrue(device.tcon1_cache.trusted)
+        device.set_all((1, 2, 3, 4), (0xFF, 0xFF))
+        self.spi.reset_stats()
+        device.set_all((1, 2, 9, 4), (0xFF, 0x0F))
+        self.assertEqual((1, 4), (self.spi.transfers, self.spi.bytes))
+        self.assertEqual((1, 2, 9, 4, 0xFF, 0x0F), device.get_all(tcons=True))
+        self.assertEqual(1, self.spi.transfers)
+
+    def test_batch_keeps_caches_of_all_pots(self):
+        from mcp4xxx import MCP43XX, Pot
+        from mcp4xxx_sim import SimulatedDevice
+        quad = SimulatedDevice(pots=4)
+        device = MCP43XX(spi=self.spi, select_pin=self.spi.attach(quad), wiper_cache=True)
+        with device.batch() as batch:
+            batch.set(40, pot=Pot.POT_3)
+            batch.set_wiper_status(False, pot=Pot.POT_2)
+            batch.get_wiper_status(pot=Pot.POT_2)
+            batch.get_tcon(pot=Pot.POT_3)
+        self.assertEqual([None, None, False, 0xFD], batch.results)
+        self.assertEqual(0x1FD, quad.tcon1)
+        self.assertEqual(40, device.pot3.wiper_cache.value)
+        self.assertEqual(0xFD, device.tcon1_cache.value)
+        self.assertIsNone(device.tcon_cache.value)
+
+    def test_nonvolatile_memory(self):
+        from mcp4xxx import MCP43XX, QUAD_EEPROM_SIZE
+        from mcp4xxx_sim import SimulatedDevice
+        quad = SimulatedDevice(pots=4, nonvolatile=True, write_us=0)
+        device = MCP43XX(spi=self.spi, select_pin=self.spi.attach(quad))
+        self.assertTrue(device.pot3.set_nv(33))
+        self.assertTrue(device.write_eeprom(QUAD_EEPROM_SIZE - 1, 0x155))
+        self.assertEqual(33, device.pot3.get_nv())
+        self.assertEqual(0x155, device.read_eeprom(QUAD_EEPROM_SIZE - 1))
+        self.assertEqual([128, 128, 128, 33], quad.nv_wipers)
+        self.assertEqual(0x155, quad.eeprom[4])
+        with self.assertRaises(ValueError):
+            device.read_eeprom(QUAD_EEPROM_SIZE)
+        self.assertEqual(0x1FF, quad.tcon1)
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX, MCP42XX, MCP43XX
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        self.spi = SimulatedSPI()
+        self.single = SimulatedDevice()
+        self.dual = SimulatedDevice(pots=2)
+        self.quad = SimulatedDevice(pots=4)
+        self.pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(self.single))
+        self.device = MCP42XX(spi=self.spi, select_pin=self.spi.attach(self.dual))
+        self.mixer = MCP43XX(spi=self.spi, select_pin=self.spi.attach(self.quad))
+
+    def test_snapshot_is_one_frame(self):
+        from mcp4xxx import STATUS_SHUTDOWN_MASK, TCON_SHUTDOWN_MASK
+        self.device.set_both(10, 20)
+        self.device.pot1.set_shutdown_status(True)
+        self.dual.shutdown_pin = True
+        self.spi.reset_stats()
+        state = self.device.snapshot()
+        self.assertEqual((1, 1, 8), (self.spi.transfers, self.spi.selects, self.spi.bytes))
+        self.assertEqual((10, 20), state.wipers)
+        self.assertEqual((0xFF & ~(TCON_SHUTDOWN_MASK << 4),), state.tcons)
+        self.assertTrue(state.status & STATUS_SHUTDOWN_MASK)
+        self.assertEqual(state.tcons[0], self.device.tcon_cache.value)
+        with self.assertRaises(AttributeError):
+            state.wipers = (0, 0)
+
+    def test_restore_writes_registers_that_differ(self):
+        state = self.device.snapshot()
+        self.device.set_both(1, 2)
+        self.device.set_tcon(0x00)
+        self.spi.reset_stats()
+        self.assertTrue(self.device.restore(state))
+        self.assertEqual((1, 6), (self.spi.transfers, self.spi.bytes))
+        self.assertEqual([128, 128], self.dual.wipers)
+        self.assertEqual(0x1FF, self.dual.tcon)
+        self.device.pot1.set(7)
+        current = self.device.snapshot()
+        self.spi.reset_stats()
+        self.assertTrue(self.device.restore(state, current))
+        self.assertEqual((1, 2), (self.spi.transfers, self.spi.bytes))
+        self.assertEqual([128, 128], self.dual.wipers)
+        self.spi.reset_stats()
+        self.assertTrue(self.device.restore(state, state))
+        self.assertEqual(0, self.spi.transfers)
+
+    def test_restore_with_trusted_caches(self):
+        from mcp4xxx import MCP4XXX, RegisterCache
+        from mcp4xxx_sim import SimulatedDevice
+        pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(SimulatedDevice()), wiper_cache=True,
+                      tcon_cache=RegisterCache(trusted=True))
+        state = pot.snapshot()
+        pot.set(3)
+        self.spi.reset_stats()
+        self.assertTrue(pot.restore(state))
+        self.assertEqual(2, self.spi.bytes)
+        self.assertEqual(128, pot.get())
+
+    def test_quad_snapshot(self):
+        self.mixer.set_all((1, 2, 3, 4), (0x11, 0x22))
+        self.spi.reset_stats()
+        state = self.mixer.snapshot()
+        self.assertEqual((1, 14), (self.spi.transfers, self.spi.bytes))
+        self.assertEqual(((1, 2, 3, 4), (0x11, 0x22)), (state.wipers, state.tcons))
+        self.mixer.set_all((0, 0, 0, 0), (0xFF, 0xFF))
+        self.assertTrue(self.mixer.restore(state))
+        self.assertEqual([1, 2, 3, 4], self.quad.wipers)
+        self.assertEqual((0x111, 0x122), (self.quad.tcon, self.quad.tcon1))
+
+    def test_state_of_another_device_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.pot.restore(self.device.snapshot())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import io
+import unittest
+
+import test_mcp4xxx
+from test_mcp4xxx_eeprom import FakeClock
+from test_mcp4xxx_metrics import FailingSPI
+
+
+class TraceTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX, MCP42XX
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        from mcp4xxx_trace import TraceRecorder
+        self.clock = FakeClock()
+        self.spi = SimulatedSPI()
+        self.sink = io.BytesIO()
+        self.trace = TraceRecorder(self.spi, sink=self.sink, chunk_size=64, clock=self.clock)
+        self.pot = MCP4XXX(spi=self.trace, select_pin=self.trace.pin(self.spi.attach(SimulatedDevice())))
+        self.device = MCP42XX(spi=self.trace, select_pin=self.trace.pin(self.spi.attach(SimulatedDevice(pots=2))))
+
+    def test_records_frames(self):
+        from mcp4xxx_trace import read_trace
+        self.pot.set(10)
+        self.clock.now += 250
+        self.device.set_both(1, 2)
+        self.clock.now += 50
+        self.pot.get()
+        self.trace.flush()
+        frames = list(read_trace(self.sink.getvalue()))
+        self.assertEqual(3, self.trace.frames)
+        self.assertEqual([0, 1, 0], [frame.device for frame in frames])
+        self.assertEqual([0, 250, 300], [frame.time_us for frame in frames])
+        self.assertEqual(b"\x02\x0a", frames[0].tx)
+        self.assertEqual(b"\x0f\xff", frames[2].tx)
+        self.assertEqual(10, frames[2].rx[1])
+        self.assertEqual(4, len(frames[1].tx))
+
+    def test_streams_chunks_to_sink(self):
+        from mcp4xxx_trace import read_trace, TRACE_MAGIC
+        for value in range(20):
+            self.pot.set(value)
+        # Each record takes 12 bytes, so 5 fit in a chunk, and the first three chunks have been written.
+        self.assertEqual(5 + 3 * 60, len(self.sink.getvalue()))
+        self.trace.flush()
+        self.assertTrue(self.sink.getvalue().startswith(TRACE_MAGIC))
+        self.assertEqual(len(self.sink.getvalue()), self.trace.bytes_written)
+        self.assertEqual(list(range(20)), [frame.tx[1] for frame in read_trace(self.sink.getvalue())])
+        self.assertEqual(0, self.trace.dropped)
+
+    def test_ring_keeps_latest_frames(self):
+        from mcp4xxx_trace import read_trace
+        self.trace.sink = None
+        for value in range(20):
+            self.clock.now += 10
+            self.pot.set(value)
+        saved = io.BytesIO()
+        self.trace.save(saved)
+        frames = list(read_trace(saved.getvalue()))
+        # The chunk being filled and the one before it are kept.
+        self.assertEqual(list(range(10, 20)), [frame.tx[1] for frame in frames])
+        self.assertEqual(10, self.trace.dropped)
+        self.assertEqual(list(range(0, 100, 10)), [frame.time_us for frame in frames])
+
+    def test_records_failed_frames(self):
+        from mcp4xxx_trace import read_trace
+        self.trace.spi = FailingSPI()
+        with self.assertRaises(OSError):
+            self.pot.set(10)
+        self.trace.flush()
+        self.assertTrue(next(read_trace(self.sink.getvalue())).failed)
+
+    def test_decodes_commands(self):
+        from mcp4xxx import ADDRESS_POT0_WIPER, ADDRESS_STATUS, COMMAND_INCREMENT, COMMAND_READ, COMMAND_WRITE
+        from mcp4xxx import ErrorPolicy
+        from mcp4xxx_trace import decode_frame, read_trace, TraceCommand
+        self.pot.error_policy = ErrorPolicy.COUNT
+        self.pot.set(256)
+        with self.pot.batch() as batch:
+            batch.increment()
+            batch.get()
+            batch._queue(ADDRESS_STATUS, COMMAND_WRITE, 0)
+        self.trace.flush()
+        frames = list(read_trace(self.sink.getvalue()))
+        self.assertEqual([TraceCommand(ADDRESS_POT0_WIPER, COMMAND_WRITE, 256, True)],
+                         decode_frame(frames[0].tx, frames[0].rx))
+        self.assertEqual([TraceCommand(ADDRESS_POT0_WIPER, COMMAND_INCREMENT, None, True),
+                          TraceCommand(ADDRESS_POT0_WIPER, COMMAND_READ, 256, True),
+                          TraceCommand(ADDRESS_STATUS, COMMAND_WRITE, 0, False)],
+                         decode_frame(frames[1].tx, frames[1].rx))
+
+    def test_rejects_other_data(self):
+        from mcp4xxx_trace import read_trace
+        with self.assertRaises(ValueError):
+            list(read_trace(b"not a trace"))
+
+    def test_replay(self):
+        from mcp4xxx import MCP4XXX
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        from mcp4xxx_trace import TraceReplayer
+        self.pot.set(10)
+        self.pot.decrement()
+        self.device.set_both(1, 2)
+        self.pot.get()
+        self.trace.flush()
+        spi = SimulatedSPI()
+        sim = SimulatedDevice()
+        replayer = TraceReplayer(self.sink.getvalue())
+        self.assertEqual(3, replayer.run({0: MCP4XXX(spi=spi, select_pin=spi.attach(sim))}))
+        self.assertEqual((3, 1, 0, 0), (replayer.frames, replayer.skipped, replayer.mismatches, replayer.rejected))
+        self.assertEqual([9], sim.wipers)
+        # A single pot device rejects the frame written to the dual pot device.
+        replayer.reset_stats()
+        self.assertEqual(1, replayer.run([None, MCP4XXX(spi=spi, select_pin=spi.attach(SimulatedDevice()))]))
+        self.assertEqual((3, 1, 1), (replayer.skipped, replayer.mismatches, replayer.rejected))
+
+    def test_recording_does_not_allocate(self):
+        from mcp4xxx import MCP4XXX
+        from mcp4xxx_trace import TraceRecorder
+        # The simulator allocates its float bus time, so trace the stand-in SPI.
+        trace = TraceRecorder(test_mcp4xxx.FrameSPI(), chunk_size=64, clock=self.clock)
+        pot = MCP4XXX(spi=trace, select_pin=trace.pin(lambda value: None))
+        # Few calls, as CPython allocates the counters once they pass 256.
+        self.assertEqual(0, test_mcp4xxx.allocations(lambda: pot.set(10), count=20))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import os
+import tempfile
+import unittest
+
+import test_mcp4xxx  # noqa: F401 installs the machine module stand-in
+
+
+class TuneTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX, MCP42XX
+        from mcp4xxx_sim import SimulatedDevice, SimulatedSPI
+        self.spi = SimulatedSPI(max_baudrate=3_000_000)
+        self.single = SimulatedDevice()
+        self.dual = SimulatedDevice(pots=2)
+        self.pot = MCP4XXX(spi=self.spi, select_pin=self.spi.attach(self.single))
+        self.device = MCP42XX(spi=self.spi, select_pin=self.spi.attach(self.dual))
+
+    def test_tunes_to_fastest_reliable_rate_less_margin(self):
+        from mcp4xxx_tune import tune_baudrate, TuneResult
+        self.assertEqual(TuneResult(1_500_000, 2_000_000, 4_000_000), tune_baudrate([self.pot, self.device]))
+        self.assertEqual(1_500_000, self.spi.baudrate)
+        self.assertEqual(0, self.pot.command_errors)
+
+    def test_restores_device_state(self):
+        from mcp4xxx import ErrorPolicy
+        from mcp4xxx_tune import tune_baudrate
+        self.pot.set(10)
+        self.device.set_both(20, 30)
+        self.device.pot1.set_wiper_status(False)
+        tcon = self.dual.tcon
+        tune_baudrate([self.pot, self.device])
+        self.assertEqual([10], self.single.wipers)
+        self.assertEqual([20, 30], self.dual.wipers)
+        self.assertEqual(tcon, self.dual.tcon)
+        self.assertEqual((20, 30), self.device.get_both())
+        self.assertEqual(ErrorPolicy.RAISE, self.device.pot1.error_policy)
+
+    def test_fastest_rate_kept_if_every_rate_passes(self):
+        from mcp4xxx_tune import tune_baudrate
+        self.spi.max_baudrate = None
+        result = tune_baudrate(self.pot, baudrates=(1_000_000, 10_000_000))
+        self.assertEqual((10_000_000, None), (result.baudrate, result.failed))
+
+    def test_raises_if_no_rate_passes(self):
+        from mcp4xxx_tune import tune_baudrate
+        with self.assertRaises(OSError):
+            tune_baudrate(self.pot, baudrates=(4_000_000, 8_000_000))
+        self.assertEqual(4_000_000, self.spi.baudrate)
+
+    def test_restores_device_state_if_no_rate_passes(self):
+        from mcp4xxx_tune import tune_baudrate
+        # The state is read at a reliable rate, below those tried.
+        self.spi.max_baudrate = 200_000
+        self.spi.init(baudrate=200_000)
+        self.pot.set(42)
+        self.device.set_both(20, 30)
+        tcons = (self.single.tcon, self.dual.tcon)
+        with self.assertRaises(OSError):
+            tune_baudrate([self.pot, self.device])
+        self.assertEqual([42], self.single.wipers)
+        self.assertEqual([20, 30], self.dual.wipers)
+        self.assertEqual(tcons, (self.single.tcon, self.dual.tcon))
+
+    def test_saves_rate(self):
+        from mcp4xxx_tune import load_baudrate, tune_baudrate
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spi_baudrate.txt")
+            self.assertEqual(250_000, load_baudrate(path))
+            tune_baudrate(self.pot, path=path)
+            self.assertEqual(1_500_000, load_baudrate(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# SPDX-FileCopyrightText: 2023 Charles Crighton <code@crighton.nz>
+#
+# SPDX-License-Identifier: MIT
+import unittest
+from array import array
+
+import test_mcp4xxx
+from test_mcp4xxx import FrameSPI
+
+
+class RecordingSPI(FrameSPI):
+    """ FrameSPI that records the wiper 0 position after each frame """
+
+    def __init__(self):
+        super().__init__()
+        self.positions = []
+
+    def write_readinto(self, write_buf, read_buf):
+        super().write_readinto(write_buf, read_buf)
+        self.positions.append(test_mcp4xxx.wiper0)
+
+
+class FakeClock:
+    """ Microsecond clock that returns the given readings in turn """
+
+    def __init__(self, readings):
+        self.readings = iter(readings)
+
+    def __call__(self):
+        return next(self.readings)
+
+
+class WaveformPlayerTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        from mcp4xxx import MCP4XXX
+        self.spi = RecordingSPI()
+        self.pot = MCP4XXX(spi=self.spi, wiper_cache=True)
+
+    def test_fast_playback_sends_a_frame_per_chunk(self):
+        from mcp4xxx_wave import WaveformPlayer
+        player = WaveformPlayer(self.pot, chunk=4)
+        stats = player.play(array('H', [0, 10, 20, 300, 40, 50]))
+        self.assertEqual(6, stats.samples)
+        self.assertEqual(2, stats.frames)
+        self.assertEqual([256, 50], self.spi.positions)
+        self.assertEqual(50, self.pot.get())
+
+    def test_generator_is_streamed(self):
+        from mcp4xxx_wave import WaveformPlayer
+        player = WaveformPlayer(self.pot, chunk=8)
+        stats = player.play(i for i in range(100))
+        self.assertEqual(100, stats.samples)
+        self.assertEqual(13, stats.frames)
+        self.assertEqual(99, self.pot.get())
+
+    def test_timed_playback_sends_a_frame_per_sample(self):
+        from mcp4xxx_wave import WaveformPlayer
+        ticks = []
+        player = WaveformPlayer(self.pot, rate=1000, chunk=4, tick=lambda: ticks.append(1))
+        stats = player.play([1, 2, 3], loops=2)
+        self.assertEqual(6, len(ticks))
+        self.assertEqual([1, 2, 3, 1, 2, 3], self.spi.positions)
+        self.assertEqual(6, stats.frames)
+        self.assertEqual(3, self.pot.get())
+
+    def test_underruns_are_reported(self):
+        from mcp4xxx_wave import WaveformPlayer
+        # The third sample is 1500us late, so the schedule restarts from 3600us.
+        player = WaveformPlayer(self.pot, rate=1000, clock=FakeClock([0, 0, 1000, 3500, 3600, 4600, 4700]))
+        stats = player.play([1, 2, 3, 4])
+        self.assertEqual(4, stats.samples)
+        self.assertEqual(1, stats.underruns)
+        self.assertEqual(4700, stats.elapsed_us)
+
+    def test_achieved_rate(self):
+        from mcp4xxx_wave import WaveformPlayer
+        player = WaveformPlayer(self.pot, rate=100, clock=FakeClock([0, 100_000]), tick=lambda: None)
+        stats = player.play(range(10))
+        self.assertEqual(100_000, stats.elapsed_us)
+        self.assertEqual(100.0, stats.rate())
+
+    def test_loop_until_stopped(self):
+        from mcp4xxx_wave import WaveformPlayer
+        player = WaveformPlayer(self.pot, rate=1000, tick=lambda: len(self.spi.positions) == 10 and player.stop())
+        stats = player.play([5, 6], loops=0)
+        self.assertEqual(10, stats.samples)
+
+    def test_looping_an_iterator_is_rejected(self):
+        from mcp4xxx_wave import WaveformPlayer
+        with self.assertRaises(ValueError):
+            WaveformPlayer(self.pot).play(iter([1, 2]), loops=2)
+
+    def test_empty_sequence(self):
+        from mcp4xxx_wave import WaveformPlayer
+        for player in (WaveformPlayer(self.pot), WaveformPlayer(self.pot, rate=1000)):
+            for loops in (0, 1):
+                with self.assertRaises(ValueError):
+                    player.play([], loops=loops)
+        stats = WaveformPlayer(self.pot).play(iter([]))
+        self.assertEqual((0, 0), (stats.samples, stats.frames))
+        self.assertEqual(0, self.spi.frames)
+
+
+if __name__ == '__main__':
+    unittest.main()